@@ -0,0 +1,219 @@
+"""Локальные fake-серверы ЮKassa и PayPal для бенчмарков платежей.
+
+Один Flask-сервер отвечает за обоих провайдеров:
+
+    YOOKASSA_API_URL=http://127.0.0.1:8082/yookassa/v3
+    PAYPAL_API_URL=http://127.0.0.1:8082/paypal
+
+ЮKassa: POST /payments, GET /payments/<id>.
+PayPal: POST /v1/oauth2/token, POST /v2/checkout/orders, GET /v2/checkout/orders/<id>.
+
+Через pay_delay секунд после создания платеж считается оплаченным, и
+сервер отправляет боту вебхук (для ЮKassa - с подписью Content-Signature).
+Задержка ответов API и доли ошибок (500 от API, потерянные вебхуки)
+настраиваются, чтобы проверить и повторные проверки бота, и фоновую сверку.
+"""
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+
+class FakePayments:
+    """Состояние fake-провайдеров: платежи, оплата и доставка вебхуков"""
+
+    def __init__(self, webhook_base_url, yookassa_secret='fake-secret', latency=0.0,
+                 failure_rate=0.0, webhook_failure_rate=0.0, pay_delay=1.0, on_paid=None):
+        self.webhook_base_url = webhook_base_url.rstrip('/')
+        self.yookassa_secret = yookassa_secret
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.webhook_failure_rate = webhook_failure_rate
+        self.pay_delay = pay_delay
+        self.on_paid = on_paid  # on_paid(provider, payment_id, user_id, webhook) - перед отправкой вебхука
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.payments = {}  # payment_id -> {'provider', 'user_id', 'status'}
+        self.webhooks_sent = 0
+        self.webhooks_dropped = 0
+        self.api_errors = 0
+
+    def simulate_api(self):
+        """Задержка и случайная ошибка API. Возвращает True, если нужно ответить 500"""
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            with self._lock:
+                self.api_errors += 1
+            return True
+        return False
+
+    def create(self, provider, user_id):
+        payment_id = f"fake-{provider}-{next(self._ids)}"
+        with self._lock:
+            self.payments[payment_id] = {'provider': provider, 'user_id': user_id, 'status': 'pending'}
+        timer = threading.Timer(self.pay_delay, self._pay, (payment_id,))
+        timer.daemon = True
+        timer.start()
+        return payment_id
+
+    def status(self, payment_id):
+        payment = self.payments.get(payment_id)
+        return payment['status'] if payment else None
+
+    def _pay(self, payment_id):
+        """Пользователь оплатил: меняем статус и отправляем вебхук"""
+        deliver = not (self.webhook_failure_rate and random.random() < self.webhook_failure_rate)
+        with self._lock:
+            payment = self.payments[payment_id]
+            payment['status'] = 'paid'
+            if not deliver:
+                self.webhooks_dropped += 1
+        if self.on_paid is not None:
+            self.on_paid(payment['provider'], payment_id, payment['user_id'], deliver)
+
+        if not deliver:
+            # Бот узнает об оплате только при фоновой сверке
+            return
+
+        if payment['provider'] == 'yookassa':
+            self._send_yookassa_webhook(payment_id, payment['user_id'])
+        else:
+            self._send_paypal_webhook(payment_id, payment['user_id'])
+
+    def _send_yookassa_webhook(self, payment_id, user_id):
+        body = json.dumps({
+            'type': 'notification',
+            'event': 'payment.succeeded',
+            'object': {'id': payment_id, 'status': 'succeeded', 'metadata': {'user_id': user_id}},
+        }).encode()
+        signature = base64.b64encode(
+            hmac.new(self.yookassa_secret.encode(), body, hashlib.sha256).digest()
+        ).decode()
+        self._post_webhook('/webhook/yookassa', body, {'Content-Signature': signature})
+
+    def _send_paypal_webhook(self, payment_id, user_id):
+        body = json.dumps({
+            'event_type': 'PAYMENT.CAPTURE.COMPLETED',
+            'resource': {'id': payment_id, 'custom_id': str(user_id), 'status': 'COMPLETED'},
+        }).encode()
+        headers = {
+            'PAYPAL-TRANSMISSION-ID': str(next(self._ids)),
+            'PAYPAL-TRANSMISSION-TIME': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'PAYPAL-TRANSMISSION-SIG': 'fake',
+            'PAYPAL-AUTH-ALGO': 'SHA256withRSA',
+        }
+        self._post_webhook('/webhook/paypal', body, headers)
+
+    def _post_webhook(self, path, body, headers):
+        headers = dict(headers, **{'Content-Type': 'application/json'})
+        try:
+            response = requests.post(f"{self.webhook_base_url}{path}", data=body, headers=headers, timeout=30)
+            if response.status_code != 200:
+                logger.warning(f"⚠️ Webhook {path} returned {response.status_code}")
+        except Exception as e:
+            logger.warning(f"⚠️ Webhook {path} failed: {e}")
+        with self._lock:
+            self.webhooks_sent += 1
+
+
+def create_app(fake):
+    app = Flask(__name__)
+
+    def server_error():
+        return jsonify({'type': 'error', 'code': 'internal_server_error'}), 500
+
+    # --- ЮKassa ---
+
+    @app.route('/yookassa/v3/payments', methods=['POST'])
+    def yookassa_create():
+        if fake.simulate_api():
+            return server_error()
+        data = request.get_json(silent=True) or {}
+        user_id = data.get('metadata', {}).get('user_id')
+        payment_id = fake.create('yookassa', user_id)
+        return jsonify({
+            'id': payment_id,
+            'status': 'pending',
+            'amount': data.get('amount'),
+            'confirmation': {'type': 'redirect', 'confirmation_url': f'https://yookassa.fake/pay/{payment_id}'},
+            'metadata': data.get('metadata', {}),
+        })
+
+    @app.route('/yookassa/v3/payments/<payment_id>', methods=['GET'])
+    def yookassa_get(payment_id):
+        if fake.simulate_api():
+            return server_error()
+        status = fake.status(payment_id)
+        if status is None:
+            return jsonify({'type': 'error', 'code': 'not_found'}), 404
+        return jsonify({'id': payment_id, 'status': 'succeeded' if status == 'paid' else 'pending'})
+
+    # --- PayPal ---
+
+    @app.route('/paypal/v1/oauth2/token', methods=['POST'])
+    def paypal_token():
+        if fake.simulate_api():
+            return server_error()
+        return jsonify({'access_token': 'fake-token', 'token_type': 'Bearer', 'expires_in': 32400})
+
+    @app.route('/paypal/v2/checkout/orders', methods=['POST'])
+    def paypal_create():
+        if fake.simulate_api():
+            return server_error()
+        data = request.get_json(silent=True) or {}
+        unit = (data.get('purchase_units') or [{}])[0]
+        order_id = fake.create('paypal', unit.get('custom_id'))
+        return jsonify({
+            'id': order_id,
+            'status': 'CREATED',
+            'links': [{'rel': 'approve', 'href': f'https://paypal.fake/checkoutnow?token={order_id}'}],
+        }), 201
+
+    @app.route('/paypal/v2/checkout/orders/<order_id>', methods=['GET'])
+    def paypal_get(order_id):
+        if fake.simulate_api():
+            return server_error()
+        status = fake.status(order_id)
+        if status is None:
+            return jsonify({'name': 'RESOURCE_NOT_FOUND'}), 404
+        return jsonify({'id': order_id, 'status': 'COMPLETED' if status == 'paid' else 'CREATED'})
+
+    return app
+
+
+class FakePaymentsServer:
+    """Запускает fake-провайдеров в отдельном потоке"""
+
+    def __init__(self, fake, host='127.0.0.1', port=8082):
+        self.fake = fake
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server(host, port, create_app(fake), threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def yookassa_api_url(self):
+        return f"http://{self.server.host}:{self.server.port}/yookassa/v3"
+
+    @property
+    def paypal_api_url(self):
+        return f"http://{self.server.host}:{self.server.port}/paypal"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
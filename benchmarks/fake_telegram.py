@@ -0,0 +1,297 @@
+"""Локальный fake-сервер Telegram Bot API для нагрузочных тестов.
+
+Понимает getMe, getUpdates (long polling), sendMessage, sendPhoto,
+answerCallbackQuery, editMessageText, deleteMessage и deleteWebhook;
+на остальные методы отвечает {"ok": true, "result": true}.
+
+Лимиты Telegram эмулируются корзинами токенов (глобальной и на каждый чат):
+при превышении сервер отвечает 429 с parameters.retry_after, как настоящий API.
+
+Для каждого апдейта, отданного боту через getUpdates, сервер замеряет
+время до первого сообщения бота в этот чат - это задержка, которую видит
+пользователь.
+"""
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def take(self):
+        """Возвращает 0, если токен взят, иначе сколько секунд ждать"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeTelegram:
+    """Состояние fake Bot API: очередь апдейтов, лимиты и замеры"""
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3):
+        self.global_bucket = TokenBucket(global_rate, global_rate) if global_rate else None
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chat_buckets = {}
+
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._updates = deque()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+        self._awaiting = {}    # chat_id -> (update_id, label, started_at, on_response)
+        self.delivered = {}    # update_id -> время, когда бот забрал апдейт
+        self.latencies = {}    # label -> [секунды от getUpdates до первого ответа]
+        self.calls = {}        # метод -> количество вызовов
+        self.first_sent = {}   # chat_id -> time.time() первого сообщения бота в чат
+        self.rate_limited = 0
+        self.polling_started = threading.Event()
+
+    # --- Апдейты от "пользователей" ---
+
+    def push_update(self, chat_id, label, payload, on_response=None):
+        """Кладет апдейт в очередь getUpdates.
+
+        payload - тело апдейта без update_id ({"message": ...} или
+        {"callback_query": ...}). on_response(latency) вызывается из потока
+        сервера при первом ответе бота в этот чат.
+        """
+        with self._lock:
+            update_id = next(self._update_ids)
+            self._updates.append(dict(payload, update_id=update_id))
+            self._awaiting[chat_id] = (update_id, label, time.monotonic(), on_response)
+            self._updates_ready.notify_all()
+        return update_id
+
+    def expect_message(self, chat_id, label, on_response=None):
+        """Замеряет время от текущего момента до следующего сообщения бота в чат
+        (для событий вне Telegram, например вебхука об оплате)"""
+        with self._lock:
+            self._awaiting[chat_id] = (None, label, time.monotonic(), on_response)
+
+    def message_update(self, chat_id, text):
+        """Апдейт с текстовым сообщением (команды распознаются по entities)"""
+        message = self._message(chat_id, text, from_user=True)
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return {'message': message}
+
+    def callback_update(self, chat_id, data):
+        """Апдейт с нажатием inline-кнопки"""
+        return {
+            'callback_query': {
+                'id': str(next(self._message_ids)),
+                'from': self._user(chat_id),
+                'chat_instance': str(chat_id),
+                'data': data,
+                'message': self._message(chat_id, 'button', from_user=False),
+            }
+        }
+
+    # --- Обработка вызовов Bot API ---
+
+    def handle(self, method, params):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        if method == 'deleteWebhook':
+            if _flag(params.get('drop_pending_updates')):
+                with self._lock:
+                    self._updates.clear()
+            return True
+
+        chat_id = _int(params.get('chat_id'))
+        if method in ('sendMessage', 'sendPhoto', 'editMessageText', 'sendDocument'):
+            retry_after = self._take_token(chat_id)
+            if retry_after:
+                return RateLimited(retry_after)
+
+        # answerCallbackQuery только убирает "часики" на кнопке - ответом
+        # пользователю считаем первое отправленное или измененное сообщение
+        if chat_id is not None and method != 'answerCallbackQuery':
+            self.first_sent.setdefault(chat_id, time.time())
+            self._record_response(chat_id)
+
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(chat_id, params.get('text', ''), from_user=False)
+        if method == 'sendPhoto':
+            message = self._message(chat_id, None, from_user=False)
+            message['photo'] = [{'file_id': 'photo', 'file_unique_id': 'photo', 'width': 1, 'height': 1}]
+            return message
+        return True
+
+    def _get_updates(self, params):
+        self.polling_started.set()
+        offset = _int(params.get('offset')) or 0
+        limit = _int(params.get('limit')) or 100
+        timeout = float(params.get('timeout') or 0)
+
+        with self._updates_ready:
+            while self._updates and self._updates[0]['update_id'] < offset:
+                self._updates.popleft()
+            if not self._updates and timeout:
+                self._updates_ready.wait(timeout)
+                while self._updates and self._updates[0]['update_id'] < offset:
+                    self._updates.popleft()
+            batch = list(itertools.islice(self._updates, limit))
+            now = time.monotonic()
+            for update in batch:
+                self.delivered.setdefault(update['update_id'], now)
+            return batch
+
+    def _take_token(self, chat_id):
+        with self._lock:
+            if self.global_bucket is not None:
+                wait = self.global_bucket.take()
+                if wait:
+                    self.rate_limited += 1
+                    return wait
+            if chat_id is not None and self.chat_rate:
+                bucket = self._chat_buckets.get(chat_id)
+                if bucket is None:
+                    bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+                wait = bucket.take()
+                if wait:
+                    self.rate_limited += 1
+                    return wait
+        return 0
+
+    def _record_response(self, chat_id):
+        with self._lock:
+            waiting = self._awaiting.get(chat_id)
+            if waiting is None:
+                return
+            update_id, label, started_at, on_response = waiting
+            if update_id is not None:
+                started_at = self.delivered.get(update_id)
+                if started_at is None:
+                    # Ответ на предыдущий апдейт пришел раньше, чем бот забрал новый
+                    return
+            del self._awaiting[chat_id]
+            latency = time.monotonic() - started_at
+            self.latencies.setdefault(label, []).append(latency)
+        if on_response is not None:
+            on_response(latency)
+
+    # --- Вспомогательное ---
+
+    @staticmethod
+    def _user(chat_id):
+        return {'id': chat_id, 'is_bot': False, 'first_name': f'User{chat_id}', 'username': f'user{chat_id}'}
+
+    def _message(self, chat_id, text, from_user):
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+        }
+        if from_user:
+            message['from'] = self._user(chat_id)
+        if text is not None:
+            message['text'] = text
+        return message
+
+
+class RateLimited:
+    """Ответ 429 с retry_after"""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def create_app(fake):
+    """Flask-приложение fake Bot API: /bot<token>/<method>"""
+    app = Flask(__name__)
+
+    @app.route('/bot<token>/<method>', methods=['GET', 'POST'])
+    def api(token, method):
+        params = dict(request.values)
+        if request.is_json:
+            params.update(request.get_json(silent=True) or {})
+
+        result = fake.handle(method, params)
+        if isinstance(result, RateLimited):
+            return jsonify({
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {result.retry_after}',
+                'parameters': {'retry_after': result.retry_after},
+            }), 429
+        return jsonify({'ok': True, 'result': result})
+
+    return app
+
+
+class FakeTelegramServer:
+    """Запускает fake Bot API в отдельном потоке"""
+
+    def __init__(self, fake, host='127.0.0.1', port=8081):
+        self.fake = fake
+        # Лог werkzeug на каждый запрос искажает замеры
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server(host, port, create_app(fake), threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        """Значение для TELEGRAM_API_URL"""
+        return f"http://{self.server.host}:{self.server.port}/bot"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _flag(value):
+    return value in (True, 'true', 'True', '1')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--global-rate', type=float, default=30.0)
+    parser.add_argument('--chat-rate', type=float, default=1.0)
+    parser.add_argument('--chat-burst', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeTelegramServer(FakeTelegram(args.global_rate, args.chat_rate, args.chat_burst), port=args.port)
+    print(f"TELEGRAM_API_URL={server.base_url}")
+    server.server.serve_forever()
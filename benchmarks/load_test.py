@@ -0,0 +1,177 @@
+"""Нагрузочный тест бота против локального fake Bot API.
+
+Запускает fake-сервер Telegram, поднимает bot.py отдельным процессом
+(TELEGRAM_API_URL указывает на fake-сервер) и гоняет N виртуальных
+пользователей: /start, затем нажатия кнопок с паузой "на подумать".
+В конце печатает пропускную способность и p50/p95/p99 задержки ответа
+по каждому типу апдейта.
+
+Сеть не нужна, но нужна локальная PostgreSQL:
+
+    createdb dream_bench
+    DATABASE_URL=postgresql://localhost/dream_bench \\
+        python -m benchmarks.load_test --users 200 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.fake_telegram import FakeTelegram, FakeTelegramServer
+from benchmarks.stats import summarize, print_table
+
+FAKE_TOKEN = '123456:FAKE-TOKEN'
+FIRST_USER_ID = 10_000_000
+DEFAULT_BUTTONS = 'marathon_info,back_to_payment_method'
+
+
+def start_bot(api_url, args, extra_env=None):
+    """Запускает bot.py с окружением для теста"""
+    env = dict(os.environ)
+    env.update({
+        'BOT_TOKEN': FAKE_TOKEN,
+        'TELEGRAM_API_URL': api_url,
+        'PORT': str(args.bot_port),
+        'RENDER_EXTERNAL_URL': f'http://127.0.0.1:{args.bot_port}',
+        'ADMIN_IDS': '',
+        'LOG_LEVEL': args.bot_log_level,
+    })
+    env.update(extra_env or {})
+    env.setdefault('DB_SSLMODE', 'disable')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    log = open(args.bot_log, 'w')
+    return subprocess.Popen([sys.executable, 'bot.py'], cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_bot(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class VirtualUsers:
+    """Синтетические пользователи: каждый ждет ответа бота перед следующим действием"""
+
+    def __init__(self, fake, args):
+        self.fake = fake
+        self.args = args
+        self.buttons = [button for button in args.buttons.split(',') if button]
+        self.sent = {}      # label -> отправлено апдейтов
+        self.timeouts = {}  # label -> апдейтов без ответа
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.args.ramp + self.args.duration
+        await asyncio.gather(*(
+            self._user(FIRST_USER_ID + index, index * self.args.ramp / self.args.users, deadline)
+            for index in range(self.args.users)
+        ))
+
+    async def _user(self, chat_id, start_delay, deadline):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(start_delay)
+        await self._act(chat_id, 'start', self.fake.message_update(chat_id, '/start'))
+
+        while loop.time() < deadline:
+            await asyncio.sleep(self.args.think * random.uniform(0.5, 1.5))
+            if not self.buttons:
+                break
+            button = random.choice(self.buttons)
+            await self._act(chat_id, f'button:{button}', self.fake.callback_update(chat_id, button))
+
+    async def _act(self, chat_id, label, payload):
+        loop = asyncio.get_running_loop()
+        response = loop.create_future()
+
+        def on_response(latency):
+            loop.call_soon_threadsafe(_resolve, response, latency)
+
+        self.sent[label] = self.sent.get(label, 0) + 1
+        self.fake.push_update(chat_id, label, payload, on_response)
+        try:
+            await asyncio.wait_for(response, self.args.response_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts[label] = self.timeouts.get(label, 0) + 1
+
+
+def _resolve(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def report(fake, users, elapsed):
+    rows = []
+    total = 0
+    for label in sorted(users.sent):
+        latencies = fake.latencies.get(label, [])
+        total += len(latencies)
+        rows.append(dict(
+            summarize(latencies),
+            handler=label,
+            sent=users.sent[label],
+            timeouts=users.timeouts.get(label, 0),
+        ))
+
+    print_table(
+        f"Responses: {total} in {elapsed:.1f}s ({total / elapsed:.1f} updates/s)",
+        rows,
+        ['handler', 'sent', 'count', 'timeouts', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'],
+    )
+    print(f"\n429 responses: {fake.rate_limited}")
+    print("Bot API calls: " + ", ".join(f"{method}={count}" for method, count in sorted(fake.calls.items())))
+    return {'elapsed': elapsed, 'throughput': total / elapsed, 'handlers': rows,
+            'rate_limited': fake.rate_limited, 'calls': fake.calls}
+
+
+def add_common_arguments(parser):
+    """Параметры, общие для всех бенчмарков с fake Bot API"""
+    parser.add_argument('--users', type=int, default=100, help="number of virtual users")
+    parser.add_argument('--ramp', type=float, default=10, help="seconds to start all users")
+    parser.add_argument('--response-timeout', type=float, default=30)
+    parser.add_argument('--global-rate', type=float, default=30.0, help="fake API messages/s (0 - no limit)")
+    parser.add_argument('--chat-rate', type=float, default=1.0, help="fake API messages/s per chat (0 - no limit)")
+    parser.add_argument('--chat-burst', type=int, default=5)
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--bot-port', type=int, default=10050)
+    parser.add_argument('--bot-log', default='benchmark_bot.log')
+    parser.add_argument('--bot-log-level', default='WARNING')
+    parser.add_argument('--json', help="write results to this file")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test against a fake Telegram Bot API")
+    add_common_arguments(parser)
+    parser.add_argument('--duration', type=float, default=60, help="seconds of traffic after ramp-up")
+    parser.add_argument('--think', type=float, default=2.0, help="mean pause between user actions")
+    parser.add_argument('--buttons', default=DEFAULT_BUTTONS, help="comma-separated callback_data to press")
+    args = parser.parse_args()
+
+    fake = FakeTelegram(args.global_rate, args.chat_rate, args.chat_burst)
+    server = FakeTelegramServer(fake, port=args.api_port).start()
+    bot = start_bot(server.base_url, args)
+    try:
+        print(f"⏳ Waiting for the bot to start polling ({server.base_url})...")
+        if not fake.polling_started.wait(120):
+            raise SystemExit(f"Bot did not start polling, see {args.bot_log}")
+
+        users = VirtualUsers(fake, args)
+        started = time.monotonic()
+        asyncio.run(users.run())
+        results = report(fake, users, time.monotonic() - started)
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        stop_bot(bot)
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Бенчмарк платежного пути: создание платежа -> вебхук -> активация курса.
+
+Поднимает fake Bot API и fake ЮKassa/PayPal, запускает bot.py с
+YOOKASSA_API_URL/PAYPAL_API_URL на fake-провайдеров. Каждый виртуальный
+пользователь делает /start, выбирает способ оплаты и "платит"; затем
+провайдер шлет вебхук, и замеряется время до первого сообщения бота об
+активации. Если вебхук потерян (--webhook-failure-rate), активацию
+выполняет фоновая сверка - такие замеры показаны отдельно.
+
+    DATABASE_URL=postgresql://localhost/dream_bench \\
+        python -m benchmarks.payment_benchmark --users 200 --webhook-failure-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.fake_payments import FakePayments, FakePaymentsServer
+from benchmarks.fake_telegram import FakeTelegram, FakeTelegramServer
+from benchmarks.load_test import VirtualUsers, add_common_arguments, report, start_bot, stop_bot, _resolve
+
+FAKE_YOOKASSA_SECRET = 'fake-secret'
+
+
+class PayingUsers(VirtualUsers):
+    """Пользователи, которые сразу покупают курс"""
+
+    def __init__(self, fake, args):
+        super().__init__(fake, args)
+        self.providers = [provider for provider in args.providers.split(',') if provider]
+        self._activations = {}  # chat_id -> future активации
+        self.loop = None
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            self._user(int(self.args.first_user_id) + index, index * self.args.ramp / self.args.users, None)
+            for index in range(self.args.users)
+        ))
+
+    async def _user(self, chat_id, start_delay, deadline):
+        await asyncio.sleep(start_delay)
+        await self._act(chat_id, 'start', self.fake.message_update(chat_id, '/start'))
+
+        provider = random.choice(self.providers)
+        activation = self._activations[chat_id] = self.loop.create_future()
+        await self._act(chat_id, f'create:{provider}', self.fake.callback_update(chat_id, f'payment_{provider}'))
+
+        try:
+            await asyncio.wait_for(activation, self.args.pay_delay + self.args.activation_timeout)
+        except asyncio.TimeoutError:
+            label = f'activation:{provider}'
+            self.timeouts[label] = self.timeouts.get(label, 0) + 1
+            self.sent[label] = self.sent.get(label, 0) + 1
+
+    def on_paid(self, provider, payment_id, user_id, webhook):
+        """Вызывается из потока fake-провайдера в момент оплаты"""
+        chat_id = int(user_id)
+        activation = self._activations.get(chat_id)
+        if activation is None:
+            return
+        label = f"activation:{provider}:{'webhook' if webhook else 'reconciler'}"
+
+        def count():
+            self.sent[label] = self.sent.get(label, 0) + 1
+        self.loop.call_soon_threadsafe(count)
+
+        # Следующее сообщение бота в этот чат - подтверждение оплаты
+        self.fake.expect_message(
+            chat_id, label,
+            lambda latency: self.loop.call_soon_threadsafe(_resolve, activation, latency)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payment flow benchmark with fake YooKassa and PayPal")
+    add_common_arguments(parser)
+    parser.add_argument('--providers', default='yookassa,paypal', help="comma-separated providers to use")
+    parser.add_argument('--first-user-id', type=int, default=20_000_000)
+    parser.add_argument('--pay-delay', type=float, default=2.0, help="seconds from payment creation to payment")
+    parser.add_argument('--activation-timeout', type=float, default=120)
+    parser.add_argument('--provider-latency', type=float, default=0.05, help="fake provider API latency, seconds")
+    parser.add_argument('--provider-failure-rate', type=float, default=0.0, help="share of API calls answered with 500")
+    parser.add_argument('--webhook-failure-rate', type=float, default=0.0, help="share of webhooks never delivered")
+    parser.add_argument('--payments-port', type=int, default=8082)
+    parser.add_argument('--reconcile-interval', type=int, default=5)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(args.global_rate, args.chat_rate, args.chat_burst)
+    users = PayingUsers(fake, args)
+    payments = FakePayments(
+        f'http://127.0.0.1:{args.bot_port}',
+        yookassa_secret=FAKE_YOOKASSA_SECRET,
+        latency=args.provider_latency,
+        failure_rate=args.provider_failure_rate,
+        webhook_failure_rate=args.webhook_failure_rate,
+        pay_delay=args.pay_delay,
+        on_paid=users.on_paid,
+    )
+
+    telegram_server = FakeTelegramServer(fake, port=args.api_port).start()
+    payments_server = FakePaymentsServer(payments, port=args.payments_port).start()
+    bot = start_bot(telegram_server.base_url, args, {
+        'YOOKASSA_API_URL': payments_server.yookassa_api_url,
+        'PAYPAL_API_URL': payments_server.paypal_api_url,
+        'YOOKASSA_SHOP_ID': 'fake-shop',
+        'YOOKASSA_SECRET_KEY': FAKE_YOOKASSA_SECRET,
+        'PAYPAL_CLIENT_ID': 'fake-client',
+        'PAYPAL_CLIENT_SECRET': 'fake-secret',
+        'RECONCILE_INTERVAL': str(args.reconcile_interval),
+    })
+    try:
+        print(f"⏳ Waiting for the bot to start polling ({telegram_server.base_url})...")
+        if not fake.polling_started.wait(120):
+            raise SystemExit(f"Bot did not start polling, see {args.bot_log}")
+
+        started = time.monotonic()
+        asyncio.run(users.run())
+        results = report(fake, users, time.monotonic() - started)
+        print(f"Payments: {len(payments.payments)}, webhooks sent: {payments.webhooks_sent}, "
+              f"dropped: {payments.webhooks_dropped}, provider 500s: {payments.api_errors}")
+        results['payments'] = {
+            'created': len(payments.payments),
+            'webhooks_sent': payments.webhooks_sent,
+            'webhooks_dropped': payments.webhooks_dropped,
+            'api_errors': payments.api_errors,
+        }
+
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        stop_bot(bot)
+        telegram_server.stop()
+        payments_server.stop()
+
+
+if __name__ == '__main__':
+    main()
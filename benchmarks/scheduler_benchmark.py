@@ -0,0 +1,208 @@
+"""Бенчмарк планировщика курса на заполненной локальной БД.
+
+Заполняет users/course_progress синтетическими пользователями, часть из
+которых должна получить день курса сразу, часть - в течение --window
+секунд, а остальные еще не подошли по времени. Затем гоняет тики
+CourseScheduler против fake Bot API и печатает:
+
+- длительность тика и ticks/sec;
+- messages/sec до fake Bot API;
+- число SQL-запросов и соединений на одного пользователя;
+- отставание первого сообщения дня от момента, когда пользователь
+  должен был его получить (last_message_date + 23:55).
+
+    DATABASE_URL=postgresql://localhost/dream_bench \\
+        python -m benchmarks.scheduler_benchmark --users 10000 --due-now 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from benchmarks.fake_telegram import FakeTelegram, FakeTelegramServer
+from benchmarks.stats import summarize, print_table
+
+FAKE_TOKEN = '123456:FAKE-TOKEN'
+DUE_AFTER = 23 * 3600 + 55 * 60  # интервал из запроса планировщика
+
+
+def seed(db, args):
+    """Создает пользователей и их прогресс. Возвращает {user_id: когда день должен уйти (time.time())}"""
+    from psycopg2.extras import execute_values
+
+    first, last = args.first_user_id, args.first_user_id + args.users
+    now = time.time()
+    users, progress, intended = [], [], {}
+    for user_id in range(first, last):
+        roll = random.random()
+        if roll < args.due_now:
+            # Должен был получить день от 0 до --lateness секунд назад
+            due_in = -random.uniform(0, args.lateness)
+        elif roll < args.due_now + args.due_soon:
+            due_in = random.uniform(0, args.window)
+        else:
+            # Получит день позже, чем закончится бенчмарк
+            due_in = random.uniform(args.window + 3600, DUE_AFTER)
+        if due_in <= args.window:
+            intended[user_id] = now + due_in
+        users.append((user_id, f'bench{user_id}', 'Bench'))
+        progress.append((user_id, random.randint(1, 7), DUE_AFTER - due_in))
+
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM course_outbox WHERE user_id >= %s AND user_id < %s", (first, last))
+        cursor.execute("DELETE FROM course_progress WHERE user_id >= %s AND user_id < %s", (first, last))
+        cursor.execute("DELETE FROM users WHERE user_id >= %s AND user_id < %s", (first, last))
+        execute_values(
+            cursor, "INSERT INTO users (user_id, username, first_name) VALUES %s", users, page_size=1000
+        )
+        # Время задаем относительно NOW() сервера, чтобы не зависеть от часовых поясов
+        execute_values(
+            cursor,
+            "INSERT INTO course_progress (user_id, current_day, last_message_date, is_active) VALUES %s",
+            progress,
+            template="(%s, %s, NOW() - make_interval(secs => %s), TRUE)",
+            page_size=1000
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return intended
+
+
+def db_counters():
+    """Сколько SQL-запросов выполнено и соединений открыто с начала процесса"""
+    import metrics
+
+    statements = metrics.DB_STATEMENT_DURATION.count()
+    connections = metrics.DB_QUERY_DURATION.count(method='get_connection')
+    return statements, connections
+
+
+async def wait_drained(fake, expected, course_outbox, send_pipeline, timeout):
+    """Ждет, пока все ожидаемые пользователи получат день и очереди опустеют"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if (all(user_id in fake.first_sent for user_id in expected)
+                and course_outbox.depth == 0 and send_pipeline.depth == 0):
+            return True
+        await asyncio.sleep(0.2)
+    return False
+
+
+async def run(args, fake, api_url):
+    from telegram.ext import Application
+    import bot
+    from database import db
+    from delivery import course_outbox, send_pipeline
+    from metrics import InstrumentedRequest
+
+    db.init_database()
+    intended = seed(db, args)
+    print(f"🌱 Seeded {args.users} users, {len(intended)} due within the window")
+
+    application = (
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .base_url(api_url)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .build()
+    )
+    await application.initialize()
+    scheduler = bot.CourseScheduler(application, asyncio.get_running_loop())
+
+    statements_before, connections_before = db_counters()
+    calls_before = sum(fake.calls.get(method, 0) for method in ('sendMessage', 'sendPhoto'))
+    tick_durations = []
+    started = time.monotonic()
+    started_wall = time.time()
+    window_end = started + args.window
+
+    while True:
+        tick_started = time.monotonic()
+        await asyncio.to_thread(scheduler.check_and_send_messages)
+        tick_durations.append(time.monotonic() - tick_started)
+
+        if time.monotonic() >= window_end:
+            break
+        await asyncio.sleep(max(0, args.tick_interval - (time.monotonic() - tick_started)))
+
+    # Пользователи, чье время подошло до последнего тика
+    expected = [user_id for user_id, due_at in intended.items() if due_at <= time.time()]
+    drained = await wait_drained(fake, expected, course_outbox, send_pipeline, args.drain_timeout)
+    elapsed = time.monotonic() - started
+    await application.shutdown()
+
+    statements, connections = db_counters()
+    messages = sum(fake.calls.get(method, 0) for method in ('sendMessage', 'sendPhoto')) - calls_before
+    served = [user_id for user_id in intended if user_id in fake.first_sent]
+    # Для уже просроченных пользователей отсчитываем от начала бенчмарка
+    drift = [fake.first_sent[user_id] - max(intended[user_id], started_wall) for user_id in served]
+
+    tick_summary = summarize(tick_durations)
+    mean_tick = sum(tick_durations) / len(tick_durations)
+    results = {
+        'users': args.users,
+        'due': len(intended),
+        'served': len(served),
+        'drained': drained,
+        'ticks': len(tick_durations),
+        'ticks_per_sec': round(1 / mean_tick, 2) if mean_tick else None,
+        'tick': tick_summary,
+        'messages': messages,
+        'messages_per_sec': round(messages / elapsed, 1),
+        'statements_per_user': round((statements - statements_before) / max(1, len(served)), 1),
+        'connections_per_user': round((connections - connections_before) / max(1, len(served)), 1),
+        'drift': summarize(drift),
+        'rate_limited': fake.rate_limited,
+    }
+
+    print_table("Scheduler ticks", [dict(tick_summary, ticks=len(tick_durations))],
+                ['ticks', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+    print_table("Drift from intended send time", [results['drift']], ['count', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+    print(f"\nDue users served: {len(served)}/{len(intended)}{'' if drained else ' (drain timed out)'}")
+    print(f"Ticks/sec: {results['ticks_per_sec']}, messages/sec: {results['messages_per_sec']}, "
+          f"429 responses: {fake.rate_limited}")
+    print(f"DB per user: {results['statements_per_user']} statements, "
+          f"{results['connections_per_user']} connections")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Course scheduler benchmark on a seeded database")
+    parser.add_argument('--users', type=int, default=1000, help="active users to seed")
+    parser.add_argument('--due-now', type=float, default=0.1, help="share of users already due")
+    parser.add_argument('--due-soon', type=float, default=0.0, help="share of users due during the window")
+    parser.add_argument('--lateness', type=float, default=3600, help="how long ago already-due users became due")
+    parser.add_argument('--window', type=float, default=0, help="seconds to keep ticking")
+    parser.add_argument('--tick-interval', type=float, default=60)
+    parser.add_argument('--drain-timeout', type=float, default=600)
+    parser.add_argument('--first-user-id', type=int, default=30_000_000)
+    parser.add_argument('--global-rate', type=float, default=30.0, help="fake API messages/s (0 - no limit)")
+    parser.add_argument('--chat-rate', type=float, default=0, help="fake API messages/s per chat (0 - no limit)")
+    parser.add_argument('--chat-burst', type=int, default=5)
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    # bot.py и config.py читают окружение при импорте
+    os.environ.setdefault('BOT_TOKEN', FAKE_TOKEN)
+    os.environ.setdefault('DB_SSLMODE', 'disable')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    fake = FakeTelegram(args.global_rate, args.chat_rate, args.chat_burst)
+    server = FakeTelegramServer(fake, port=args.api_port).start()
+    try:
+        results = asyncio.run(run(args, fake, server.base_url))
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Общие функции отчетов для бенчмарков"""
+
+
+def percentile(values, fraction):
+    """Перцентиль по отсортированной копии (ближайший ранг)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    """count, p50, p95, p99 и max в миллисекундах"""
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        'count': len(values),
+        'p50_ms': ms(percentile(values, 0.50)),
+        'p95_ms': ms(percentile(values, 0.95)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(max(values) if values else None),
+    }
+
+
+def print_table(title, rows, columns):
+    """Печатает список словарей простой таблицей"""
+    print(f"\n{title}")
+    widths = {
+        column: max(len(column), *(len(str(row.get(column, ''))) for row in rows)) if rows else len(column)
+        for column in columns
+    }
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row.get(column, '')).ljust(widths[column]) for column in columns))
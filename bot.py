@@ -1,647 +1,844 @@
-import logging
-import os
-import time
-import json
-import requests
-import threading
-from flask import Flask, request, jsonify, redirect, Response, stream_with_context
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-import multiprocessing
-import sys
-from datetime import datetime, timedelta
-from telegram import Update
-import asyncio
-import signal
-import handlers
-from config import BOT_TOKEN, PAYPAL_WEBHOOK_ID
-from database import db
-
-class CourseScheduler:
-    """Планировщик для отправки ежедневных сообщений курса"""
-    
-    def __init__(self, application):
-        self.application = application
-        self.db = db
-        self.running = False
-        
-    def start(self):
-        """Запускает планировщик"""
-        self.running = True
-        thread = threading.Thread(target=self._run_scheduler, daemon=True)
-        thread.start()
-        logger.info("✅ Course scheduler started")
-    
-    def _run_scheduler(self):
-        """Запускает цикл планировщика"""
-        while self.running:
-            try:
-                self.check_and_send_messages()
-                time.sleep(60)  # Проверяем каждую минуту
-            except Exception as e:
-                logger.error(f"❌ Scheduler error: {e}")
-                time.sleep(300)  # При ошибке ждем 5 минут
-    
-    def check_and_send_messages(self):
-        """Проверяет и отправляет сообщения пользователям"""
-        try:
-            conn = self.db.get_connection()
-            if not conn:
-                return
-            
-            cursor = conn.cursor()
-            
-            # ИСПРАВЛЕННЫЙ ЗАПРОС: используем last_message_date вместо last_message_time
-            cursor.execute('''
-                SELECT user_id, current_day 
-                FROM course_progress 
-                WHERE is_active = TRUE 
-                AND current_day <= 7
-                AND (
-                    last_message_date IS NULL 
-                    OR last_message_date <= NOW() - INTERVAL '23 hours 55 minutes'
-                )
-            ''')
-            
-            users = cursor.fetchall()
-            conn.close()
-            
-            for user_id, current_day in users:
-                try:
-                    logger.info(f"📨 Sending day {current_day} to user {user_id}")
-                    
-                    # Отправляем сообщения дня
-                    if self.application.bot:
-                        asyncio.run_coroutine_threadsafe(
-                            self.send_course_day(user_id, current_day),
-                            self.application.bot._loop
-                        )
-                    
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    logger.error(f"❌ Error scheduling for user {user_id}: {e}")
-                    
-        except Exception as e:
-            logger.error(f"❌ Error in check_and_send_messages: {e}")
-    
-    async def send_course_day(self, user_id: int, day_number: int):
-        """Отправляет сообщения конкретного дня по правильной структуре"""
-        try:
-            # Получаем контент дня
-            content = self.db.get_course_content(day_number)
-            if not content:
-                logger.error(f"❌ No content for day {day_number}")
-                return
-            
-            messages = content['messages']
-            has_images = content['has_images']
-            image_urls = content.get('image_urls', [])
-            
-            image_index = 0  # Индекс для картинок
-            
-            # Отправляем каждое сообщение по порядку
-            for i, message in enumerate(messages):
-                if message.strip():  # Если сообщение не пустое
-                    try:
-                        # ИСПРАВЬТЕ ЭТУ ЧАСТЬ: добавьте конвертацию в HTML
-                        from database import DatabaseManager
-                        html_message = DatabaseManager.markdown_to_html(message)
-                        
-                        await self.application.bot.send_message(
-                            chat_id=user_id,
-                            text=html_message,
-                            parse_mode='HTML'  # Используем HTML вместо Markdown
-                        )
-                        await asyncio.sleep(1)  # Задержка 1 секунда между сообщениями
-                    except Exception as e:
-                        logger.error(f"Error sending message {i+1} to {user_id}: {e}")
-                        # Попробуем отправить без разметки
-                        try:
-                            await self.application.bot.send_message(
-                                chat_id=user_id,
-                                text=message,
-                                parse_mode=None
-                            )
-                        except:
-                            pass
-                
-                # Если это пустое сообщение и есть картинки, отправляем картинку
-                elif has_images and image_index < len(image_urls):
-                    try:
-                        await self.application.bot.send_photo(
-                            chat_id=user_id,
-                            photo=image_urls[image_index]
-                        )
-                        await asyncio.sleep(1)
-                        image_index += 1
-                    except Exception as e:
-                        logger.error(f"Error sending image {image_index} to {user_id}: {e}")
-            
-            # Обновляем прогресс пользователя
-            self.update_user_progress(user_id, day_number)
-            
-            logger.info(f"✅ Day {day_number} sent to user {user_id}")
-            
-            # Если это день 7, отправляем предложение марафона
-            if day_number == 7:
-                await self.send_marathon_offer(user_id)
-                
-        except Exception as e:
-            logger.error(f"❌ Error in send_course_day: {e}")
-
-    def update_user_progress(self, user_id: int, current_day: int):
-        """Обновляет прогресс пользователя - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
-        conn = self.db.get_connection()
-        if not conn:
-            return
-        
-        try:
-            cursor = conn.cursor()
-            
-            if current_day < 7:
-                # Переходим к следующему дню
-                next_day = current_day + 1
-                cursor.execute('''
-                    UPDATE course_progress 
-                    SET current_day = %s, 
-                        last_message_date = NOW(),  -- Используем last_message_date
-                        is_active = TRUE
-                    WHERE user_id = %s
-                ''', (next_day, user_id))
-            else:
-                # Завершаем курс
-                cursor.execute('''
-                    UPDATE course_progress 
-                    SET is_active = FALSE,
-                        completed_at = NOW(),
-                        last_message_date = NOW()  -- Используем last_message_date
-                    WHERE user_id = %s
-                ''', (user_id,))
-            
-            conn.commit()
-            logger.info(f"✅ Progress updated for user {user_id}: day {current_day}")
-            
-        except Exception as e:
-            logger.error(f"❌ Error updating progress: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
-    
-    async def send_marathon_offer(self, user_id: int):
-        """Отправляет предложение марафона после завершения курса"""
-        try:
-            from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-            
-            marathon_text = """
-🔥 **Поздравляю с завершением 7-дневного пути!**
-
-Вы прошли весь цикл: от мечты до плана. Вы уже знаете, как ставить цели и создавать **движение.** Готовы ли вы закрепить этот навык и **реализовать цели под руководством психотерапевта?**
-
-Приглашаю вас на большой **Марафон «От мечты к цели»,** где мы проведем 21 день в глубокой работе над вашими планами, устраняя блоки и страхи.
-
-✨ **Что вас ждет:**
-✔️**3 недели** структурированной работы в **групповом чате Telegram.**
-✔️**Взаимообмен и переопыление** с другими участниками для мощной поддержки.
-✔️Моя персональная поддержка.
-✔️Глубокая проработка **блоков и страхов.**
-✔️Закрепление навыка достижения цели до результата.
-
-🎁🎁 **Специальный Бонус для вас!**
-Вместо 7000₽, вы получаете Марафон всего за **4900₽!**
-
-🗓️ **Старт Марафона: 4 января 2026 года.**
-Узнать подробности и оплатить со скидкой👇
-"""
-            
-            keyboard = InlineKeyboardMarkup([
-                [InlineKeyboardButton("📖 Узнать подробности марафона", callback_data="marathon_info")],
-                [InlineKeyboardButton("💳 Оплатить марафон", callback_data="marathon_payment")]
-            ])
-            
-            await self.application.bot.send_message(
-                chat_id=user_id,
-                text=marathon_text,
-                reply_markup=keyboard,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"❌ Error sending marathon offer: {e}")
-
-
-class GracefulShutdown:
-    def __init__(self):
-        self.shutdown_event = threading.Event()
-        
-    def signal_handler(self, signum, frame):
-        """Обработчик сигналов для graceful shutdown"""
-        logger.info(f"🛑 Received shutdown signal {signum}. Starting graceful shutdown...")
-        self.shutdown_event.set()
-        
-        # Уведомляем администраторов
-        self.notify_admins_about_shutdown(signum)
-    
-    def notify_admins_about_shutdown(self, signum):
-        """Уведомляет администраторов о shutdown"""
-        try:
-            from telegram import Bot
-            from config import BOT_TOKEN, ADMIN_IDS
-            
-            bot = Bot(token=BOT_TOKEN)
-            message = f"🛑 Bot received shutdown signal {signum} at {datetime.now()}"
-            
-            for admin_id in ADMIN_IDS:
-                try:
-                    bot.send_message(chat_id=admin_id, text=message)
-                except Exception as e:
-                    logger.error(f"Failed to notify admin {admin_id}: {e}")
-        except Exception as e:
-            logger.error(f"Could not send shutdown notification: {e}")
-
-shutdown_manager = GracefulShutdown()
-
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
-logger = logging.getLogger(__name__)
-
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return "Dream Bot is running!"
-
-@app.route('/health')
-def health_check():
-    return "✅ Bot is alive!", 200
-
-@app.route('/webhook/yookassa', methods=['POST'])
-def yookassa_webhook():
-    """Вебхук от ЮKassa с реальной проверкой"""
-    try:
-        # Получаем подпись
-        signature = request.headers.get('Content-Signature', '')
-        
-        # Проверяем подпись
-        is_valid = payment_processor.verify_yookassa_webhook(
-            request.get_data(),
-            signature
-        )
-        
-        if not is_valid:
-            logger.warning("⚠️ Invalid YooKassa webhook signature")
-            return 'Invalid signature', 400
-        
-        data = request.get_json()
-        event = data.get('event')
-        payment_id = data.get('object', {}).get('id')
-        
-        logger.info(f"📥 YooKassa webhook received: {event} for payment {payment_id}")
-        
-        if event == 'payment.succeeded':
-            # Обновляем статус в БД
-            user_id = db.update_payment_status(payment_id, 'success')
-            
-            if user_id:
-                logger.info(f"✅ Payment {payment_id} succeeded for user {user_id}")
-                
-                from payment_processor import PaymentProcessor
-                payment_processor = PaymentProcessor(db)
-                payment_processor.notify_admin({
-                    'user_id': user_id,
-                    'payment_id': payment_id,
-                    'amount': 599.00,
-                    'currency': "RUB",
-                    'payment_method': "yookassa"
-                })
-
-                # Немедленно активируем курс
-                from handlers import activate_course_after_payment
-                
-                # Получаем application из контекста
-                if telegram_app:
-                    # Запускаем в отдельном потоке
-                    import threading
-                    thread = threading.Thread(
-                        target=lambda: asyncio.run(
-                            activate_course_after_payment(user_id, payment_id, telegram_app)
-                        )
-                    )
-                    thread.start()
-                    
-                    logger.info(f"🚀 Course activation started for user {user_id}")
-                else:
-                    logger.error("❌ Telegram app not initialized")
-            
-            return 'OK', 200
-            
-        elif event == 'payment.canceled':
-            db.update_payment_status(payment_id, 'canceled')
-            logger.info(f"❌ Payment {payment_id} canceled")
-            return 'OK', 200
-            
-        elif event == 'payment.waiting_for_capture':
-            db.update_payment_status(payment_id, 'pending')
-            logger.info(f"⏳ Payment {payment_id} waiting for capture")
-            return 'OK', 200
-            
-    except Exception as e:
-        logger.error(f"❌ YooKassa webhook error: {e}")
-        return 'Error', 500
-
-@app.route('/webhook/paypal', methods=['POST'])
-def paypal_webhook():
-    """Вебхук от PayPal с проверкой"""
-    try:
-        # Проверяем вебхук
-        is_valid = payment_processor.verify_paypal_webhook(
-            request.get_data(),
-            request.headers
-        )
-        
-        if not is_valid:
-            logger.warning("⚠️ Invalid PayPal webhook signature")
-            return 'Invalid signature', 400
-        
-        data = request.get_json()
-        event_type = data.get('event_type')
-        resource = data.get('resource', {})
-        
-        logger.info(f"📥 PayPal webhook: {event_type}")
-        
-        if event_type == 'PAYMENT.CAPTURE.COMPLETED':
-            payment_id = resource.get('id')
-            custom_id = resource.get('custom_id')  
-            
-            if payment_id and custom_id:
-                # Обновляем статус платежа
-                db.update_payment_status(payment_id, 'success')
-                
-                try:
-                    user_id = int(custom_id)
-
-                    from payment_processor import PaymentProcessor
-                    payment_processor = PaymentProcessor(db)
-                    payment_processor.notify_admin({
-                        'user_id': user_id,
-                        'payment_id': payment_id,
-                        'amount': 30.00,
-                        'currency': "ILS",
-                        'payment_method': "paypal"
-                    })
-
-                    # Активируем курс
-                    from handlers import activate_course_after_payment
-                    
-                    if telegram_app:
-                        import threading
-                        thread = threading.Thread(
-                            target=lambda: asyncio.run(
-                                activate_course_after_payment(user_id, payment_id, telegram_app)
-                            )
-                        )
-                        thread.start()
-                        logger.info(f"✅ PayPal payment {payment_id} activated for user {user_id}")
-                        
-                except ValueError as e:
-                    logger.error(f"❌ Invalid user_id in PayPal webhook: {custom_id}")
-        
-        return 'OK', 200
-        
-    except Exception as e:
-        logger.error(f"❌ PayPal webhook error: {e}")
-        return 'Error', 500
-
-def activate_course_thread(user_id: int, payment_id: str):
-    """Активирует курс в отдельном потоке"""
-    try:
-        from handlers import activate_course_after_payment
-        
-        # Создаем event loop для асинхронной функции
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Запускаем активацию курса
-        loop.run_until_complete(
-            activate_course_after_payment(user_id, payment_id, telegram_app)
-        )
-        
-        loop.close()
-        
-    except Exception as e:
-        logger.error(f"Error in activation thread: {e}")
-
-def ping_self():
-    """Пингует собственный health endpoint"""
-    service_url = os.environ.get('RENDER_EXTERNAL_URL')
-    
-    while True:
-        try:
-            response = requests.get(f"{service_url}/health", timeout=10)
-            logger.info(f"✅ Self-ping successful: {response.status_code}")
-        except Exception as e:
-            logger.error(f"❌ Self-ping failed: {e}")
-        
-        # Ждем 10 минут (600 секунд)
-        time.sleep(600)
-
-async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик ошибок в хендлерах"""
-    try:
-        error = context.error
-        
-        # Логируем ошибку
-        logging.error(f"Exception while handling an update: {context.error}")
-        
-        # Пытаемся отправить пользователю сообщение об ошибке
-        try:
-            if update and update.effective_chat:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text="❌ Произошла техническая ошибка. Попробуйте позже."
-                )
-        except:
-            pass
-            
-    except Exception as e:
-        logging.error(f"Error in error handler: {e}")
-
-def setup_handlers(application):
-    """Настройка всех обработчиков команд"""
-    # Добавляем обработчики команд
-    application.add_handler(CommandHandler("start", handlers.start))
-    application.add_handler(CommandHandler("activate_course", handlers.activate_course_command))
-    application.add_handler(CommandHandler("stats", handlers.stats_command))
-    application.add_handler(CommandHandler("check_user", handlers.check_user_command))
-    application.add_handler(CommandHandler("reset_course", handlers.reset_course_command))
-    application.add_handler(CommandHandler("check_content", handlers.check_content_command))
-    application.add_handler(CommandHandler("recreate_content", handlers.recreate_content_command))
-    application.add_handler(CommandHandler("test_simple", handlers.test_simple_command))
-    application.add_handler(CommandHandler("debug_content", handlers.debug_content_command))
-    application.add_handler(CommandHandler("test_markdown", handlers.test_markdown_command))
-
-    application.add_handler(CallbackQueryHandler(handlers.button_handler))
-
-async def enhanced_error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Улучшенный обработчик ошибок с обработкой конфликтов"""
-    try:
-        error = context.error
-        
-        # Обрабатываем конфликты отдельно
-        if isinstance(error, Exception) and "Conflict" in str(error):
-            logger.error("💥 CONFLICT: Multiple bot instances detected!")
-            logger.info("🔄 Waiting before restart...")
-            # Не логируем полный traceback для конфликтов
-            return
-        
-        # Логируем другие ошибки
-        logger.error(f"Exception while handling an update: {error}")
-        logger.error("Full traceback:", exc_info=error)
-        
-    except Exception as e:
-        logger.error(f"Error in enhanced error handler: {e}")
-
-def run_bot():
-    """Запускает бота в основном потоке"""
-    max_retries = 5
-    retry_delay = 30
-    
-    for attempt in range(max_retries):
-        if shutdown_manager.shutdown_event.is_set():
-            logger.info("🛑 Shutdown detected, stopping bot")
-            return
-            
-        try:
-            logger.info(f"🔄 Attempt {attempt + 1} to start bot...")
-            
-            if not BOT_TOKEN:
-                logger.error("❌ BOT_TOKEN not found in environment variables!")
-                time.sleep(retry_delay)
-                continue
-            
-            # Инициализация базы данных
-            logger.info("🔄 Initializing database...")
-            db.init_database()
-            
-            # Создаем приложение с улучшенными настройками
-            application = Application.builder().token(BOT_TOKEN).build()
-            
-            # Добавляем обработчик ошибок
-            application.add_error_handler(error_handler)
-            
-            # Добавляем обработчики команд
-            setup_handlers(application)
-            
-            logger.info("🚀 Starting bot polling...")
-            
-            # Запускаем polling с улучшенными настройками
-            application.run_polling(
-                poll_interval=5.0,  # Увеличили интервал
-                timeout=30,
-                drop_pending_updates=True,
-                allowed_updates=['message', 'callback_query'],
-                bootstrap_retries=3,  # Добавили повторные попытки при запуске
-                close_loop=False
-            )
-            
-            logger.info("✅ Bot stopped normally")
-            break
-            
-        except Exception as e:
-            error_str = str(e)
-            if "Conflict" in error_str:
-                logger.error(f"💥 CONFLICT DETECTED on attempt {attempt + 1}: {e}")
-                logger.info("🔄 This usually means another instance is running. Waiting...")
-            elif "Connection" in error_str or "Network" in error_str:
-                logger.error(f"🌐 NETWORK ERROR on attempt {attempt + 1}: {e}")
-            else:
-                logger.error(f"❌ Bot crashed on attempt {attempt + 1}: {e}")
-            
-            if attempt < max_retries - 1 and not shutdown_manager.shutdown_event.is_set():
-                current_delay = min(retry_delay * (2 ** attempt), 300)  # Экспоненциальная задержка
-                logger.info(f"🔄 Restarting in {current_delay} seconds...")
-                for _ in range(current_delay):
-                    if shutdown_manager.shutdown_event.is_set():
-                        return
-                    time.sleep(1)
-            else:
-                logger.error("💥 Max retries exceeded or shutdown requested")
-                if not shutdown_manager.shutdown_event.is_set():
-                    raise
-
-def run_flask_server():
-    """Запускает Flask сервер"""
-    try:
-        port = int(os.environ.get("PORT", 10000))
-        logger.info(f"🚀 Starting Flask server on port {port}")
-        app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
-    except Exception as e:
-        logger.error(f"❌ Flask server crashed: {e}")
-
-def signal_handler(signum, frame):
-    """Обработчик сигналов для graceful shutdown"""
-    logger.info("🛑 Received shutdown signal. Stopping bot gracefully...")
-
-def main():
-    """Основная функция запуска - ТОЛЬКО ОДИН ПРОЦЕСС"""
-    # Регистрируем обработчики сигналов
-    signal.signal(signal.SIGINT, shutdown_manager.signal_handler)
-    signal.signal(signal.SIGTERM, shutdown_manager.signal_handler)
-    
-    logger.info("🚀 Starting Metaphor Bot (SINGLE INSTANCE)...")
-    
-    try:
-        logger.info("🔄 Initializing database...")
-        db.init_database()
-        logger.info("🔄 Initializing course content...")
-        db.initialize_course_content()
-
-        flask_thread = threading.Thread(target=run_flask_server, daemon=True)
-        flask_thread.start()
-        logger.info("✅ Flask server started in thread")
-        
-        # Даем Flask время на запуск
-        time.sleep(3)
-        
-        # Запускаем самопинг
-        ping_thread = threading.Thread(target=ping_self, daemon=True)
-        ping_thread.start()
-        logger.info("✅ Self-ping started")
-
-        # Создаем приложение бота
-        application = Application.builder().token(BOT_TOKEN).build()
-        
-        # Сохраняем глобально для вебхуков
-        global telegram_app
-        telegram_app = application
-        
-        # Настраиваем обработчики
-        setup_handlers(application)
-        
-        # Запускаем планировщик курса
-        scheduler = CourseScheduler(application)
-        scheduler.start()
-        logger.info("✅ Course scheduler started")
-        
-        # Запускаем бота
-        logger.info("🚀 Starting bot polling...")
-        application.run_polling(
-            poll_interval=3.0,
-            timeout=20,
-            drop_pending_updates=True,
-            allowed_updates=['message', 'callback_query'],
-            bootstrap_retries=0,
-            close_loop=False
-        )
-        
-    except Exception as e:
-        logger.error(f"💥 Error in main: {e}")
-        import traceback
-        traceback.print_exc()  # Выводим полный traceback
-    finally:
-        logger.info("🛑 Bot application stopped")
-
-if __name__ == '__main__':
+import logging
+import os
+import time
+import json
+import requests
+import threading
+import functools
+from flask import Flask, request, jsonify, redirect, Response, stream_with_context
+from werkzeug.serving import make_server
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters, ContextTypes
+import multiprocessing
+import sys
+from datetime import datetime, timedelta
+from telegram import Update
+import asyncio
+import signal
+import handlers
+from config import BOT_TOKEN, TELEGRAM_API_URL, PAYPAL_WEBHOOK_ID, HEALTH_DB_CHECK_TTL, HEALTH_MAX_TICK_AGE, HEALTH_MAX_POLL_AGE
+from config import LEADER_LOCK_ID, LEADER_RETRY_INTERVAL
+from database import db
+from handlers import payment_processor
+from payment_reconciler import PaymentReconciler
+from maintenance import MaintenanceRunner
+from delivery import course_outbox, send_pipeline
+from broadcast import broadcast_engine
+from health import health_monitor, CachedCheck
+from circuit_breaker import circuits
+import metrics
+from metrics import timed_handler, InstrumentedRequest
+from log_config import setup_logging, bind_log_context
+from profiling import loop_watchdog
+from leader import LeaderElection
+
+class CourseScheduler:
+    """Планировщик для отправки ежедневных сообщений курса"""
+    
+    def __init__(self, application, loop):
+        self.application = application
+        self.loop = loop  # event loop бота, в котором работает очередь отправки
+        self.db = db
+        self.running = False
+        self._thread = None
+        self._stop = threading.Event()
+        
+    def start(self):
+        """Запускает планировщик"""
+        self.running = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_scheduler, daemon=True)
+        self._thread.start()
+        logger.info("✅ Course scheduler started")
+    
+    async def stop(self):
+        """Останавливает планировщик и ждет окончания текущего тика"""
+        self.running = False
+        self._stop.set()
+        if self._thread:
+            await asyncio.to_thread(self._thread.join, 30)
+    
+    def _run_scheduler(self):
+        """Запускает цикл планировщика"""
+        while self.running:
+            try:
+                self.check_and_send_messages()
+                self._stop.wait(60)  # Проверяем каждую минуту
+            except Exception as e:
+                logger.error(f"❌ Scheduler error: {e}")
+                self._stop.wait(300)  # При ошибке ждем 5 минут
+    
+    def check_and_send_messages(self):
+        """Проверяет и отправляет сообщения пользователям"""
+        with metrics.SCHEDULER_TICK_DURATION.time():
+            self._check_and_send_messages()
+    
+    def _check_and_send_messages(self):
+        try:
+            conn = self.db.get_connection()
+            if not conn:
+                return
+            
+            cursor = conn.cursor()
+            
+            # ИСПРАВЛЕННЫЙ ЗАПРОС: используем last_message_date вместо last_message_time
+            cursor.execute('''
+                SELECT user_id, current_day 
+                FROM course_progress 
+                WHERE is_active = TRUE 
+                AND current_day <= 7
+                AND (
+                    last_message_date IS NULL 
+                    OR last_message_date <= NOW() - INTERVAL '23 hours 55 minutes'
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM users u WHERE u.user_id = course_progress.user_id AND u.is_blocked
+                )
+            ''')
+            
+            users = cursor.fetchall()
+            conn.close()
+            metrics.SCHEDULER_DUE_USERS.set(len(users))
+            
+            for user_id, current_day in users:
+                if not self.running:
+                    # Экземпляр перестал быть лидером посреди тика
+                    break
+                try:
+                    logger.info(f"📨 Sending day {current_day} to user {user_id}")
+                    
+                    # Ставим день в очередь отправки в event loop бота;
+                    # паузы между сообщениями выдерживает сама очередь
+                    asyncio.run_coroutine_threadsafe(
+                        self.send_course_day(user_id, current_day),
+                        self.loop
+                    )
+                    
+                except Exception as e:
+                    logger.error(f"❌ Error scheduling for user {user_id}: {e}")
+            
+            health_monitor.mark("scheduler_tick")
+                    
+        except Exception as e:
+            logger.error(f"❌ Error in check_and_send_messages: {e}")
+    
+    async def send_course_day(self, user_id: int, day_number: int):
+        """Ставит сообщения конкретного дня в постоянную очередь отправки"""
+        if not self.running:
+            return
+        if course_outbox.is_in_flight(user_id):
+            # Предыдущий тик уже поставил этот день в очередь
+            return
+        
+        try:
+            # Получаем контент дня
+            content = await asyncio.to_thread(self.db.get_course_content, day_number)
+            if not content:
+                logger.error(f"❌ No content for day {day_number}")
+                return
+            
+            if not self.running:
+                return
+            
+            # Прогресс обновит outbox после отправки последнего сообщения
+            await course_outbox.enqueue_day(
+                self.application.bot,
+                user_id,
+                day_number,
+                handlers.build_course_day_messages(content),
+                on_day_complete=self.on_day_complete
+            )
+                
+        except Exception as e:
+            logger.error(f"❌ Error in send_course_day: {e}")
+
+    async def on_day_complete(self, user_id: int, day_number: int, results):
+        """Вызывается после отправки дня и обновления прогресса"""
+        handlers._log_failed_sends(user_id, f"day {day_number}", results)
+        logger.info(f"✅ Day {day_number} sent to user {user_id}")
+        
+        # Если это день 7, отправляем предложение марафона
+        if day_number == 7:
+            await self.send_marathon_offer(user_id)
+    
+    async def send_marathon_offer(self, user_id: int):
+        """Отправляет предложение марафона после завершения курса"""
+        try:
+            from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+            
+            marathon_text = """
+🔥 **Поздравляю с завершением 7-дневного пути!**
+
+Вы прошли весь цикл: от мечты до плана. Вы уже знаете, как ставить цели и создавать **движение.** Готовы ли вы закрепить этот навык и **реализовать цели под руководством психотерапевта?**
+
+Приглашаю вас на большой **Марафон «От мечты к цели»,** где мы проведем 21 день в глубокой работе над вашими планами, устраняя блоки и страхи.
+
+✨ **Что вас ждет:**
+✔️**3 недели** структурированной работы в **групповом чате Telegram.**
+✔️**Взаимообмен и переопыление** с другими участниками для мощной поддержки.
+✔️Моя персональная поддержка.
+✔️Глубокая проработка **блоков и страхов.**
+✔️Закрепление навыка достижения цели до результата.
+
+🎁🎁 **Специальный Бонус для вас!**
+Вместо 7000₽, вы получаете Марафон всего за **4900₽!**
+
+🗓️ **Старт Марафона: 4 января 2026 года.**
+Узнать подробности и оплатить со скидкой👇
+"""
+            
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton("📖 Узнать подробности марафона", callback_data="marathon_info")],
+                [InlineKeyboardButton("💳 Оплатить марафон", callback_data="marathon_payment")]
+            ])
+            
+            await self.application.bot.send_message(
+                chat_id=user_id,
+                text=marathon_text,
+                reply_markup=keyboard,
+                parse_mode='Markdown'
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Error sending marathon offer: {e}")
+
+
+class GracefulShutdown:
+    def __init__(self):
+        self.shutdown_event = threading.Event()
+        
+    def signal_handler(self, signum, frame):
+        """Обработчик сигналов для graceful shutdown"""
+        logger.info(f"🛑 Received shutdown signal {signum}. Starting graceful shutdown...")
+        self.shutdown_event.set()
+        
+        # Уведомляем администраторов
+        self.notify_admins_about_shutdown(signum)
+    
+    def notify_admins_about_shutdown(self, signum):
+        """Уведомляет администраторов о shutdown"""
+        try:
+            from telegram import Bot
+            from config import BOT_TOKEN, ADMIN_IDS
+            
+            bot = Bot(token=BOT_TOKEN)
+            message = f"🛑 Bot received shutdown signal {signum} at {datetime.now()}"
+            
+            for admin_id in ADMIN_IDS:
+                try:
+                    bot.send_message(chat_id=admin_id, text=message)
+                except Exception as e:
+                    logger.error(f"Failed to notify admin {admin_id}: {e}")
+        except Exception as e:
+            logger.error(f"Could not send shutdown notification: {e}")
+
+shutdown_manager = GracefulShutdown()
+
+setup_logging()
+
+logger = logging.getLogger(__name__)
+
+# Приложение бота и его event loop - нужны вебхукам, которые работают в потоках Flask
+telegram_app = None
+bot_loop = None
+# Установлен, пока бот принимает вебхуки: БД готова, event loop и приложение запущены
+bot_ready = threading.Event()
+
+app = Flask(__name__)
+
+@app.route('/')
+def home():
+    return "Dream Bot is running!"
+
+@app.route('/health')
+def health_check():
+    return "✅ Bot is alive!", 200
+
+@app.route('/health/live')
+def health_live():
+    """Процесс жив и отвечает на HTTP"""
+    return jsonify(health_monitor.liveness()), 200
+
+@app.route('/health/ready')
+def health_ready():
+    """Бот готов работать: БД доступна, планировщик и polling живы"""
+    report = health_monitor.readiness()
+    return jsonify(report), 200 if report['ready'] else 503
+
+def setup_health_checks():
+    """Регистрирует проверки для /health/ready"""
+    # Пула соединений нет - проверяем, что новое соединение открывается
+    health_monitor.add_check("startup", lambda: (health_monitor.age("startup_complete") is not None, {}))
+    health_monitor.add_check("database", CachedCheck(db.ping, HEALTH_DB_CHECK_TTL))
+    health_monitor.add_check("scheduler", leader_only(health_monitor.check_age("scheduler_tick", HEALTH_MAX_TICK_AGE)))
+    health_monitor.add_check("polling", leader_only(health_monitor.check_age("telegram_poll", HEALTH_MAX_POLL_AGE)))
+    
+    health_monitor.add_probe("last_update_age", lambda: health_monitor.age("telegram_update"))
+    health_monitor.add_probe("send_queue_depth", lambda: send_pipeline.depth)
+    health_monitor.add_probe("payment_reconciler_lag", payment_reconciler_lag)
+    health_monitor.add_probe("event_loop_max_lag", lambda: round(loop_watchdog.max_lag, 3))
+    health_monitor.add_probe("role", lambda: "leader" if is_leader() else "follower")
+    health_monitor.add_probe("circuits", lambda: {circuit.name: circuit.state for circuit in circuits})
+
+def is_leader():
+    election = telegram_app.bot_data.get('leader_election') if telegram_app else None
+    return election is not None and election.is_leader
+
+def leader_only(check):
+    """Планировщик и polling работают только на лидере - остальным экземплярам их не проверяем"""
+    def wrapper():
+        if not is_leader():
+            return True, {"role": "follower"}
+        return check()
+    return wrapper
+
+def payment_reconciler_lag():
+    """Сколько секунд назад закончился последний проход сверки платежей"""
+    reconciler = telegram_app.bot_data.get('payment_reconciler') if telegram_app else None
+    if reconciler is None or reconciler.last_pass_at is None:
+        return None
+    return round(time.time() - reconciler.last_pass_at, 1)
+
+async def mark_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмечает время последнего апдейта от Telegram"""
+    health_monitor.mark("telegram_update")
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def after_startup(view):
+    """Пока бот запускается или останавливается, вебхук отвечает 503 - платежная система повторит его"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not bot_ready.is_set():
+            logger.warning("⏳ Webhook %s received while the bot is not ready, asking to retry", request.path)
+            return 'Service starting', 503
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/webhook/yookassa', methods=['POST'])
+@after_startup
+@metrics.WEBHOOK_DURATION.time(provider="yookassa")
+def yookassa_webhook():
+    """Вебхук от ЮKassa с реальной проверкой"""
+    try:
+        # Получаем подпись
+        signature = request.headers.get('Content-Signature', '')
+        
+        # Проверяем подпись
+        is_valid = payment_processor.verify_yookassa_webhook(
+            request.get_data(),
+            signature
+        )
+        
+        if not is_valid:
+            logger.warning("⚠️ Invalid YooKassa webhook signature")
+            return 'Invalid signature', 400
+        
+        data = request.get_json()
+        event = data.get('event')
+        payment_id = data.get('object', {}).get('id')
+        bind_log_context(payment_id=payment_id)
+        
+        logger.info("📥 YooKassa webhook received: %s", event)
+        
+        if event == 'payment.succeeded':
+            # Активирует курс только тот, кто перевел платеж из pending: повторный
+            # вебхук или платеж, уже подтвержденный сверкой, ничего не делают
+            payer = payment_processor.complete_pending_payment(payment_id, 'success')
+            
+            if not payer:
+                logger.info(f"ℹ️ Payment {payment_id} already processed")
+            else:
+                user_id = payer['user_id']
+                logger.info(f"✅ Payment {payment_id} succeeded for user {user_id}")
+                
+                payment_processor.notify_admin({
+                    'user_id': user_id,
+                    'first_name': payer['first_name'],
+                    'username': payer['username'],
+                    'payment_id': payment_id,
+                    'amount': 599.00,
+                    'currency': "RUB",
+                    'payment_method': "yookassa"
+                })
+
+                # Немедленно активируем курс
+                if schedule_activation(user_id, payment_id, "yookassa"):
+                    logger.info(f"🚀 Course activation started for user {user_id}")
+                else:
+                    logger.error("❌ Telegram app not initialized")
+            
+            return 'OK', 200
+            
+        elif event == 'payment.canceled':
+            payment_processor.complete_pending_payment(payment_id, 'canceled')
+            logger.info(f"❌ Payment {payment_id} canceled")
+            return 'OK', 200
+            
+        elif event == 'payment.waiting_for_capture':
+            # Платеж и так в pending; успешный статус не откатываем
+            logger.info(f"⏳ Payment {payment_id} waiting for capture")
+            return 'OK', 200
+            
+    except Exception as e:
+        logger.error(f"❌ YooKassa webhook error: {e}")
+        return 'Error', 500
+
+@app.route('/webhook/paypal', methods=['POST'])
+@after_startup
+@metrics.WEBHOOK_DURATION.time(provider="paypal")
+def paypal_webhook():
+    """Вебхук от PayPal с проверкой"""
+    try:
+        # Проверяем вебхук
+        is_valid = payment_processor.verify_paypal_webhook(
+            request.get_data(),
+            request.headers
+        )
+        
+        if not is_valid:
+            logger.warning("⚠️ Invalid PayPal webhook signature")
+            return 'Invalid signature', 400
+        
+        data = request.get_json()
+        event_type = data.get('event_type')
+        resource = data.get('resource', {})
+        
+        logger.info(f"📥 PayPal webhook: {event_type}")
+        
+        if event_type == 'PAYMENT.CAPTURE.COMPLETED':
+            # В БД хранится ID заказа, а в вебхуке о capture - ID самого capture
+            related = resource.get('supplementary_data', {}).get('related_ids', {})
+            payment_id = related.get('order_id') or resource.get('id')
+            custom_id = resource.get('custom_id')  
+            bind_log_context(payment_id=payment_id)
+            
+            if payment_id and custom_id:
+                # Активирует курс только тот, кто перевел платеж из pending
+                payer = payment_processor.complete_pending_payment(payment_id, 'success')
+                if not payer:
+                    logger.info(f"ℹ️ PayPal payment {payment_id} already processed")
+                    return 'OK', 200
+                
+                try:
+                    user_id = int(custom_id)
+
+                    payment_processor.notify_admin({
+                        'user_id': user_id,
+                        'first_name': payer.get('first_name'),
+                        'username': payer.get('username'),
+                        'payment_id': payment_id,
+                        'amount': 30.00,
+                        'currency': "ILS",
+                        'payment_method': "paypal"
+                    })
+
+                    # Активируем курс
+                    if schedule_activation(user_id, payment_id, "paypal"):
+                        logger.info(f"✅ PayPal payment {payment_id} activated for user {user_id}")
+                        
+                except ValueError as e:
+                    logger.error(f"❌ Invalid user_id in PayPal webhook: {custom_id}")
+        
+        return 'OK', 200
+        
+    except Exception as e:
+        logger.error(f"❌ PayPal webhook error: {e}")
+        return 'Error', 500
+
+def schedule_activation(user_id: int, payment_id: str, method: str) -> bool:
+    """Запускает активацию курса в event loop бота (вебхуки приходят из потоков Flask)"""
+    if not telegram_app or not bot_loop:
+        return False
+    
+    from handlers import activate_course_after_payment
+    asyncio.run_coroutine_threadsafe(
+        activate_course_after_payment(user_id, payment_id, method, telegram_app),
+        bot_loop
+    )
+    return True
+
+def activate_course_thread(user_id: int, payment_id: str):
+    """Активирует курс в отдельном потоке"""
+    try:
+        from handlers import activate_course_after_payment
+        
+        # Создаем event loop для асинхронной функции
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        
+        # Запускаем активацию курса
+        loop.run_until_complete(
+            activate_course_after_payment(user_id, payment_id, telegram_app)
+        )
+        
+        loop.close()
+        
+    except Exception as e:
+        logger.error(f"Error in activation thread: {e}")
+
+def ping_self():
+    """Пингует собственный health endpoint"""
+    service_url = os.environ.get('RENDER_EXTERNAL_URL')
+    
+    while True:
+        try:
+            response = requests.get(f"{service_url}/health", timeout=10)
+            logger.info(f"✅ Self-ping successful: {response.status_code}")
+        except Exception as e:
+            logger.error(f"❌ Self-ping failed: {e}")
+        
+        # Ждем 10 минут (600 секунд)
+        time.sleep(600)
+
+async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик ошибок в хендлерах"""
+    try:
+        error = context.error
+        
+        # Логируем ошибку
+        logging.error(f"Exception while handling an update: {context.error}")
+        
+        # Пытаемся отправить пользователю сообщение об ошибке
+        try:
+            if update and update.effective_chat:
+                await context.bot.send_message(
+                    chat_id=update.effective_chat.id,
+                    text="❌ Произошла техническая ошибка. Попробуйте позже."
+                )
+        except:
+            pass
+            
+    except Exception as e:
+        logging.error(f"Error in error handler: {e}")
+
+async def post_init(application):
+    """Запускает фоновые задачи в event loop бота (на каждом экземпляре)"""
+    global bot_loop
+    bot_loop = asyncio.get_running_loop()
+    loop_watchdog.start()
+    
+    # Polling, планировщик и сверку платежей запускает только лидер
+    election = LeaderElection(
+        db,
+        LEADER_LOCK_ID,
+        LEADER_RETRY_INTERVAL,
+        on_elected=lambda: start_leader_duties(application),
+        on_demoted=lambda: stop_leader_duties(application)
+    )
+    election.start()
+    application.bot_data['leader_election'] = election
+
+async def post_shutdown(application):
+    """Останавливает фоновые задачи и отпускает лидерство"""
+    election = application.bot_data.get('leader_election')
+    if election:
+        # Блокировка отпускается только после остановки polling, планировщика и рассылок
+        await election.stop(step_down=lambda: stop_leader_duties(application))
+    
+    await loop_watchdog.stop()
+
+async def start_leader_duties(application):
+    """Включает работу, которая должна идти ровно на одном экземпляре"""
+    logger.info("🚀 Starting bot polling...")
+    await application.updater.start_polling(
+        poll_interval=3.0,
+        timeout=20,
+        # Апдейты, пришедшие пока лидер менялся, не выбрасываем
+        drop_pending_updates=False,
+        allowed_updates=['message', 'callback_query'],
+        bootstrap_retries=0
+    )
+    
+    # Запускаем планировщик курса
+    scheduler = CourseScheduler(application, bot_loop)
+    scheduler.start()
+    application.bot_data['course_scheduler'] = scheduler
+    
+    # Досылаем дни, отправка которых прервалась при прошлом запуске
+    try:
+        await course_outbox.resume(application.bot, on_day_complete=scheduler.on_day_complete)
+    except Exception as e:
+        logger.error(f"❌ Error resuming course outbox: {e}")
+    
+    reconciler = PaymentReconciler(application, db, payment_processor)
+    reconciler.start()
+    application.bot_data['payment_reconciler'] = reconciler
+    
+    maintenance = MaintenanceRunner(db)
+    maintenance.start()
+    application.bot_data['maintenance'] = maintenance
+    
+    # Рассылки, прерванные перезапуском или сменой лидера
+    try:
+        await broadcast_engine.resume_running(application.bot)
+    except Exception as e:
+        logger.error(f"❌ Error resuming broadcasts: {e}")
+
+async def stop_leader_duties(application):
+    """Выключает polling, планировщик, сверку платежей, обслуживание БД и рассылки"""
+    if application.updater.running:
+        await application.updater.stop()
+    
+    scheduler = application.bot_data.pop('course_scheduler', None)
+    if scheduler:
+        await scheduler.stop()
+    
+    reconciler = application.bot_data.pop('payment_reconciler', None)
+    if reconciler:
+        await reconciler.stop()
+    
+    maintenance = application.bot_data.pop('maintenance', None)
+    if maintenance:
+        await maintenance.stop()
+    
+    await broadcast_engine.stop()
+
+async def run_application(application):
+    """Запускает приложение до сигнала остановки; polling включается при избрании лидером"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    server = await run_startup_stages(application)
+    try:
+        # Самопинг - после того как HTTP-сервер открыл порт
+        threading.Thread(target=ping_self, daemon=True).start()
+        
+        await post_init(application)
+        await application.start()
+        bot_ready.set()
+        try:
+            await stop_event.wait()
+            logger.info("🛑 Received shutdown signal. Stopping bot gracefully...")
+        finally:
+            bot_ready.clear()
+            await post_shutdown(application)
+            await application.stop()
+            await application.shutdown()
+    finally:
+        await asyncio.to_thread(stop_http_server, server)
+
+def setup_handlers(application):
+    """Настройка всех обработчиков команд"""
+    # Группа -1 выполняется до остальных хендлеров и не мешает им
+    application.add_handler(TypeHandler(Update, mark_update), group=-1)
+    
+    # Добавляем обработчики команд
+    application.add_handler(CommandHandler("start", timed_handler("start", handlers.start)))
+    application.add_handler(CommandHandler("activate_course", timed_handler("activate_course", handlers.activate_course_command)))
+    application.add_handler(CommandHandler("stats", timed_handler("stats", handlers.stats_command)))
+    application.add_handler(CommandHandler("check_user", timed_handler("check_user", handlers.check_user_command)))
+    application.add_handler(CommandHandler("reset_course", timed_handler("reset_course", handlers.reset_course_command)))
+    application.add_handler(CommandHandler("check_content", timed_handler("check_content", handlers.check_content_command)))
+    application.add_handler(CommandHandler("recreate_content", timed_handler("recreate_content", handlers.recreate_content_command)))
+    application.add_handler(CommandHandler("reload_content", timed_handler("reload_content", handlers.reload_content_command)))
+    application.add_handler(CommandHandler("content_versions", timed_handler("content_versions", handlers.content_versions_command)))
+    application.add_handler(CommandHandler("broadcast", timed_handler("broadcast", handlers.broadcast_command)))
+    application.add_handler(CommandHandler("broadcast_pause", timed_handler("broadcast_pause", handlers.broadcast_pause_command)))
+    application.add_handler(CommandHandler("broadcast_resume", timed_handler("broadcast_resume", handlers.broadcast_resume_command)))
+    application.add_handler(CommandHandler("broadcast_status", timed_handler("broadcast_status", handlers.broadcast_status_command)))
+    application.add_handler(CommandHandler("export_payments", timed_handler("export_payments", handlers.export_payments_command)))
+    application.add_handler(CommandHandler("export_users", timed_handler("export_users", handlers.export_users_command)))
+    application.add_handler(CommandHandler("test_simple", timed_handler("test_simple", handlers.test_simple_command)))
+    application.add_handler(CommandHandler("debug_content", timed_handler("debug_content", handlers.debug_content_command)))
+    application.add_handler(CommandHandler("test_markdown", timed_handler("test_markdown", handlers.test_markdown_command)))
+    application.add_handler(CommandHandler("profile_start", timed_handler("profile_start", handlers.profile_start_command)))
+    application.add_handler(CommandHandler("profile_stop", timed_handler("profile_stop", handlers.profile_stop_command)))
+    application.add_handler(CommandHandler("tasks", timed_handler("tasks", handlers.tasks_command)))
+
+    application.add_handler(CallbackQueryHandler(timed_handler("button", handlers.button_handler)))
+
+async def enhanced_error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Улучшенный обработчик ошибок с обработкой конфликтов"""
+    try:
+        error = context.error
+        
+        # Обрабатываем конфликты отдельно
+        if isinstance(error, Exception) and "Conflict" in str(error):
+            logger.error("💥 CONFLICT: Multiple bot instances detected!")
+            logger.info("🔄 Waiting before restart...")
+            # Не логируем полный traceback для конфликтов
+            return
+        
+        # Логируем другие ошибки
+        logger.error(f"Exception while handling an update: {error}")
+        logger.error("Full traceback:", exc_info=error)
+        
+    except Exception as e:
+        logger.error(f"Error in enhanced error handler: {e}")
+
+def run_bot():
+    """Запускает бота в основном потоке"""
+    max_retries = 5
+    retry_delay = 30
+    
+    for attempt in range(max_retries):
+        if shutdown_manager.shutdown_event.is_set():
+            logger.info("🛑 Shutdown detected, stopping bot")
+            return
+            
+        try:
+            logger.info(f"🔄 Attempt {attempt + 1} to start bot...")
+            
+            if not BOT_TOKEN:
+                logger.error("❌ BOT_TOKEN not found in environment variables!")
+                time.sleep(retry_delay)
+                continue
+            
+            # Инициализация базы данных
+            logger.info("🔄 Initializing database...")
+            db.init_database()
+            
+            # Создаем приложение с улучшенными настройками
+            application = Application.builder().token(BOT_TOKEN).build()
+            
+            # Добавляем обработчик ошибок
+            application.add_error_handler(error_handler)
+            
+            # Добавляем обработчики команд
+            setup_handlers(application)
+            
+            logger.info("🚀 Starting bot polling...")
+            
+            # Запускаем polling с улучшенными настройками
+            application.run_polling(
+                poll_interval=5.0,  # Увеличили интервал
+                timeout=30,
+                drop_pending_updates=True,
+                allowed_updates=['message', 'callback_query'],
+                bootstrap_retries=3,  # Добавили повторные попытки при запуске
+                close_loop=False
+            )
+            
+            logger.info("✅ Bot stopped normally")
+            break
+            
+        except Exception as e:
+            error_str = str(e)
+            if "Conflict" in error_str:
+                logger.error(f"💥 CONFLICT DETECTED on attempt {attempt + 1}: {e}")
+                logger.info("🔄 This usually means another instance is running. Waiting...")
+            elif "Connection" in error_str or "Network" in error_str:
+                logger.error(f"🌐 NETWORK ERROR on attempt {attempt + 1}: {e}")
+            else:
+                logger.error(f"❌ Bot crashed on attempt {attempt + 1}: {e}")
+            
+            if attempt < max_retries - 1 and not shutdown_manager.shutdown_event.is_set():
+                current_delay = min(retry_delay * (2 ** attempt), 300)  # Экспоненциальная задержка
+                logger.info(f"🔄 Restarting in {current_delay} seconds...")
+                for _ in range(current_delay):
+                    if shutdown_manager.shutdown_event.is_set():
+                        return
+                    time.sleep(1)
+            else:
+                logger.error("💥 Max retries exceeded or shutdown requested")
+                if not shutdown_manager.shutdown_event.is_set():
+                    raise
+
+def start_http_server():
+    """Открывает порт и запускает Flask в отдельном потоке.
+
+    Порт привязывается до возврата из функции, поэтому сразу после нее
+    сервер готов принимать запросы - ждать фиксированное время не нужно.
+    """
+    port = int(os.environ.get("PORT", 10000))
+    server = make_server('0.0.0.0', port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="flask", daemon=True)
+    thread.start()
+    logger.info(f"✅ Flask server listening on port {port}")
+    return server
+
+def stop_http_server(server):
+    """Останавливает Flask и освобождает порт"""
+    server.shutdown()
+    server.server_close()
+
+async def run_startup_stages(application):
+    """Выполняет независимые этапы запуска параллельно и пишет их длительность. Возвращает HTTP-сервер"""
+    timings = {}
+    
+    async def stage(name, fn):
+        start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                return await fn()
+            return await asyncio.to_thread(fn)
+        finally:
+            timings[name] = time.perf_counter() - start
+            metrics.STARTUP_STAGE_DURATION.set(round(timings[name], 3), stage=name)
+    
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        # Схема БД и контент курса (init_database сам заполняет контент)
+        stage("database", db.init_database),
+        # Вебхуки отвечают 503, пока не установлен bot_ready
+        stage("http", start_http_server),
+        # getMe и прочая инициализация PTB
+        stage("telegram", application.initialize),
+        return_exceptions=True
+    )
+    server = results[1]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # Порт не должен остаться занятым, если запуск будет повторен
+        if not isinstance(server, BaseException):
+            await asyncio.to_thread(stop_http_server, server)
+        raise errors[0]
+    total = time.perf_counter() - start
+    health_monitor.mark("startup_complete")
+    logger.info(
+        "⏱️ Startup finished in %.2fs: %s", total,
+        ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    )
+    return server
+
+def signal_handler(signum, frame):
+    """Обработчик сигналов для graceful shutdown"""
+    logger.info("🛑 Received shutdown signal. Stopping bot gracefully...")
+
+def main():
+    """Основная функция запуска (экземпляров может быть несколько, см. LeaderElection)"""
+    # Регистрируем обработчики сигналов
+    signal.signal(signal.SIGINT, shutdown_manager.signal_handler)
+    signal.signal(signal.SIGTERM, shutdown_manager.signal_handler)
+    
+    logger.info("🚀 Starting Metaphor Bot...")
+    
+    try:
+        setup_health_checks()
+
+        # Создаем приложение бота
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .base_url(TELEGRAM_API_URL)
+            .request(InstrumentedRequest(connection_pool_size=256))
+            .get_updates_request(InstrumentedRequest())
+            .build()
+        )
+        
+        # Сохраняем глобально для вебхуков
+        global telegram_app
+        telegram_app = application
+        
+        # Настраиваем обработчики
+        # (polling и планировщик запускаются, когда экземпляр станет лидером)
+        setup_handlers(application)
+        
+        # БД, HTTP-сервер и бот инициализируются параллельно в run_application;
+        # все экземпляры обслуживают HTTP и вебхуки, polling - только лидер
+        asyncio.run(run_application(application))
+        
+    except Exception as e:
+        logger.error(f"💥 Error in main: {e}")
+        import traceback
+        traceback.print_exc()  # Выводим полный traceback
+    finally:
+        logger.info("🛑 Bot application stopped")
+
+if __name__ == '__main__':
     main()
\ No newline at end of file
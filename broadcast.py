@@ -0,0 +1,208 @@
+import asyncio
+import logging
+
+from config import BROADCAST_RATE, BROADCAST_BATCH_SIZE, BROADCAST_PROGRESS_CHUNK
+from database import db
+from delivery import send_pipeline, RateLimiter, classify_error, UNDELIVERABLE
+
+logger = logging.getLogger(__name__)
+
+# Аудитории рассылок: название -> (описание, SQL со столбцом user_id)
+AUDIENCES = {
+    'graduates': (
+        "Закончили курс",
+        "SELECT user_id FROM course_progress WHERE completed_at IS NOT NULL "
+        "UNION SELECT user_id FROM course_progress_archive WHERE completed_at IS NOT NULL"
+    ),
+    'marathon': (
+        "Купили марафон",
+        "SELECT user_id FROM marathon_purchases"
+    ),
+    'marathon_launch': (
+        "Закончили курс или купили марафон",
+        "SELECT user_id FROM course_progress WHERE completed_at IS NOT NULL "
+        "UNION SELECT user_id FROM course_progress_archive WHERE completed_at IS NOT NULL "
+        "UNION SELECT user_id FROM marathon_purchases"
+    ),
+    'all': (
+        "Все пользователи",
+        "SELECT user_id FROM users"
+    ),
+}
+
+
+def audience_query(audience):
+    """Получатели аудитории по возрастанию user_id, начиная после заданного (без заблокировавших бота)"""
+    return (
+        f"SELECT DISTINCT user_id FROM ({AUDIENCES[audience][1]}) audience "
+        "WHERE user_id > %s "
+        "AND NOT EXISTS (SELECT 1 FROM users u WHERE u.user_id = audience.user_id AND u.is_blocked) "
+        "ORDER BY user_id"
+    )
+
+
+class BroadcastEngine:
+    """Массовые рассылки администратора.
+
+    Получатели читаются серверным курсором по возрастанию user_id и
+    отправляются через общую очередь SendPipeline; частоту ограничивает
+    общий на все рассылки RateLimiter, чтобы рассылка не отнимала лимит
+    Bot API у сообщений курса. После каждых BROADCAST_PROGRESS_CHUNK
+    отправок в таблицу broadcasts записываются последний обработанный
+    user_id и счетчики, поэтому
+    рассылку можно поставить на паузу и продолжить - в том числе на другом
+    экземпляре после смены лидера.
+    """
+
+    def __init__(self, db, pipeline, limiter):
+        self.db = db
+        self.pipeline = pipeline
+        self.limiter = limiter
+        self._tasks = {}      # broadcast_id -> задача отправки
+        self._pausing = set()
+
+    async def start(self, bot, audience, text, created_by):
+        """Создает рассылку и запускает ее. Возвращает id рассылки"""
+        broadcast_id = await asyncio.to_thread(self.db.create_broadcast, audience, text, created_by)
+        broadcast = (await asyncio.to_thread(self.db.get_broadcasts, broadcast_id))[0]
+        self._launch(bot, broadcast)
+        logger.info("📣 Broadcast %s to '%s' started by %s", broadcast_id, audience, created_by)
+        return broadcast_id
+
+    async def pause(self, broadcast_id):
+        """Ставит рассылку на паузу. False - если она не идет"""
+        if broadcast_id in self._tasks:
+            # Статус сохранит сама задача, дождавшись отправленных сообщений
+            self._pausing.add(broadcast_id)
+            return True
+        return await asyncio.to_thread(self.db.set_broadcast_status, broadcast_id, 'paused', 'running')
+
+    async def resume(self, bot, broadcast_id):
+        """Продолжает рассылку с места остановки. False - если она не на паузе"""
+        if broadcast_id in self._tasks:
+            return False
+        if not await asyncio.to_thread(self.db.set_broadcast_status, broadcast_id, 'running', 'paused'):
+            return False
+        broadcast = (await asyncio.to_thread(self.db.get_broadcasts, broadcast_id))[0]
+        self._launch(bot, broadcast)
+        logger.info("▶️ Broadcast %s resumed after user %s", broadcast_id, broadcast['last_user_id'])
+        return True
+
+    async def resume_running(self, bot):
+        """Продолжает рассылки, прерванные перезапуском или сменой лидера"""
+        broadcasts = await asyncio.to_thread(self.db.get_broadcasts, None, 'running', 100)
+        for broadcast in broadcasts:
+            if broadcast['id'] not in self._tasks:
+                self._launch(bot, broadcast)
+        if broadcasts:
+            logger.info("🔄 Resumed %s running broadcasts", len(broadcasts))
+
+    async def stop(self):
+        """Останавливает отправку, не меняя статус (рассылки продолжит следующий лидер)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _launch(self, bot, broadcast):
+        task = asyncio.get_running_loop().create_task(self._run(bot, broadcast))
+        self._tasks[broadcast['id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast['id'], None))
+
+    async def _run(self, bot, broadcast):
+        broadcast_id = broadcast['id']
+        text = broadcast['text']
+        message = {'text': self.db.markdown_to_html(text), 'parse_mode': 'HTML', 'fallback_text': text}
+        batches = self.db.stream_query(
+            audience_query(broadcast['audience']), (broadcast['last_user_id'],), BROADCAST_BATCH_SIZE
+        )
+        read = None
+        status = None
+        try:
+            while status is None:
+                read = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+                batch = await asyncio.shield(read)
+                if batch is None:
+                    status = 'done'
+                    await asyncio.to_thread(self.db.save_broadcast_progress, broadcast_id, 0, 0, 0, 0, status)
+                    break
+                for start in range(0, len(batch), BROADCAST_PROGRESS_CHUNK):
+                    status = await self._send_chunk(bot, broadcast, message, batch[start:start + BROADCAST_PROGRESS_CHUNK])
+                    if status:
+                        break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("❌ Broadcast %s error: %s", broadcast_id, e)
+            status = 'paused'
+            await asyncio.to_thread(self.db.set_broadcast_status, broadcast_id, 'paused', 'running')
+        finally:
+            self._pausing.discard(broadcast_id)
+            if read is not None and not read.done():
+                # Отмена пришла во время чтения пачки: генератор можно закрыть только после потока
+                await asyncio.wait([read])
+            # Закрывает серверный курсор и его соединение
+            batches.close()
+
+        logger.info(
+            "📣 Broadcast %s %s: delivered %s, blocked %s, failed %s", broadcast_id, status,
+            broadcast['delivered'], broadcast['blocked'], broadcast['failed']
+        )
+        await self._report(bot, broadcast, status)
+
+    async def _send_chunk(self, bot, broadcast, message, users):
+        """Отправляет часть пачки и сохраняет прогресс. Возвращает 'paused', если рассылку поставили на паузу"""
+        status = None
+        sends = []
+        last_user_id = None
+        for (user_id,) in users:
+            if broadcast['id'] in self._pausing:
+                status = 'paused'
+                break
+            await self.limiter.acquire()
+            sends.append(self.pipeline.send_sequence(bot, user_id, [message]))
+            last_user_id = user_id
+
+        counts = {'delivered': 0, 'blocked': 0, 'failed': 0}
+        for results in await asyncio.gather(*sends):
+            counts[_outcome(results[0])] += 1
+        for key in counts:
+            broadcast[key] += counts[key]
+        if last_user_id is not None or status:
+            await asyncio.to_thread(
+                self.db.save_broadcast_progress, broadcast['id'],
+                last_user_id or 0, counts['delivered'], counts['blocked'], counts['failed'], status
+            )
+        return status
+
+    async def _report(self, bot, broadcast, status):
+        """Сообщает автору рассылки о ее завершении или паузе"""
+        if not broadcast['created_by']:
+            return
+        title = "✅ Рассылка завершена" if status == 'done' else "⏸ Рассылка на паузе"
+        hint = "" if status == 'done' else f"\nПродолжить: /broadcast_resume {broadcast['id']}"
+        try:
+            await bot.send_message(
+                chat_id=broadcast['created_by'],
+                text=(
+                    f"{title} #{broadcast['id']}\n\n"
+                    f"📬 Доставлено: {broadcast['delivered']}\n"
+                    f"🚫 Заблокировали бота: {broadcast['blocked']}\n"
+                    f"❌ Ошибки: {broadcast['failed']}{hint}"
+                )
+            )
+        except Exception as e:
+            logger.error("❌ Error reporting broadcast %s: %s", broadcast['id'], e)
+
+
+def _outcome(result):
+    if not isinstance(result, Exception):
+        return 'delivered'
+    if classify_error(result) in UNDELIVERABLE:
+        # Пользователь заблокировал бота или удалил аккаунт
+        return 'blocked'
+    return 'failed'
+
+
+broadcast_limiter = RateLimiter(BROADCAST_RATE)
+broadcast_engine = BroadcastEngine(db, send_pipeline, broadcast_limiter)
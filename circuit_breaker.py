@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+
+from config import (
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT,
+    PAYMENT_CIRCUIT_SLOW_SECONDS, DB_CIRCUIT_SLOW_SECONDS
+)
+from metrics import CIRCUIT_STATE, CIRCUIT_REJECTED
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонен: зависимость недоступна, цепь разомкнута"""
+
+    def __init__(self, name):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Предохранитель для внешней зависимости (платежная система, БД).
+
+    Используется как контекстный менеджер вокруг одного обращения:
+
+        with yookassa_circuit:
+            response = requests.post(...)
+
+    Исключение внутри блока или вызов дольше slow_call секунд считается
+    сбоем. После failure_threshold сбоев подряд цепь размыкается, и
+    следующие reset_timeout секунд вход в блок сразу бросает
+    CircuitOpenError - вызывающий код уходит в свой запасной вариант без
+    ожидания таймаутов. Затем пропускается одна пробная попытка: успех
+    замыкает цепь, сбой снова размыкает ее.
+    """
+
+    def __init__(self, name, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 slow_call: float = PAYMENT_CIRCUIT_SLOW_SECONDS, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._state = CLOSED
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        CIRCUIT_STATE.set(0, name=name)
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Можно ли обращаться к зависимости сейчас (в полуоткрытом состоянии - одна проба)"""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+                logger.info("✅ %s circuit closed", self.name)
+
+    def record_failure(self, reason):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning("⚡ %s circuit opened after %s failures: %s", self.name, self.failures, reason)
+                self._set_state(OPEN)
+                self.opened_at = time.monotonic()
+
+    def __enter__(self):
+        if not self.allow():
+            CIRCUIT_REJECTED.inc(name=self.name)
+            raise CircuitOpenError(self.name)
+        self._local.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.monotonic() - self._local.started
+        if exc_type is not None:
+            self.record_failure(f"{exc_type.__name__}: {exc}")
+        elif elapsed > self.slow_call:
+            self.record_failure(f"slow call {elapsed:.1f}s")
+        else:
+            self.record_success()
+        return False
+
+    def _set_state(self, state):
+        self._state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], name=self.name)
+
+
+yookassa_circuit = CircuitBreaker("yookassa")
+paypal_circuit = CircuitBreaker("paypal")
+db_circuit = CircuitBreaker("database", slow_call=DB_CIRCUIT_SLOW_SECONDS)
+circuits = [yookassa_circuit, paypal_circuit, db_circuit]
@@ -1,20 +1,88 @@
-import os
-
-# Токен бота из переменных окружения
-BOT_TOKEN = os.environ.get("BOT_TOKEN")
-if not BOT_TOKEN:
-    raise ValueError("❌ BOT_TOKEN not found in environment variables!")
-# ID администратора
-ADMIN_IDS = [int(id.strip()) for id in os.environ.get("ADMIN_IDS", "").split(",") if id.strip()]
-
-
-
-# Настройки ЮKassa
-YOOKASSA_SHOP_ID = os.environ.get("YOOKASSA_SHOP_ID", "")
-YOOKASSA_SECRET_KEY = os.environ.get("YOOKASSA_SECRET_KEY", "")
-
-# PayPal настройки
-PAYPAL_CLIENT_ID = os.environ.get("PAYPAL_CLIENT_ID", "")
-PAYPAL_CLIENT_SECRET = os.environ.get("PAYPAL_CLIENT_SECRET", "")
-PAYPAL_WEBHOOK_ID = os.environ.get("PAYPAL_WEBHOOK_ID", "")
-
+import os
+import zlib
+
+# Токен бота из переменных окружения
+BOT_TOKEN = os.environ.get("BOT_TOKEN")
+if not BOT_TOKEN:
+    raise ValueError("❌ BOT_TOKEN not found in environment variables!")
+# Адрес Bot API (для нагрузочных тестов можно указать локальный fake-сервер)
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+# ID администратора
+ADMIN_IDS = [int(id.strip()) for id in os.environ.get("ADMIN_IDS", "").split(",") if id.strip()]
+
+
+
+# Настройки ЮKassa
+YOOKASSA_SHOP_ID = os.environ.get("YOOKASSA_SHOP_ID", "")
+YOOKASSA_SECRET_KEY = os.environ.get("YOOKASSA_SECRET_KEY", "")
+
+# PayPal настройки
+PAYPAL_CLIENT_ID = os.environ.get("PAYPAL_CLIENT_ID", "")
+PAYPAL_CLIENT_SECRET = os.environ.get("PAYPAL_CLIENT_SECRET", "")
+PAYPAL_WEBHOOK_ID = os.environ.get("PAYPAL_WEBHOOK_ID", "")
+
+# Кэш статусов платежей (секунды): pending меняется часто, финальные статусы - нет
+PAYMENT_STATUS_CACHE_TTL = float(os.environ.get("PAYMENT_STATUS_CACHE_TTL", "5"))
+PAYMENT_STATUS_FINAL_TTL = float(os.environ.get("PAYMENT_STATUS_FINAL_TTL", "300"))
+
+
+# Фоновая сверка ожидающих платежей
+RECONCILE_INTERVAL = int(os.environ.get("RECONCILE_INTERVAL", "60"))  # секунды между проходами
+RECONCILE_BATCH_SIZE = int(os.environ.get("RECONCILE_BATCH_SIZE", "100"))
+RECONCILE_CONCURRENCY = int(os.environ.get("RECONCILE_CONCURRENCY", "5"))
+RECONCILE_MAX_AGE_HOURS = int(os.environ.get("RECONCILE_MAX_AGE_HOURS", "48"))
+
+# Очередь исходящих сообщений
+SEND_WORKERS = int(os.environ.get("SEND_WORKERS", "16"))
+
+# Проверки готовности (/health/ready)
+HEALTH_DB_CHECK_TTL = int(os.environ.get("HEALTH_DB_CHECK_TTL", "15"))  # секунды между проверками БД
+HEALTH_MAX_TICK_AGE = int(os.environ.get("HEALTH_MAX_TICK_AGE", "180"))  # планировщик тикает раз в минуту
+HEALTH_MAX_POLL_AGE = int(os.environ.get("HEALTH_MAX_POLL_AGE", "120"))  # long polling - раз в 20 секунд
+
+# Журнал медленных запросов
+SLOW_QUERY_MS = int(os.environ.get("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_EXPLAIN = os.environ.get("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+
+# Логирование
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()  # text или json
+LOG_DEBUG_SAMPLE = int(os.environ.get("LOG_DEBUG_SAMPLE", "100"))  # пишем каждую N-ю DEBUG-запись события
+
+# База данных (для локальной БД без SSL: DB_SSLMODE=disable)
+DB_SSLMODE = os.environ.get("DB_SSLMODE", "require")
+
+# Детектор блокировок event loop
+LOOP_WATCHDOG_INTERVAL = float(os.environ.get("LOOP_WATCHDOG_INTERVAL", "0.1"))  # секунды между heartbeat
+LOOP_STALL_THRESHOLD_MS = int(os.environ.get("LOOP_STALL_THRESHOLD_MS", "250"))
+
+# Выбор лидера: polling и планировщик работают только на одном экземпляре
+LEADER_LOCK_ID = int(os.environ.get("LEADER_LOCK_ID", str(zlib.crc32(BOT_TOKEN.encode()))))
+LEADER_RETRY_INTERVAL = float(os.environ.get("LEADER_RETRY_INTERVAL", "5"))
+
+# Версии контента курса
+CONTENT_CHECK_INTERVAL = float(os.environ.get("CONTENT_CHECK_INTERVAL", "30"))  # как часто сверять активную версию
+CONTENT_KEEP_VERSIONS = int(os.environ.get("CONTENT_KEEP_VERSIONS", "5"))  # сколько версий хранить для отката
+CONTENT_PUBLISH_LOCK_ID = LEADER_LOCK_ID + 1
+
+# Рассылки администратора
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "20"))  # сообщений в секунду на все рассылки
+BROADCAST_BATCH_SIZE = int(os.environ.get("BROADCAST_BATCH_SIZE", "200"))  # получателей за одно чтение из БД
+BROADCAST_PROGRESS_CHUNK = int(os.environ.get("BROADCAST_PROGRESS_CHUNK", "20"))  # прогресс сохраняется после стольких отправок
+
+# Фоновое обслуживание БД (на лидере)
+MAINTENANCE_INTERVAL = int(os.environ.get("MAINTENANCE_INTERVAL", "3600"))  # секунды между проходами
+PROGRESS_ARCHIVE_AFTER_DAYS = int(os.environ.get("PROGRESS_ARCHIVE_AFTER_DAYS", "30"))  # завершенный прогресс старше - в архив
+PROGRESS_ARCHIVE_BATCH = int(os.environ.get("PROGRESS_ARCHIVE_BATCH", "1000"))
+
+# Платежи: таблица payments разбита на партиции по месяцам created_at
+PAYMENT_PARTITIONS_AHEAD = int(os.environ.get("PAYMENT_PARTITIONS_AHEAD", "2"))  # на сколько месяцев вперед создавать партиции
+PAYMENT_PENDING_RETENTION_DAYS = int(os.environ.get("PAYMENT_PENDING_RETENTION_DAYS", "14"))  # pending старше - expired
+PAYMENT_LOOKUP_DAYS = int(os.environ.get("PAYMENT_LOOKUP_DAYS", "30"))  # платеж по payment_id сначала ищем за этот срок
+PAYMENTS_MIGRATION_LOCK_ID = LEADER_LOCK_ID + 2  # перевод payments на партиции выполняет один экземпляр
+
+# Предохранители платежных систем и БД: при недоступности сразу уходим в запасной вариант
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "3"))  # сбоев подряд до размыкания
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30"))  # секунды до пробного запроса
+PAYMENT_CIRCUIT_SLOW_SECONDS = float(os.environ.get("PAYMENT_CIRCUIT_SLOW_SECONDS", "10"))  # запрос дольше - сбой
+DB_CIRCUIT_SLOW_SECONDS = float(os.environ.get("DB_CIRCUIT_SLOW_SECONDS", "5"))  # подключение дольше - сбой
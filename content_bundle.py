@@ -0,0 +1,179 @@
+"""Контент курсов вне кода: исходники content/<курс>.json и скомпилированные бандлы.
+
+Исходник - один файл на курс:
+
+    {"title": "...", "days": [{"day": 1, "messages": ["текст", {"image": "url"}, ...]}]}
+
+Сообщение - строка с Markdown, {"image": url} для картинки или
+{"text": ..., "delay": секунды} / {"image": ..., "delay": ...}, если пауза
+перед сообщением отличается от стандартной.
+
+Компиляция проверяет исходник и приводит дни к формату таблицы
+course_content (messages с пустыми строками на месте картинок, image_urls,
+message_delays), считает хеш каждого дня и всего курса и пишет компактный
+JSON в content/build/. Бандл загружается лениво, при первом обращении.
+Опубликованные в БД бандлы становятся версиями контента (см.
+DatabaseManager.publish_content и /reload_content).
+
+    python content_bundle.py  # компилирует все курсы (шаг сборки)
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content')
+BUILD_DIR = os.path.join(CONTENT_DIR, 'build')
+BUNDLE_FORMAT = 1
+
+# Лимит Telegram на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+class ContentError(ValueError):
+    """Исходник контента не прошел проверку"""
+
+
+def _hash(data):
+    canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _compile_day(day, expected_number):
+    number = day.get('day')
+    if number != expected_number:
+        raise ContentError(f"day {expected_number} expected, got {number!r}")
+    source_messages = day.get('messages')
+    if not isinstance(source_messages, list) or not source_messages:
+        raise ContentError(f"day {number}: messages must be a non-empty list")
+
+    messages, image_urls, delays = [], [], []
+    for index, message in enumerate(source_messages):
+        where = f"day {number}, message {index + 1}"
+        delay, is_image = None, False
+        if isinstance(message, dict):
+            delay = message.get('delay')
+            if delay is not None and (not isinstance(delay, (int, float)) or delay < 0):
+                raise ContentError(f"{where}: delay must be a non-negative number")
+            if 'image' in message:
+                if not str(message['image']).startswith(('http://', 'https://')):
+                    raise ContentError(f"{where}: image must be an http(s) URL")
+                image_urls.append(message['image'])
+                message, is_image = "", True
+            else:
+                message = message.get('text')
+        if not isinstance(message, str):
+            raise ContentError(f"{where}: text or image expected")
+        if len(message) > MAX_MESSAGE_LENGTH:
+            raise ContentError(f"{where}: text is longer than {MAX_MESSAGE_LENGTH} characters")
+        if not message.strip() and not is_image:
+            raise ContentError(f"{where}: empty text")
+        messages.append(message)
+        delays.append(delay)
+
+    compiled = {
+        'day_number': number,
+        'messages': messages,
+        'has_images': bool(image_urls),
+        'image_urls': image_urls or None,
+        'message_delays': delays if any(delay is not None for delay in delays) else None,
+    }
+    compiled['hash'] = _hash(compiled)
+    return compiled
+
+
+def compile_source(path):
+    """Проверяет исходник курса и возвращает скомпилированный бандл"""
+    with open(path, 'rb') as f:
+        return compile_bytes(f.read(), os.path.splitext(os.path.basename(path))[0])
+
+
+def compile_bytes(data, name):
+    """То же для исходника в памяти (например, файла, присланного боту)"""
+    try:
+        source = json.loads(data)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ContentError(f"{name}: invalid JSON: {e}") from e
+
+    days = source.get('days') if isinstance(source, dict) else None
+    if not isinstance(days, list) or not days:
+        raise ContentError(f"{name}: days must be a non-empty list")
+    try:
+        compiled_days = [_compile_day(day, number) for number, day in enumerate(days, start=1)]
+    except (ContentError, AttributeError, TypeError) as e:
+        raise ContentError(f"{name}: {e}") from e
+
+    return {
+        'format': BUNDLE_FORMAT,
+        'name': name,
+        'title': source.get('title', ''),
+        'hash': _hash([day['hash'] for day in compiled_days]),
+        'days': compiled_days,
+    }
+
+
+def source_path(name):
+    return os.path.join(CONTENT_DIR, f'{name}.json')
+
+
+def bundle_path(name):
+    return os.path.join(BUILD_DIR, f'{name}.json')
+
+
+def build(name):
+    """Компилирует курс и записывает бандл в content/build/"""
+    bundle = compile_source(source_path(name))
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    tmp_path = bundle_path(name) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, bundle_path(name))
+    return bundle
+
+
+@lru_cache(maxsize=None)
+def load_bundle(name='course'):
+    """Скомпилированный бандл курса; если его нет или исходник новее - компилирует заново"""
+    source, compiled = source_path(name), bundle_path(name)
+    try:
+        if os.path.getmtime(compiled) >= os.path.getmtime(source):
+            with open(compiled, encoding='utf-8') as f:
+                bundle = json.load(f)
+            if bundle.get('format') == BUNDLE_FORMAT:
+                return bundle
+    except (OSError, ValueError):
+        pass
+
+    logger.info("🔄 Compiling content bundle %s", name)
+    try:
+        return build(name)
+    except OSError:
+        # Каталог только для чтения - компилируем в память
+        return compile_source(source)
+
+
+def reload_bundle(name='course'):
+    """Перекомпилирует курс из исходника на диске, минуя кеш load_bundle"""
+    load_bundle.cache_clear()
+    return load_bundle(name)
+
+
+def main():
+    names = sorted(
+        os.path.splitext(filename)[0] for filename in os.listdir(CONTENT_DIR) if filename.endswith('.json')
+    )
+    for name in names:
+        try:
+            bundle = build(name)
+        except ContentError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ {name}: {len(bundle['days'])} days, hash {bundle['hash'][:12]}")
+
+
+if __name__ == '__main__':
+    main()
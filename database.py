@@ -1,693 +1,1410 @@
-import os
-import logging
-from datetime import datetime, date, timedelta
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import json
-
-logger = logging.getLogger(__name__)
-class DatabaseManager:
-    def __init__(self):
-        self.database_url = os.environ.get('DATABASE_URL')
-    
-    def get_connection(self):
-        """Создает соединение с PostgreSQL с повторными попытками"""
-        import psycopg2
-        from psycopg2.extras import RealDictCursor
-        import time
-        
-        max_retries = 3
-        retry_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                conn = psycopg2.connect(
-                    self.database_url,
-                    sslmode='require',
-                    connect_timeout=10,
-                    keepalives=1,
-                    keepalives_idle=30,
-                    keepalives_interval=10,
-                    keepalives_count=5
-                )
-                return conn
-            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
-                if attempt < max_retries - 1:
-                    logging.warning(f"⚠️ Database connection attempt {attempt + 1} failed: {e}")
-                    logging.info(f"🔄 Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Экспоненциальная задержка
-                else:
-                    logging.error(f"❌ Failed to connect to database after {max_retries} attempts: {e}")
-                    raise
-            except Exception as e:
-                logging.error(f"❌ Unexpected database connection error: {e}")
-                raise
-    
-    def init_database(self):
-        """Инициализация таблиц в базе данных"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            
-            # Таблица пользователей 
-            cursor.execute(f'''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    email TEXT,
-                    registered_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    phone TEXT
-                )
-            ''')
-
-            # Таблица контента курса
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS course_content (
-                    day_number INTEGER PRIMARY KEY,
-                    messages JSONB NOT NULL,
-                    has_images BOOLEAN DEFAULT FALSE,
-                    image_urls TEXT[]
-                )
-            ''')
-            
-            # Таблица для марафона
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS marathon_content (
-                    id SERIAL PRIMARY KEY,
-                    messages JSONB NOT NULL
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS marathon_purchases (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT REFERENCES users(user_id),
-                    payment_id VARCHAR(100) UNIQUE,
-                    start_date DATE,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS course_progress (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT UNIQUE REFERENCES users(user_id),
-                    current_day INTEGER DEFAULT 1,
-                    last_message_date TIMESTAMP,  -- Изменили last_message_time на last_message_date
-                    is_active BOOLEAN DEFAULT TRUE,
-                    completed_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            conn.commit()
-            
-            # Заполняем контент курса если пусто
-            self.initialize_course_content()
-            
-            logger.info("✅ Database tables created/verified")
-            
-        except Exception as e:
-            logger.error(f"❌ Error initializing database: {e}")
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
-
-    def initialize_course_content(self):
-        """Инициализирует контент 7-дневного курса с правильной структурой"""
-        print("🔄 Начинаю инициализацию контента курса...")  # Добавим print для отладки
-    
-        conn = self.get_connection()
-        if not conn:
-            print("❌ Нет подключения к БД")
-            return
-        
-        try:
-            cursor = conn.cursor()
-            
-            # Сначала проверяем, есть ли уже контент
-            cursor.execute("SELECT COUNT(*) FROM course_content")
-            count = cursor.fetchone()[0]
-            
-            print(f"📊 Найдено записей в course_content: {count}")
-            
-            if count == 0:
-                print("📝 Создаю контент для дня 1...")
-                
-                # День 1 - 3 сообщения
-                day1_messages = [
-                    # Сообщение 1
-                    "👋 **Здравствуйте! Сегодня — День 1 нашего путешествия: Разбуди своего Мечтателя!**\n\n"
-                    "Внутри каждого из нас живет **Внутренний Ребенок.** Именно эта часть личности умеет мечтать по-настоящему. 👶\n\n"
-                    "Чем свободнее Внутренний Ребенок, тем легче нам мечтать и наполнять желания **энергией** для их реализации.",
-                    
-                    # Сообщение 2
-                    "✨ **Задание Дня: Создаем Базовый Список Желаний**\n"
-                    "Приготовьте **ручку и лист бумаги.** 📝\n\n"
-                    "Сядьте удобно, расслабьтесь. Представьте своего **Внутреннего Мечтателя,** погрузитесь в это состояние.\n\n"
-                    "Начинайте записывать **всё, что вспомните.** НЕ включайте логику и здравый смысл! Вспомните желания из прошлого, а затем добавьте те, что актуальны сейчас.\n\n"
-                    "**Примеры того, что записываем:**\n"
-                    "• 💖 Желания, связанные с любовью, теплом и заботой.\n"
-                    "• 🤸‍♀️ Потребности (отдых, еда, активность).\n"
-                    "• 🏆 Цели, достижения и материальные желания.\n"
-                    "• 🌍 Новые впечатления и познание мира.",
-                    
-                    # Сообщение 3
-                    "✍️ **Напоминание:**\n"
-                    "Список можно дополнять, пока вы не получите следующее письмо от меня!\n\n"
-                    "Обязательно **СОХРАНИТЕ ЭТОТ СПИСОК!** Он понадобится вам для выполнения всех последующих заданий курса.\n\n"
-                    "⏰ **До встречи завтра в это же время!**"
-                ]
-                
-                cursor.execute(
-                    "INSERT INTO course_content (day_number, messages, has_images) VALUES (%s, %s, %s)",
-                    (1, json.dumps(day1_messages, ensure_ascii=False), False)
-                )
-                
-                # День 2 - 4 сообщения + 2 картинки
-                day2_messages = [
-                    # Сообщение 1
-                    "👋 **Здравствуйте! День 2: Колесо Жизненного Баланса!**\n\n"
-                    "Наша жизнь не может быть гармоничной, если \"проседает\" одна из важных сфер. Это становится серьезным препятствием на пути к реализации желаний.\n\n"
-                    "Чтобы это исправить, нам нужно провести честный **анализ** своей жизни. 🧐\n\n"
-                    "В этом поможет мощный инструмент — **Колесо Жизненного Баланса.** 👇",
-                    
-                    # Сообщение 2 (будет картинка 1)
-                    "",  # Пустое сообщение для картинки
-                    
-                    # Сообщение 3
-                    "🛠️ **Шаг 1. Анализ Сферы (Письменное задание)**\n\n"
-                    "Возьмите ручку и бумагу. Проанализируйте 8 ключевых сфер вашей жизни:\n"
-                    "• **Семья, Здоровье, Финансы, Карьера, Личностный рост, Духовность, Отдых, Отношения.**\n\n"
-                    "Для каждой сферы ответьте на вопросы и **запишите ответы:**\n"
-                    "◾️ **Насколько я удовлетворен(а) этой сферой (от 0 до 10 баллов)?** (0 – совсем не удовлетворен(а), 10 – полностью).\n"
-                    "◾️ **Что конкретно нужно предпринять для улучшения в ближайшее время?**\n\n"
-                    "**Будьте предельно честны с собой!**",
-                    
-                    # Сообщение 4
-                    "📊 **Шаг 2. Визуализация и Корректировка**\n\n"
-                    "Нарисуйте или распечатайте пустой бланк Колеса Баланса.\n\n"
-                    "Заполните и закрасьте сектора в соответствии с баллами (от 0 до 10). Цвет сферы выбирайте интуитивно, он может быть любым.\n\n"
-                    "❓ **Анализ:** Посмотрите на колесо: может ли оно катиться, насколько свободно это получается? Если ваше колесо получилось с большими перепадами, внимательно посмотрите на **отстающие сферы.** Перенаправьте энергию и ресурсы со сфер с высокими баллами на проседающие.\n\n"
-                    "➡️ **Корректировка Списка Желаний**\n"
-                    "Вернитесь к своему списку желаний (из Дня 1). Дополните его новыми пунктами: **что поможет улучшить \"проседающие\" сферы?**\n\n"
-                    "**Например,** если проседает \"Здоровье\", добавьте: \"Прохожу обследование у врача до конца месяца.\" 🩺\n\n"
-                    "⏰ **До встречи завтра в это же время!**",
-                    
-                    # Сообщение 5 (будет картинка 2)
-                    ""  # Пустое сообщение для картинки
-                ]
-                
-                day2_images = [
-                    "https://ibb.co/svHv7mrc",
-                    "https://ibb.co/tpt2TWst"
-                ]
-                
-                cursor.execute(
-                    """INSERT INTO course_content (day_number, messages, has_images, image_urls) 
-                    VALUES (%s, %s, %s, %s)""",
-                    (2, json.dumps(day2_messages, ensure_ascii=False), True, day2_images)
-                )
-                
-                # День 3 - 3 сообщения
-                day3_messages = [
-                    # Сообщение 1
-                    "👋 **Здравствуйте! Сегодня — День 3: Расстановка приоритетов!**\n\n"
-                    "Чтобы отсеять навязанные желания, мы проведем мощное упражнение: **\"Мой Последний День\".**\n\n"
-                    "Сядьте удобно, расслабьтесь. Представьте: **завтра — ваш последний день.** У вас есть **все необходимые ресурсы.**\n\n"
-                    "Опишите этот день на бумаге, ответив на вопросы:\n"
-                    "🔸 **Чем вы его наполните?**\n"
-                    "🔸 **С кем и как проведете время?**\n"
-                    "🔸 **Что приобретет первостепенный смысл?**\n"
-                    "🔸 **Что точно не станете делать?**",
-                    
-                    # Сообщение 2
-                    "⚡️ **Осознания и Выводы**\n\n"
-                    "После того как вы опишете день, подумайте над своими сожалениями:\n"
-                    "▪️ **О чем вы будете сожалеть в своей прошедшей жизни:** поступках, **отложенных в долгий ящик** делах, мечтах?\n"
-                    "▪️ **Как вы оцените жизнь, которая осталась позади?**\n\n"
-                    "**Запишите ваши осознания.** Что в вашей настоящей жизни **изжило себя?** Чего, наоборот, **не хватает?** Что хочется добавить, чтобы жизнь приносила больше радости?",
-                    
-                    # Сообщение 3
-                    "✂️ **Финальный Отсев**\n\n"
-                    "Возьмите свой список желаний (из Дня 1) и оцените каждое по шкале от **0 до 10 баллов** по степени важности, основываясь на осознаниях этого дня:\n"
-                    "✖️ **0:** Желание полностью потеряло смысл.\n"
-                    "☑️ **10:** Буду реализовывать это желание в первую очередь.\n\n"
-                    "**Действие:**\n"
-                    "🗑️ **Желания, набравшие 5 баллов и менее,** — смело вычеркивайте из списка.\n"
-                    "🌟 **Желания, набравшие 6 баллов и выше,** — это ваш **новый, отфильтрованный список.**\n\n"
-                    "**Помните:** начинайте наполнять вашу жизнь самым важным и нужным для вас!\n\n"
-                    "⏰ **До встречи завтра в это же время!**"
-                ]
-                
-                cursor.execute(
-                    "INSERT INTO course_content (day_number, messages) VALUES (%s, %s)",
-                    (3, json.dumps(day3_messages, ensure_ascii=False))
-                )
-                
-                # День 4 - 3 сообщения
-                day4_messages = [
-                    # Сообщение 1
-                    "👋 **Здравствуйте! Сегодня — День 4: Энергия Мечты!**\n\n"
-                    "После серьезного отсева желаний нам нужна **мощная подпитка.** Самый быстрый способ это сделать — создать **Коллаж Мечты.**\n\n"
-                    "Коллаж — это **визуальный якорь,** который работает на уровне подсознания и напоминает вам о ваших **истинных приоритетах** каждый день.\n\n"
-                    "Мы создадим его, опираясь на **отфильтрованный список желаний** из Дня 3.",
-                    
-                    # Сообщение 2
-                    "✂️ **Практика: Создаем ЦИФРОВОЙ Коллаж**\n\n"
-                    "🔸 **Инструменты:** Вы можете использовать любую программу: **PowerPoint, Canva,** или **простой графический редактор, телефон.**\n"
-                    "🔸 **Поиск картинок:** Ищите изображения в **Интернете**, которые максимально **точно отражают** ваше желание (например, \"ощущение покоя\", \"успешный бизнес\").\n"
-                    "🔸 **Личный Якорь (Важно!):**\n"
-                    "Обязательно добавьте свое **фото, которое вам очень нравится** и где вы чувствуете себя сильным/счастливым.\n"
-                    "🔸 **Или добавьте фото человека-примера** (Role model), от которого исходит нужная энергия и который уже достиг желаемого результата.\n\n"
-                    "**Важно:** Изображение должно вызывать у вас **эмоциональный отклик,** а не просто быть красивым.",
-                    
-                    # Сообщение 3
-                    "🖼️ **Где разместить?**\n\n"
-                    "Поставьте готовый коллаж на **заставку** телефона или рабочего стола, чтобы видеть его **минимум два раза в день.**\n\n"
-                    "**Цель этого дня:** создать вдохновляющий образ вашего **желаемого будущего,** чтобы повысить энергию перед переходом к конкретному планированию.\n\n"
-                    "**При желании можно сделать коллаж на бумаге.**\n\n"
-                    "Завтра мы возьмем самые важные желания из коллажа и превратим их в **цели!**\n\n"
-                    "⏰ **До встречи завтра в это же время!**"
-                ]
-                
-                cursor.execute(
-                    "INSERT INTO course_content (day_number, messages) VALUES (%s, %s)",
-                    (4, json.dumps(day4_messages, ensure_ascii=False))
-                )
-                
-                # День 5 - 3 сообщения
-                day5_messages = [
-                    # Сообщение 1
-                    "👋 **Здравствуйте! Сегодня — День 5: От Мечты к Цели!**\n\n"
-                    "Мы переходим от творческого вдохновения (коллаж) к **рациональному планированию.**\n\n"
-                    "Самое время превратить наши самые важные желания в **конкретные, измеримые цели.**\n\n"
-                    "Для этого мы используем эффективный инструмент — **SMART.** Каждая буква обозначает критерий, которому должна соответствовать ваша цель: 👇",
-                    
-                    # Сообщение 2
-                    "📝 **Критерии SMART**\n\n"
-                    "⚡️ **S (Specific/Конкретная):** Что именно вы хотите? (НЕ \"Хочу быть богатым\", а \"Хочу $N денег на счету\").\n"
-                    "⚡️ **M (Measurable/Измеримая):** Как вы поймете, что цель достигнута? (В цифрах, сроках, результатах).\n"
-                    "⚡️ **A (Achievable/Достижимая):** Реалистична ли она в данных условиях и ресурсах? (Должна быть сложной, но не фантастической).\n"
-                    "⚡️ **R (Relevant/Значимая):** Ваша ли это цель? Соответствует ли она вашим жизненным ценностям?\n"
-                    "⚡️ **T (Time-bound/Ограниченная во времени):** К какому конкретному сроку это должно быть сделано? (Дата/месяц/год).\n\n"
-                    "**Важно!** Цель должна быть сформулирована **в утвердительной форме** (без частицы \"НЕ\") и **от первого лица** (\"Я получаю...\").",
-                    
-                    # Сообщение 3
-                    "✅ **Задание Дня: Перевод в Цели**\n\n"
-                    "▪️ **Выберите 3-5 самых важных** желаний из вашего отфильтрованного списка (или прямо из коллажа).\n"
-                    "▪️ **Перепишите их,** используя все **5 критериев SMART.**\n"
-                    "▪️ **Зафиксируйте** их на отдельном листе бумаги.\n\n"
-                    "**Пример:** НЕ \"Начать больше заниматься спортом\", а **\"Я хожу в бассейн два раза в неделю (Пн, Чт) в течение 6 месяцев, начиная с 1 декабря 2025 года.\"** 🏊‍♀️\n\n"
-                    "Это — ваш **фундамент** для завтрашнего плана действий!\n\n"
-                    "⏰ **До встречи завтра в это же время!**"
-                ]
-                
-                cursor.execute(
-                    "INSERT INTO course_content (day_number, messages) VALUES (%s, %s)",
-                    (5, json.dumps(day5_messages, ensure_ascii=False))
-                )
-                
-                # День 6 - 3 сообщения
-                day6_messages = [
-                    # Сообщение 1
-                    "👋 **Здравствуйте! Сегодня — День 6: Действие и Обеспечение!**\n\n"
-                    "Самое время составить **конкретный, реалистичный план** для ваших главных **SMART-целей.** Цель без ресурсов — это мечта. Цель с ресурсами и шагами — это план.\n\n"
-                    "Мы объединим два элемента:\n"
-                    "☑️ **Декомпозиция:** Разбить цель на мелкие шаги.\n"
-                    "☑️ **Обеспечение:** Определить, что нужно для каждого шага.\n\n"
-                    "Нам нужен **План Первых 72 Часов** для создания намерения и попутного ветра.\n\n"
-                    "**Правило 72 часов гласит:** если вы не предприняли первый шаг в течение 72 часов после принятия решения, вероятность достижения цели падает почти до нуля. 📉",
-                    
-                    # Сообщение 2
-                    "📝 **Задание Дня: Интегрированный План**\n\n"
-                    "✔️ **Выберите главные SMART-цели** из Дня 5.\n"
-                    "✔️ **Разбейте их на мельчайшие, простые шаги.** Помните: первый шаг должен быть таким, чтобы его было **невозможно не сделать.**\n"
-                    "✔️ **Для каждого шага пропишите,** какой **ресурс** вам понадобится (Финансы, Время, Человеческий фактор, Энергия).\n\n"
-                    "**ПРИМЕР (Цель: Начать бегать 3 раза в неделю):**\n"
-                    "▪️ **Шаг 1:** Купить удобные кроссовки. **Ресурс:** Деньги.\n"
-                    "▪️ **Шаг 2:** Найти в Интернете маршрут для 20-минутной пробежки. **Ресурс:** Время (15 минут).\n"
-                    "▪️ **Шаг 3:** Выйти на улицу и пройти этот маршрут быстрым шагом. **Ресурс:** Энергетический (начальный импульс).",
-                    
-                    # Сообщение 3
-                    "✅ **Ваш Финальный План**\n\n"
-                    "Составьте четкую последовательность из **3-х шагов на ближайшие 72 часа,** включая нужные ресурсы.\n\n"
-                    "**Сделайте Шаг 1 сразу после прочтения этого сообщения!** 🚀 Не откладывайте старт, это создает **инерцию.**\n\n"
-                    "Это самый важный день курса. Вы готовы переходить от планов к реальности!\n\n"
-                    "⏰ **До встречи завтра на финальном дне!**"
-                ]
-                
-                cursor.execute(
-                    "INSERT INTO course_content (day_number, messages) VALUES (%s, %s)",
-                    (6, json.dumps(day6_messages, ensure_ascii=False))
-                )
-                
-                # День 7 - 3 сообщения
-                day7_messages = [
-                    # Сообщение 1
-                    "👋 **Здравствуйте! Сегодня — День 7: Финал и Обязательство!**\n\n"
-                    "Вы прошли огромный путь:\n"
-                    "☑️ **Разбудили Мечтателя** (День 1).\n"
-                    "☑️ **Навели порядок** в жизни (День 2).\n"
-                    "☑️ **Отфильтровали лишнее** (День 3).\n"
-                    "☑️ **Вдохновились коллажем** (День 4).\n"
-                    "☑️ **Сформулировали SMART-цели** (День 5).\n"
-                    "☑️ **Создали План Действий** (День 6).\n\n"
-                    "Теперь, когда план готов, нам нужна **МЕНТАЛЬНАЯ ЗАЩИТА** — опора против сомнений и отката назад. 🛡️",
-                    
-                    # Сообщение 2
-                    "📝 **Создаем Мантру-Защиту**\n\n"
-                    "На пути к цели обязательно будут трудности и моменты, когда захочется все бросить. В этот момент вам понадобится **сильная фраза,** возвращающая к вашему обязательству.\n\n"
-                    "Выберите **2-3 самые важные цели** и создайте для них **личную аффирмацию/мантру:**\n"
-                    "▪️ **Она должна быть короткой и утвердительной** (\"Я могу\", \"Я делаю\").\n"
-                    "▪️ **Она должна быть в настоящем времени** (\"Я уверенно иду к своей цели\").\n"
-                    "▪️ **Она должна вызывать чувство силы.**\n\n"
-                    "**ПРИМЕРЫ:**\n"
-                    "✨ **Для уверенности:** \"Моя энергия растет каждый день, я легко преодолеваю препятствия.\"\n"
-                    "🚀 **Для действия:** \"Я уверенно иду к своей цели, каждый день приближая ее.\"\n"
-                    "💖 **Для ценности:** \"Я достойна больших целей, и ресурсы приходят ко мне легко и своевременно.\"\n\n"
-                    "**Задание:** Запишите вашу мантру и **произнесите ее трижды прямо сейчас,** глядя на свой коллаж.",
-                    
-                    # Сообщение 3
-                    "✍️ **Ритуал Личного Обязательства**\n\n"
-                    "Ваш план теперь не просто список, это **контракт с самим собой.** Проведите символический ритуал:\n"
-                    "⚡️ **Возьмите** свой **План Действий** (День 6).\n"
-                    "⚡️ **Прочитайте** его вслух.\n"
-                    "⚡️ **Положите руку на сердце** и **торжественно** произнесите: **\"Я беру на себя обязательство довести этот план до конца!\"**\n\n"
-                    "**Важно:** Курс окончен, но **ваше путешествие только начинается!** Продолжайте совершать Шаг 1, Шаг 2 и Шаг 3, создавая инерцию.\n\n"
-                    "Спасибо, что выбрали **\"Путь к мечте\".** Я верю в вас! Удачи на пути к реализации ваших целей! 🚀"
-                ]
-                
-                cursor.execute(
-                    "INSERT INTO course_content (day_number, messages) VALUES (%s, %s)",
-                    (7, json.dumps(day7_messages, ensure_ascii=False))
-                )
-                
-                conn.commit()
-                logger.info("✅ Course content initialized with proper structure")
-                
-        except Exception as e:
-            logger.error(f"❌ Error initializing course content: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
-
-    def get_or_create_user(self, user_id: int, username: str, 
-                          first_name: str, last_name: str) -> bool:
-        """Создает или получает пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            username = username or ""
-            first_name = first_name or "Пользователь"
-            last_name = last_name or ""
-            
-            cursor.execute('''
-                INSERT INTO users (user_id, username, first_name, last_name, registered_date)
-                VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (user_id) DO NOTHING
-            ''', (user_id, username, first_name, last_name))
-            
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"❌ Error creating user: {e}")
-            return False
-        finally:
-            conn.close()
-
-    def create_course_purchase(self, user_id, payment_method='paypal'):
-        """Создает запись о покупке курса"""
-        conn = self.get_connection()
-        if conn is None:
-            return False
-        
-        cursor = conn.cursor()
-        try:
-            cursor.execute(
-                '''
-                INSERT INTO course_purchases (user_id, payment_method)
-                VALUES (%s, %s)
-                ''',
-                (user_id, payment_method)
-            )
-            
-            # Создаем запись о прогрессе
-            cursor.execute(
-                '''
-                INSERT INTO course_progress (user_id, current_day, last_message_date)
-                VALUES (%s, 1, CURRENT_TIMESTAMP)
-                ON CONFLICT (user_id) DO UPDATE
-                SET is_active = TRUE,
-                    current_day = 1,
-                    last_message_date = CURRENT_TIMESTAMP
-                ''',
-                (user_id,)
-            )
-            
-            conn.commit()
-            logging.info(f"✅ Course purchase created for user {user_id}")
-            return True
-        except Exception as e:
-            logging.error(f"❌ Error creating course purchase: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
-    
-    def get_users_for_daily_messages(self):
-        """Возвращает пользователей, которым нужно отправить сообщения"""
-        conn = self.get_connection()
-        if conn is None:
-            return []
-        
-        cursor = conn.cursor()
-        try:
-            # Находим пользователей, у которых:
-            # 1. Курс активен (is_active = TRUE)
-            # 2. Прошло более 24 часов с последнего сообщения
-            # 3. Текущий день <= 7 (если 7+ дней - курс завершен)
-            cursor.execute('''
-                SELECT cp.user_id, cp.current_day
-                FROM course_progress cp
-                WHERE cp.is_active = TRUE
-                  AND cp.current_day <= 7
-                  AND (
-                    cp.last_message_date IS NULL
-                    OR cp.last_message_date < NOW() - INTERVAL '24 hours'
-                  )
-            ''')
-            
-            users = cursor.fetchall()
-            return users
-            
-        except Exception as e:
-            logging.error(f"❌ Error getting users for daily messages: {e}")
-            return []
-        finally:
-            conn.close()
-    
-    def get_course_content(self, day_number: int):
-        """Получает контент для конкретного дня курса"""
-        print(f"🔄 Запрашиваю контент дня {day_number}")
-        
-        conn = self.get_connection()
-        if not conn:
-            print("❌ Нет подключения к БД")
-            return None
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT messages, has_images, image_urls FROM course_content WHERE day_number = %s",
-                (day_number,)
-            )
-            result = cursor.fetchone()
-            
-            if result:
-                print(f"✅ Найден контент дня {day_number}")
-                messages = result[0]
-                has_images = result[1]
-                image_urls = result[2] if result[2] else []
-                
-                # Проверяем тип messages
-                print(f"📋 Тип messages: {type(messages)}")
-                
-                # Если messages это строка (JSON), парсим ее
-                if isinstance(messages, str):
-                    try:
-                        messages_list = json.loads(messages)
-                        print(f"✅ JSON распарсен, {len(messages_list)} сообщений")
-                    except Exception as e:
-                        print(f"❌ Ошибка парсинга JSON: {e}")
-                        messages_list = [messages]  # Используем как одно сообщение
-                elif isinstance(messages, list):
-                    messages_list = messages
-                else:
-                    print(f"⚠️ Неизвестный тип messages: {type(messages)}")
-                    messages_list = [str(messages)]
-                
-                return {
-                    'messages': messages_list,
-                    'has_images': has_images,
-                    'image_urls': image_urls
-                }
-            else:
-                print(f"❌ Контент дня {day_number} не найден в БД")
-                return None
-                
-        except Exception as e:
-            print(f"❌ Ошибка получения контента дня {day_number}: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
-        finally:
-            conn.close()
-
-    def update_user_progress(self, user_id, day_number):
-        """Обновляет прогресс пользователя после отправки сообщений"""
-        conn = self.get_connection()
-        if conn is None:
-            return False
-        
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                UPDATE course_progress
-                SET current_day = %s,
-                    last_message_date = CURRENT_TIMESTAMP
-                WHERE user_id = %s
-            ''', (day_number + 1, user_id))  # Переходим к следующему дню
-            
-            # Если день 7 завершен, отмечаем курс как неактивный
-            if day_number >= 7:
-                cursor.execute('''
-                    UPDATE course_progress
-                    SET is_active = FALSE
-                    WHERE user_id = %s
-                ''', (user_id,))
-            
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"❌ Error updating user progress: {e}")
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
-
-    def create_payment(self, user_id, payment_id, amount, currency, payment_method):
-        """Создает запись о платеже"""
-        conn = self.get_connection()
-        if not conn:
-            return False
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO payments (user_id, payment_id, amount, currency, payment_method, status)
-                VALUES (%s, %s, %s, %s, %s, 'pending')
-            ''', (user_id, payment_id, amount, currency, payment_method))
-            conn.commit()
-            return True
-        except Exception as e:
-            logging.error(f"❌ Error creating payment: {e}")
-            return False
-        finally:
-            conn.close()
-
-    def update_payment_status(self, payment_id, status):
-        """Обновляет статус платежа"""
-        conn = self.get_connection()
-        if not conn:
-            return False
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE payments 
-                SET status = %s, completed_at = CURRENT_TIMESTAMP 
-                WHERE payment_id = %s
-            ''', (status, payment_id))
-            
-            if cursor.rowcount > 0:
-                conn.commit()
-                # Получаем user_id для отправки уведомления
-                cursor.execute('SELECT user_id FROM payments WHERE payment_id = %s', (payment_id,))
-                user_id = cursor.fetchone()[0]
-                return user_id
-            return None
-        except Exception as e:
-            logging.error(f"❌ Error updating payment: {e}")
-            return None
-        finally:
-            conn.close()
-
-    def get_user_payment_status(self, user_id):
-        """Проверяет, есть ли успешный платеж у пользователя"""
-        conn = self.get_connection()
-        if not conn:
-            return False
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT status FROM payments 
-                WHERE user_id = %s AND status = 'success'
-                ORDER BY created_at DESC LIMIT 1
-            ''', (user_id,))
-            result = cursor.fetchone()
-            return result is not None
-        except Exception as e:
-            logging.error(f"❌ Error checking payment: {e}")
-            return False
-        finally:
-            conn.close()
-
-    def is_course_active(self, user_id):
-        """Проверяет, активен ли курс у пользователя"""
-        conn = self.get_connection()
-        if not conn:
-            return False
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT is_active FROM course_progress 
-                WHERE user_id = %s 
-                AND is_active = TRUE
-            ''', (user_id,))
-            
-            return cursor.fetchone() is not None
-        except Exception as e:
-            logging.error(f"Error checking course status: {e}")
-            return False
-        finally:
-            conn.close()
-
-    @staticmethod
-    def markdown_to_html(text):
-        """Конвертирует Markdown в HTML для Telegram"""
-        if not text:
-            return text
-        
-        import re
-        
-        # **жирный** -> <b>жирный</b>
-        text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-        # *курсив* -> <i>курсив</i>
-        text = re.sub(r'\*(.+?)\*', r'<i>\1</i>', text, flags=re.DOTALL)
-        # `код` -> <code>код</code>
-        text = re.sub(r'`(.+?)`', r'<code>\1</code>', text)
-        # [текст](ссылка) -> <a href="ссылка">текст</a>
-        text = re.sub(r'\[(.+?)\]\((.+?)\)', r'<a href="\2">\1</a>', text)
-        
-        return text
-
+import os
+import logging
+from datetime import datetime, date, timedelta
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+import json
+import re
+import threading
+import time
+import uuid
+from functools import lru_cache
+import psycopg2.errors
+import psycopg2.extensions
+from config import (
+    SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN, DB_SSLMODE,
+    CONTENT_CHECK_INTERVAL, CONTENT_KEEP_VERSIONS, CONTENT_PUBLISH_LOCK_ID,
+    PAYMENT_LOOKUP_DAYS, PAYMENT_PARTITIONS_AHEAD, PAYMENTS_MIGRATION_LOCK_ID
+)
+from circuit_breaker import db_circuit, CircuitOpenError, CLOSED
+from content_bundle import load_bundle
+from metrics import timed_db, DB_STATEMENT_DURATION, DB_STATEMENT_ROWS, DB_SLOW_STATEMENTS
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед сообщением дня, если в контенте она не задана (секунды)
+DEFAULT_MESSAGE_DELAY = 1.0
+
+# EXPLAIN для одного и того же запроса пишем не чаще раза в 5 минут
+EXPLAIN_INTERVAL = 300
+_last_explain = {}
+
+
+def _month_start(day, months=0):
+    """Первое число месяца, отстоящего от day на months месяцев"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+@lru_cache(maxsize=512)
+def fingerprint(query):
+    """Нормализует SQL: литералы заменяются на ?, списки значений сворачиваются"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    text = re.sub(r"'(?:[^']|'')*'", '?', query)
+    text = re.sub(r'\b\d+(?:\.\d+)?\b', '?', text)
+    text = text.replace('%s', '?')
+    text = re.sub(r'\s+', ' ', text).strip()
+    # execute_values: VALUES (?, ?), (?, ?), ... -> VALUES (...)
+    text = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+', '(...)', text)
+    return text[:200]
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Курсор, который замеряет каждый запрос и пишет медленные в лог с планом.
+
+    Подключается через cursor_factory в get_connection, поэтому через него
+    проходят все запросы бота, включая хендлеры и платежи.
+    """
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, vars, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, None, time.perf_counter() - start)
+
+    def _record(self, query, vars, duration):
+        statement = fingerprint(query)
+        DB_STATEMENT_DURATION.observe(duration, statement=statement)
+        if self.rowcount > 0:
+            DB_STATEMENT_ROWS.inc(self.rowcount, statement=statement)
+
+        if duration * 1000 < SLOW_QUERY_MS:
+            return
+        DB_SLOW_STATEMENTS.inc(statement=statement)
+        logger.warning(
+            f"🐢 Slow query ({duration * 1000:.0f} ms, {self.rowcount} rows): {statement}"
+        )
+        if SLOW_QUERY_EXPLAIN:
+            self._explain(query, vars, statement)
+
+    def _explain(self, query, vars, statement):
+        """Пишет в лог план медленного запроса (без ANALYZE - запрос не выполняется повторно)"""
+        text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else query
+        if not re.match(r'\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b', text, re.IGNORECASE):
+            return
+        if self.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return
+        now = time.monotonic()
+        if now - _last_explain.get(statement, 0) < EXPLAIN_INTERVAL:
+            return
+        _last_explain[statement] = now
+
+        # EXPLAIN идет в транзакции вызывающего кода: ошибка в нем не должна ее прервать
+        savepoint = not self.connection.autocommit
+        # Отдельный обычный курсор, чтобы не затереть результаты основного запроса
+        with self.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            try:
+                if savepoint:
+                    cursor.execute('SAVEPOINT slow_query_explain')
+                cursor.execute('EXPLAIN ' + text, vars)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                if savepoint:
+                    cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+                logger.warning(f"🐢 Plan for slow query: {statement}\n{plan}")
+            except Exception as e:
+                logger.warning(f"⚠️ Could not explain slow query: {e}")
+                if savepoint:
+                    try:
+                        cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                    except psycopg2.Error:
+                        pass
+
+
+class DatabaseManager:
+    def __init__(self):
+        self.database_url = os.environ.get('DATABASE_URL')
+        # Кеш активной версии контента курса
+        self._content = None
+        self._content_checked = 0.0
+        self._content_lock = threading.Lock()
+    
+    @timed_db
+    def get_connection(self):
+        """Создает соединение с PostgreSQL с повторными попытками"""
+        max_retries = 3
+        retry_delay = 2
+        
+        for attempt in range(max_retries):
+            try:
+                with db_circuit:
+                    conn = psycopg2.connect(
+                        self.database_url,
+                        sslmode=DB_SSLMODE,
+                        connect_timeout=10,
+                        cursor_factory=TimedCursor,
+                        keepalives=1,
+                        keepalives_idle=30,
+                        keepalives_interval=10,
+                        keepalives_count=5
+                    )
+                return conn
+            except CircuitOpenError as e:
+                # БД недавно была недоступна - не ждем повторов, вызывающий код обработает как сбой подключения
+                raise psycopg2.OperationalError(str(e)) from e
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                if attempt < max_retries - 1 and db_circuit.state == CLOSED:
+                    logging.warning(f"⚠️ Database connection attempt {attempt + 1} failed: {e}")
+                    logging.info(f"🔄 Retrying in {retry_delay} seconds...")
+                    time.sleep(retry_delay)
+                    retry_delay *= 2  # Экспоненциальная задержка
+                else:
+                    logging.error(f"❌ Failed to connect to database after {attempt + 1} attempts: {e}")
+                    raise
+            except Exception as e:
+                logging.error(f"❌ Unexpected database connection error: {e}")
+                raise
+    
+    @timed_db
+    def init_database(self):
+        """Инициализация таблиц в базе данных"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            
+            # Таблица пользователей 
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id BIGINT PRIMARY KEY,
+                    username TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    email TEXT,
+                    registered_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    phone TEXT
+                )
+            ''')
+
+            # Таблица контента курса
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS course_content (
+                    day_number INTEGER PRIMARY KEY,
+                    messages JSONB NOT NULL,
+                    has_images BOOLEAN DEFAULT FALSE,
+                    image_urls TEXT[]
+                )
+            ''')
+            
+            # Паузы перед каждым сообщением дня (NULL - пауза по умолчанию)
+            cursor.execute('''
+                ALTER TABLE course_content
+                ADD COLUMN IF NOT EXISTS message_delays REAL[]
+            ''')
+            
+            # Хеш дня из бандла контента
+            cursor.execute('''
+                ALTER TABLE course_content
+                ADD COLUMN IF NOT EXISTS content_hash TEXT
+            ''')
+            
+            # Версии контента: активна ровно одна, старые хранятся для отката
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS content_versions (
+                    version SERIAL PRIMARY KEY,
+                    bundle_hash TEXT NOT NULL,
+                    is_active BOOLEAN DEFAULT FALSE,
+                    created_by BIGINT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    activated_at TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS content_versions_active_idx
+                ON content_versions (is_active) WHERE is_active
+            ''')
+            
+            # Дни курса хранятся по версиям; строки без версии (0) - контент до версионирования
+            cursor.execute('''
+                ALTER TABLE course_content
+                ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0
+            ''')
+            cursor.execute('''
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'course_content_version_day_pkey') THEN
+                        ALTER TABLE course_content DROP CONSTRAINT IF EXISTS course_content_pkey;
+                        ALTER TABLE course_content
+                            ADD CONSTRAINT course_content_version_day_pkey PRIMARY KEY (version, day_number);
+                    END IF;
+                END $$
+            ''')
+            
+            # Таблица для марафона
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS marathon_content (
+                    id SERIAL PRIMARY KEY,
+                    messages JSONB NOT NULL
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS marathon_purchases (
+                    id SERIAL PRIMARY KEY,
+                    user_id BIGINT REFERENCES users(user_id),
+                    payment_id VARCHAR(100) UNIQUE,
+                    start_date DATE,
+                    is_active BOOLEAN DEFAULT TRUE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS course_progress (
+                    id SERIAL PRIMARY KEY,
+                    user_id BIGINT UNIQUE REFERENCES users(user_id),
+                    current_day INTEGER DEFAULT 1,
+                    last_message_date TIMESTAMP,  -- Изменили last_message_time на last_message_date
+                    is_active BOOLEAN DEFAULT TRUE,
+                    completed_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Очередь сообщений курса: одна строка на сообщение дня
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS course_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    day_number INTEGER NOT NULL,
+                    message_index INTEGER NOT NULL,
+                    payload JSONB NOT NULL,
+                    sent_at TIMESTAMP,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (user_id, day_number, message_index)
+                )
+            ''')
+            
+            # Завершенный прогресс курса переносится сюда фоновой задачей (archive_course_progress)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS course_progress_archive (
+                    id INTEGER PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    current_day INTEGER,
+                    last_message_date TIMESTAMP,
+                    is_active BOOLEAN,
+                    completed_at TIMESTAMP,
+                    created_at TIMESTAMP,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS course_progress_archive_user_idx ON course_progress_archive (user_id)
+            ''')
+            
+            # Частичные индексы только по рабочему набору: планировщик ищет
+            # активных пользователей, которым пора отправить день
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS course_progress_due_idx
+                ON course_progress (last_message_date) WHERE is_active AND current_day <= 7
+            ''')
+            # ... а архивная задача - завершенных
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS course_progress_inactive_idx
+                ON course_progress (id) WHERE NOT is_active
+            ''')
+            
+            # Пользователи, заблокировавшие бота: им ничего не отправляем до нового /start.
+            # Таких немного, поэтому частичный индекс маленький и дешево исключает их из выборок
+            cursor.execute('''
+                ALTER TABLE users
+                ADD COLUMN IF NOT EXISTS is_blocked BOOLEAN NOT NULL DEFAULT FALSE,
+                ADD COLUMN IF NOT EXISTS blocked_at TIMESTAMP
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS users_blocked_idx ON users (user_id) WHERE is_blocked
+            ''')
+            
+            # Рассылки: last_user_id - до какого пользователя дошла отправка
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS broadcasts (
+                    id SERIAL PRIMARY KEY,
+                    audience TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    last_user_id BIGINT NOT NULL DEFAULT 0,
+                    delivered INTEGER NOT NULL DEFAULT 0,
+                    blocked INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    created_by BIGINT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            
+            self._ensure_payments_partitioned(cursor)
+            self._create_payment_partitions(cursor, PAYMENT_PARTITIONS_AHEAD)
+            conn.commit()
+            
+            # Поиск пользователей по username и имени (/check_user). pg_trgm может
+            # быть недоступен без прав суперпользователя - тогда поиск работает без индекса
+            try:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS users_username_trgm_idx
+                    ON users USING gin (lower(username) gin_trgm_ops)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS users_first_name_trgm_idx
+                    ON users USING gin (lower(first_name) gin_trgm_ops)
+                ''')
+                conn.commit()
+            except psycopg2.Error as e:
+                conn.rollback()
+                logger.warning("⚠️ Trigram indexes for user search are not available: %s", e)
+            
+            # Публикуем бандл контента, если он изменился
+            self.initialize_course_content()
+            
+            logger.info("✅ Database tables created/verified")
+            
+        except Exception as e:
+            logger.error(f"❌ Error initializing database: {e}")
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _ensure_payments_partitioned(self, cursor):
+        """Переводит payments на партиции по месяцам created_at.
+
+        Существующая таблица целиком становится партицией payments_legacy
+        (все строки до начала следующего месяца) - данные не копируются.
+        Месяцы после нее создает ensure_payment_partitions, а в
+        payments_default попадают строки, для которых партиции еще нет.
+
+        Уникальный индекс партиционированной таблицы обязан включать ключ
+        партиционирования, поэтому уникальность payment_id держит маленькая
+        непартиционированная таблица payment_ids: create_payment пишет в нее
+        тем же запросом, что и в payments.
+        """
+        # Экземпляры, запущенные одновременно, проверяют и переводят таблицу по очереди
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (PAYMENTS_MIGRATION_LOCK_ID,))
+        cursor.execute("SELECT to_regclass('payment_ids') IS NULL, to_regclass('payments') IS NOT NULL")
+        create_ids, has_payments = cursor.fetchone()
+        if create_ids:
+            cursor.execute("CREATE TABLE payment_ids (payment_id VARCHAR(100) PRIMARY KEY)")
+            if has_payments:
+                cursor.execute('''
+                    INSERT INTO payment_ids (payment_id)
+                    SELECT DISTINCT payment_id FROM payments WHERE payment_id IS NOT NULL
+                    ON CONFLICT DO NOTHING
+                ''')
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('payments')")
+        row = cursor.fetchone()
+        relkind = row[0] if row else None
+        if relkind == 'p':
+            return
+
+        if relkind is None:
+            cursor.execute('''
+                CREATE TABLE payments (
+                    id BIGSERIAL,
+                    user_id BIGINT,
+                    payment_id VARCHAR(100) NOT NULL,
+                    amount DECIMAL(10, 2),
+                    currency VARCHAR(10),
+                    payment_method VARCHAR(50),
+                    status VARCHAR(20) DEFAULT 'pending',
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    completed_at TIMESTAMP
+                ) PARTITION BY RANGE (created_at)
+            ''')
+        else:
+            # Ключ партиционирования не может быть NULL
+            cursor.execute("LOCK TABLE payments IN ACCESS EXCLUSIVE MODE")
+            cursor.execute("UPDATE payments SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+            cursor.execute("ALTER TABLE payments ALTER COLUMN created_at SET NOT NULL")
+            cursor.execute("ALTER TABLE payments RENAME TO payments_legacy")
+            cursor.execute('''
+                CREATE TABLE payments (LIKE payments_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (created_at)
+            ''')
+            cursor.execute(
+                "ALTER TABLE payments ATTACH PARTITION payments_legacy FOR VALUES FROM (MINVALUE) TO (%s)",
+                (_month_start(date.today(), 1),)
+            )
+            logger.info("✅ Payments table converted to monthly partitions")
+
+        # Индексы родителя создаются на всех партициях. Уникальный индекс
+        # обязан включать ключ партиционирования
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS payments_payment_id_idx ON payments (payment_id, created_at)
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS payments_user_idx ON payments (user_id)")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS payments_pending_idx ON payments (created_at) WHERE status = 'pending'
+        ''')
+        cursor.execute("CREATE TABLE IF NOT EXISTS payments_default PARTITION OF payments DEFAULT")
+
+    def _create_payment_partitions(self, cursor, months_ahead):
+        """Создает партиции payments с текущего месяца на months_ahead вперед. Возвращает созданные"""
+        created = []
+        today = date.today()
+        for offset in range(months_ahead + 1):
+            start, end = _month_start(today, offset), _month_start(today, offset + 1)
+            name = f"payments_{start:%Y_%m}"
+            cursor.execute("SELECT to_regclass(%s)", (name,))
+            if cursor.fetchone()[0]:
+                continue
+            cursor.execute("SAVEPOINT payment_partition")
+            try:
+                cursor.execute(
+                    f"CREATE TABLE {name} PARTITION OF payments FOR VALUES FROM (%s) TO (%s)",
+                    (start, end)
+                )
+                created.append(name)
+            except psycopg2.errors.InvalidObjectDefinition:
+                # Месяц уже покрыт payments_legacy
+                cursor.execute("ROLLBACK TO SAVEPOINT payment_partition")
+            except psycopg2.errors.CheckViolation:
+                cursor.execute("ROLLBACK TO SAVEPOINT payment_partition")
+                logger.warning("⚠️ payments_default has rows for %s, partition %s not created", start, name)
+            else:
+                cursor.execute("RELEASE SAVEPOINT payment_partition")
+        return created
+
+    @timed_db
+    def ensure_payment_partitions(self, months_ahead):
+        """Заранее создает партиции payments на ближайшие месяцы"""
+        conn = self.get_connection()
+        try:
+            created = self._create_payment_partitions(conn.cursor(), months_ahead)
+            conn.commit()
+            if created:
+                logger.info("✅ Payment partitions created: %s", ", ".join(created))
+            return len(created)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def execute_recent_payments(self, cursor, query, params):
+        """Выполняет запрос по payment_id сначала только среди платежей за последние дни.
+
+        Последний параметр запроса - нижняя граница created_at (created_at >= %s).
+        Сначала это дата PAYMENT_LOOKUP_DAYS дней назад, и читаются лишь
+        свежие партиции; если ни одна строка не подошла, запрос
+        повторяется без ограничения.
+        """
+        cursor.execute(query, (*params, datetime.now() - timedelta(days=PAYMENT_LOOKUP_DAYS)))
+        if cursor.rowcount == 0:
+            cursor.execute(query, (*params, '-infinity'))
+
+    def initialize_course_content(self):
+        """Публикует контент курса из бандла на диске, если такой бандл еще не публиковался.
+
+        Откат (/reload_content <версия>) и загруженный через бота бандл
+        переживают перезапуск: бандл из сборки публикуется, только когда
+        активной версии нет или он новый.
+        """
+        return self.publish_content(load_bundle('course'), only_new=True)
+
+    @timed_db
+    def publish_content(self, bundle, created_by=None, only_new=False):
+        """Записывает бандл новой версией контента и делает ее активной.
+
+        Возвращает (версия, создана ли новая). Если у активной версии тот же
+        хеш, ничего не пишет; с only_new - и если бандл с этим хешем уже
+        публиковался раньше. Отправки, уже поставленные в очередь, держат
+        тексты в course_outbox и дойдут в старой версии.
+        """
+        conn = self.get_connection()
+        
+        try:
+            cursor = conn.cursor()
+            # Публикации с разных экземпляров идут по очереди
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (CONTENT_PUBLISH_LOCK_ID,))
+            cursor.execute("SELECT version, bundle_hash FROM content_versions WHERE is_active")
+            active = cursor.fetchone()
+            if active and active[1] == bundle['hash']:
+                conn.commit()
+                return active[0], False
+            if active and only_new:
+                cursor.execute("SELECT 1 FROM content_versions WHERE bundle_hash = %s", (bundle['hash'],))
+                if cursor.fetchone():
+                    conn.commit()
+                    return active[0], False
+            
+            cursor.execute(
+                "INSERT INTO content_versions (bundle_hash, created_by) VALUES (%s, %s) RETURNING version",
+                (bundle['hash'], created_by)
+            )
+            version = cursor.fetchone()[0]
+            execute_values(
+                cursor,
+                """INSERT INTO course_content
+                       (version, day_number, messages, has_images, image_urls, message_delays, content_hash)
+                   VALUES %s""",
+                [(
+                    version, day['day_number'], json.dumps(day['messages'], ensure_ascii=False), day['has_images'],
+                    day['image_urls'], day['message_delays'], day['hash']
+                ) for day in bundle['days']],
+                template="(%s, %s, %s, %s, %s::text[], %s::real[], %s)"
+            )
+            self._activate_content(cursor, version)
+            
+            # Старые версии: оставляем CONTENT_KEEP_VERSIONS последних для отката
+            cursor.execute(
+                """DELETE FROM content_versions
+                   WHERE NOT is_active AND version NOT IN (
+                       SELECT version FROM content_versions ORDER BY version DESC LIMIT %s
+                   )""",
+                (CONTENT_KEEP_VERSIONS,)
+            )
+            cursor.execute("DELETE FROM course_content WHERE version NOT IN (SELECT version FROM content_versions)")
+            conn.commit()
+            
+            logger.info("✅ Content version %s published: %s days (bundle %s)",
+                        version, len(bundle['days']), bundle['hash'][:12])
+            self._content_checked = 0.0
+            return version, True
+                
+        except Exception as e:
+            logger.error(f"❌ Error publishing course content: {e}")
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @timed_db
+    def activate_content_version(self, version):
+        """Делает активной ранее опубликованную версию (откат). False - если такой версии нет"""
+        conn = self.get_connection()
+        
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (CONTENT_PUBLISH_LOCK_ID,))
+            cursor.execute("SELECT 1 FROM content_versions WHERE version = %s", (version,))
+            if cursor.fetchone() is None:
+                conn.rollback()
+                return False
+            self._activate_content(cursor, version)
+            conn.commit()
+            logger.info("✅ Content version %s activated", version)
+            self._content_checked = 0.0
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error activating content version {version}: {e}")
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _activate_content(cursor, version):
+        # Уникальный индекс допускает одну активную версию, поэтому сначала
+        # снимаем флаг; в одной транзакции читатели увидят либо старую, либо новую
+        cursor.execute("UPDATE content_versions SET is_active = FALSE WHERE is_active")
+        cursor.execute(
+            "UPDATE content_versions SET is_active = TRUE, activated_at = NOW() WHERE version = %s",
+            (version,)
+        )
+
+    @timed_db
+    def get_content_versions(self, limit=10):
+        """Последние версии контента: (version, bundle_hash, is_active, created_at, activated_at)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT version, bundle_hash, is_active, created_at, activated_at
+                   FROM content_versions ORDER BY version DESC LIMIT %s""",
+                (limit,)
+            )
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    @timed_db
+    def get_or_create_user(self, user_id: int, username: str, 
+                          first_name: str, last_name: str) -> bool:
+        """Создает или получает пользователя"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            username = username or ""
+            first_name = first_name or "Пользователь"
+            last_name = last_name or ""
+            
+            cursor.execute('''
+                INSERT INTO users (user_id, username, first_name, last_name, registered_date)
+                VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE SET is_blocked = FALSE, blocked_at = NULL
+                WHERE users.is_blocked
+            ''', (user_id, username, first_name, last_name))
+            
+            conn.commit()
+            return True
+        except Exception as e:
+            logging.error(f"❌ Error creating user: {e}")
+            return False
+        finally:
+            conn.close()
+
+    @timed_db
+    def create_course_purchase(self, user_id, payment_method='paypal'):
+        """Создает запись о покупке курса"""
+        conn = self.get_connection()
+        if conn is None:
+            return False
+        
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                '''
+                INSERT INTO course_purchases (user_id, payment_method)
+                VALUES (%s, %s)
+                ''',
+                (user_id, payment_method)
+            )
+            
+            # Создаем запись о прогрессе
+            cursor.execute(
+                '''
+                INSERT INTO course_progress (user_id, current_day, last_message_date)
+                VALUES (%s, 1, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE
+                SET is_active = TRUE,
+                    current_day = 1,
+                    last_message_date = CURRENT_TIMESTAMP
+                ''',
+                (user_id,)
+            )
+            
+            conn.commit()
+            logging.info(f"✅ Course purchase created for user {user_id}")
+            return True
+        except Exception as e:
+            logging.error(f"❌ Error creating course purchase: {e}")
+            conn.rollback()
+            return False
+        finally:
+            conn.close()
+    
+    @timed_db
+    def get_users_for_daily_messages(self):
+        """Возвращает пользователей, которым нужно отправить сообщения"""
+        conn = self.get_connection()
+        if conn is None:
+            return []
+        
+        cursor = conn.cursor()
+        try:
+            # Находим пользователей, у которых:
+            # 1. Курс активен (is_active = TRUE)
+            # 2. Прошло более 24 часов с последнего сообщения
+            # 3. Текущий день <= 7 (если 7+ дней - курс завершен)
+            # 4. Бот не заблокирован
+            cursor.execute('''
+                SELECT cp.user_id, cp.current_day
+                FROM course_progress cp
+                WHERE cp.is_active = TRUE
+                  AND cp.current_day <= 7
+                  AND (
+                    cp.last_message_date IS NULL
+                    OR cp.last_message_date < NOW() - INTERVAL '24 hours'
+                  )
+                  AND NOT EXISTS (SELECT 1 FROM users u WHERE u.user_id = cp.user_id AND u.is_blocked)
+            ''')
+            
+            users = cursor.fetchall()
+            return users
+            
+        except Exception as e:
+            logging.error(f"❌ Error getting users for daily messages: {e}")
+            return []
+        finally:
+            conn.close()
+    
+    def get_course_content(self, day_number: int):
+        """Получает контент для конкретного дня курса из активной версии"""
+        content = self._active_content()
+        if content is None:
+            return None
+        
+        day = content['days'].get(day_number)
+        if day is None:
+            logger.error("❌ Контент дня %s не найден в версии %s", day_number, content['version'])
+        return day
+
+    def _active_content(self):
+        """Все дни активной версии из кеша в памяти.
+
+        Номер активной версии сверяется с БД не чаще раза в
+        CONTENT_CHECK_INTERVAL секунд; дни новой версии загружает один поток,
+        остальные ждут его на блокировке, а не идут в БД одновременно.
+        """
+        with self._content_lock:
+            if self._content is not None and time.monotonic() - self._content_checked < CONTENT_CHECK_INTERVAL:
+                return self._content
+            try:
+                self._content = self._load_active_content(self._content)
+            except Exception as e:
+                logger.exception("❌ Ошибка получения контента курса: %s", e)
+                if self._content is None:
+                    return None
+                # Пока БД недоступна, отдаем уже загруженную версию
+            self._content_checked = time.monotonic()
+            return self._content
+
+    @timed_db
+    def _load_active_content(self, current):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT version FROM content_versions WHERE is_active")
+            row = cursor.fetchone()
+            # До первой публикации читаем контент без версии
+            version = row[0] if row else 0
+            if current is not None and current['version'] == version:
+                return current
+            
+            cursor.execute(
+                """SELECT day_number, messages, has_images, image_urls, message_delays
+                   FROM course_content WHERE version = %s""",
+                (version,)
+            )
+            days = {}
+            for day_number, messages, has_images, image_urls, message_delays in cursor.fetchall():
+                # Если messages это строка (JSON), парсим ее
+                if isinstance(messages, str):
+                    try:
+                        messages_list = json.loads(messages)
+                    except Exception as e:
+                        logger.error("❌ Ошибка парсинга JSON дня %s: %s", day_number, e)
+                        messages_list = [messages]  # Используем как одно сообщение
+                elif isinstance(messages, list):
+                    messages_list = messages
+                else:
+                    logger.warning("⚠️ Неизвестный тип messages дня %s: %s", day_number, type(messages))
+                    messages_list = [str(messages)]
+                
+                days[day_number] = {
+                    'messages': messages_list,
+                    'has_images': has_images,
+                    'image_urls': image_urls or [],
+                    'message_delays': message_delays or []
+                }
+            
+            logger.info("📚 Loaded content version %s: %s days", version, len(days))
+            return {'version': version, 'days': days}
+        finally:
+            conn.close()
+
+    @timed_db
+    def update_user_progress(self, user_id, day_number):
+        """Обновляет прогресс пользователя после отправки сообщений"""
+        conn = self.get_connection()
+        if conn is None:
+            return False
+        
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                UPDATE course_progress
+                SET current_day = %s,
+                    last_message_date = CURRENT_TIMESTAMP
+                WHERE user_id = %s
+            ''', (day_number + 1, user_id))  # Переходим к следующему дню
+            
+            # Если день 7 завершен, отмечаем курс как неактивный
+            if day_number >= 7:
+                cursor.execute('''
+                    UPDATE course_progress
+                    SET is_active = FALSE
+                    WHERE user_id = %s
+                ''', (user_id,))
+            
+            conn.commit()
+            return True
+        except Exception as e:
+            logging.error(f"❌ Error updating user progress: {e}")
+            conn.rollback()
+            return False
+        finally:
+            conn.close()
+
+    @timed_db
+    def create_outbox_day(self, user_id, day_number, messages):
+        """Записывает сообщения дня в outbox одной пачкой.
+
+        Уже существующие строки не трогаются, поэтому повторный вызов для того
+        же дня не создает дублей. Возвращает неотправленные строки по порядку:
+        [(outbox_id, payload), ...]
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if messages:
+                execute_values(cursor, '''
+                    INSERT INTO course_outbox (user_id, day_number, message_index, payload)
+                    VALUES %s
+                    ON CONFLICT (user_id, day_number, message_index) DO NOTHING
+                ''', [
+                    (user_id, day_number, index, json.dumps(message, ensure_ascii=False))
+                    for index, message in enumerate(messages)
+                ])
+            cursor.execute('''
+                SELECT id, payload FROM course_outbox
+                WHERE user_id = %s AND day_number = %s AND sent_at IS NULL
+                ORDER BY message_index
+            ''', (user_id, day_number))
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @timed_db
+    def get_unfinished_outbox(self):
+        """Возвращает незавершенные дни из outbox: {(user_id, day_number): [(outbox_id, payload), ...]}"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, day_number, id, payload, sent_at
+                FROM course_outbox
+                ORDER BY user_id, day_number, message_index
+            ''')
+            unfinished = {}
+            for user_id, day_number, outbox_id, payload, sent_at in cursor.fetchall():
+                rows = unfinished.setdefault((user_id, day_number), [])
+                if sent_at is None:
+                    rows.append((outbox_id, payload))
+            return unfinished
+        finally:
+            conn.close()
+
+    @timed_db
+    def mark_outbox_sent(self, outbox_id, error=None):
+        """Отмечает сообщение из outbox как обработанное"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE course_outbox SET sent_at = NOW(), error = %s WHERE id = %s
+            ''', (error, outbox_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    @timed_db
+    def complete_outbox_day(self, user_id, day_number, advance=True):
+        """Завершает день: переводит пользователя на следующий день и очищает outbox.
+
+        Обе операции выполняются в одной транзакции; прогресс меняется только
+        если пользователь все еще на этом дне, так что повтор безопасен.
+        advance=False - только очистить outbox (день не доставлен).
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if advance and day_number < 7:
+                # Переходим к следующему дню
+                cursor.execute('''
+                    UPDATE course_progress 
+                    SET current_day = %s, 
+                        last_message_date = NOW(),
+                        is_active = TRUE
+                    WHERE user_id = %s AND current_day = %s
+                ''', (day_number + 1, user_id, day_number))
+            elif advance:
+                # Завершаем курс
+                cursor.execute('''
+                    UPDATE course_progress 
+                    SET is_active = FALSE,
+                        completed_at = NOW(),
+                        last_message_date = NOW()
+                    WHERE user_id = %s AND current_day = %s
+                ''', (user_id, day_number))
+            
+            cursor.execute(
+                "DELETE FROM course_outbox WHERE user_id = %s AND day_number = %s",
+                (user_id, day_number)
+            )
+            conn.commit()
+            logger.info(f"✅ Progress updated for user {user_id}: day {day_number}")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @timed_db
+    def create_payment(self, user_id, payment_id, amount, currency, payment_method):
+        """Создает запись о платеже"""
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            # Уникальность payment_id держит payment_ids (см. _ensure_payments_partitioned):
+            # платеж вставляется, только если его ID удалось занять
+            cursor.execute('''
+                WITH claimed AS (
+                    INSERT INTO payment_ids (payment_id) VALUES (%s)
+                    ON CONFLICT DO NOTHING
+                    RETURNING payment_id
+                )
+                INSERT INTO payments (user_id, payment_id, amount, currency, payment_method, status)
+                SELECT %s, payment_id, %s, %s, %s, 'pending' FROM claimed
+            ''', (payment_id, user_id, amount, currency, payment_method))
+            if cursor.rowcount == 0:
+                logging.error(f"❌ Payment {payment_id} already exists")
+                return False
+            conn.commit()
+            return True
+        except Exception as e:
+            logging.error(f"❌ Error creating payment: {e}")
+            return False
+        finally:
+            conn.close()
+
+    @timed_db
+    def update_payment_status(self, payment_id, status):
+        """Обновляет статус платежа.
+
+        Возвращает плательщика {'user_id', 'first_name', 'username'} (имя - для
+        уведомления администратора, тем же запросом) или None, если платеж не найден.
+        """
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        try:
+            cursor = conn.cursor()
+            self.execute_recent_payments(cursor, '''
+                WITH updated AS (
+                    UPDATE payments 
+                    SET status = %s, completed_at = CURRENT_TIMESTAMP 
+                    WHERE payment_id = %s AND created_at >= %s
+                    RETURNING user_id
+                )
+                SELECT updated.user_id, u.first_name, u.username
+                FROM updated LEFT JOIN users u ON u.user_id = updated.user_id
+            ''', (status, payment_id))
+            
+            row = cursor.fetchone()
+            if row:
+                conn.commit()
+                return {'user_id': row[0], 'first_name': row[1], 'username': row[2]}
+            return None
+        except Exception as e:
+            logging.error(f"❌ Error updating payment: {e}")
+            return None
+        finally:
+            conn.close()
+
+    @timed_db
+    def get_user_payment_status(self, user_id):
+        """Проверяет, есть ли успешный платеж у пользователя"""
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT status FROM payments 
+                WHERE user_id = %s AND status = 'success'
+                ORDER BY created_at DESC LIMIT 1
+            ''', (user_id,))
+            result = cursor.fetchone()
+            return result is not None
+        except Exception as e:
+            logging.error(f"❌ Error checking payment: {e}")
+            return False
+        finally:
+            conn.close()
+
+    @timed_db
+    def get_pending_payments(self, after=None, limit=100, max_age_hours=48):
+        """Возвращает порцию ожидающих платежей для сверки (keyset по created_at, payment_id)"""
+        conn = self.get_connection()
+        if not conn:
+            return []
+
+        try:
+            cursor = conn.cursor()
+            if after is None:
+                cursor.execute('''
+                    SELECT payment_id, user_id, payment_method, created_at
+                    FROM payments
+                    WHERE status = 'pending'
+                      AND payment_method IN ('yookassa', 'paypal')
+                      AND created_at >= NOW() - make_interval(hours => %s)
+                    ORDER BY created_at, payment_id
+                    LIMIT %s
+                ''', (max_age_hours, limit))
+            else:
+                cursor.execute('''
+                    SELECT payment_id, user_id, payment_method, created_at
+                    FROM payments
+                    WHERE status = 'pending'
+                      AND payment_method IN ('yookassa', 'paypal')
+                      AND created_at >= NOW() - make_interval(hours => %s)
+                      AND (created_at, payment_id) > (%s, %s)
+                    ORDER BY created_at, payment_id
+                    LIMIT %s
+                ''', (max_age_hours, after[0], after[1], limit))
+            return cursor.fetchall()
+        except Exception as e:
+            logging.error(f"❌ Error getting pending payments: {e}")
+            return []
+        finally:
+            conn.close()
+
+    @timed_db
+    def complete_pending_payment(self, payment_id, status):
+        """Переводит ожидающий платеж в финальный статус.
+
+        Возвращает плательщика {'user_id', 'first_name', 'username'}, только если
+        статус действительно изменился, чтобы активация не запускалась повторно
+        для уже обработанного платежа (вебхук, сверка и кнопка проверки
+        активируют курс только через этот переход).
+        """
+        conn = self.get_connection()
+        if not conn:
+            return None
+
+        try:
+            cursor = conn.cursor()
+            self.execute_recent_payments(cursor, '''
+                WITH updated AS (
+                    UPDATE payments
+                    SET status = %s, completed_at = CURRENT_TIMESTAMP
+                    WHERE payment_id = %s AND status = 'pending' AND created_at >= %s
+                    RETURNING user_id
+                )
+                SELECT updated.user_id, u.first_name, u.username
+                FROM updated LEFT JOIN users u ON u.user_id = updated.user_id
+            ''', (status, payment_id))
+            row = cursor.fetchone()
+            conn.commit()
+            return {'user_id': row[0], 'first_name': row[1], 'username': row[2]} if row else None
+        except Exception as e:
+            logging.error(f"❌ Error completing payment: {e}")
+            conn.rollback()
+            return None
+        finally:
+            conn.close()
+
+    @timed_db
+    def is_course_active(self, user_id):
+        """Проверяет, активен ли курс у пользователя"""
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT is_active FROM course_progress 
+                WHERE user_id = %s 
+                AND is_active = TRUE
+            ''', (user_id,))
+            
+            return cursor.fetchone() is not None
+        except Exception as e:
+            logging.error(f"Error checking course status: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def stream_query(self, query, params=None, batch_size=1000):
+        """Читает большой результат серверным курсором, отдавая пачки строк.
+
+        Генератор держит соединение, пока не будет исчерпан или закрыт
+        (close()), поэтому его нужно дочитывать или закрывать явно.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+            cursor.itersize = batch_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    @timed_db
+    def archive_course_progress(self, after_days, batch_size=1000):
+        """Переносит неактивный прогресс старше after_days дней в course_progress_archive.
+
+        Работает пачками по batch_size строк, каждая в своей транзакции,
+        чтобы не держать долгие блокировки. Возвращает число перенесенных строк.
+        """
+        total = 0
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            while True:
+                cursor.execute('''
+                    WITH moved AS (
+                        DELETE FROM course_progress
+                        WHERE id IN (
+                            SELECT id FROM course_progress
+                            WHERE NOT is_active
+                              AND COALESCE(completed_at, last_message_date, created_at)
+                                  < NOW() - make_interval(days => %s)
+                            ORDER BY id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING id, user_id, current_day, last_message_date, is_active, completed_at, created_at
+                    )
+                    INSERT INTO course_progress_archive
+                        (id, user_id, current_day, last_message_date, is_active, completed_at, created_at)
+                    SELECT * FROM moved
+                ''', (after_days, batch_size))
+                moved = cursor.rowcount
+                conn.commit()
+                total += moved
+                if moved < batch_size:
+                    break
+            return total
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @timed_db
+    def expire_pending_payments(self, after_days):
+        """Помечает expired платежи, которые висят в pending дольше after_days дней"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE payments SET status = 'expired'
+                WHERE status = 'pending' AND created_at < NOW() - make_interval(days => %s)
+            ''', (after_days,))
+            conn.commit()
+            return cursor.rowcount
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @timed_db
+    def get_user_summary(self, user_id):
+        """Пользователь, его платежи и прогресс курса одним запросом.
+
+        Возвращает None, если пользователя нет ни в users, ни в платежах,
+        иначе словарь: user (или None), payments (новые первыми), progress (или None).
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT
+                    (SELECT row_to_json(u) FROM (
+                        SELECT username, first_name, last_name, registered_date, is_blocked
+                        FROM users WHERE user_id = %(id)s
+                    ) u),
+                    (SELECT COALESCE(json_agg(p ORDER BY p.created_at DESC), '[]'::json) FROM (
+                        SELECT payment_id, amount, currency, payment_method, status, created_at
+                        FROM payments WHERE user_id = %(id)s
+                    ) p),
+                    (SELECT row_to_json(cp) FROM (
+                        -- Живой прогресс, а если его нет - последний из архива
+                        SELECT current_day, last_message_date, is_active, completed_at FROM (
+                            SELECT 0 AS source, current_day, last_message_date, is_active, completed_at
+                            FROM course_progress WHERE user_id = %(id)s
+                            UNION ALL
+                            (SELECT 1, current_day, last_message_date, is_active, completed_at
+                             FROM course_progress_archive WHERE user_id = %(id)s
+                             ORDER BY archived_at DESC LIMIT 1)
+                            ORDER BY source LIMIT 1
+                        ) latest
+                    ) cp)
+            ''', {'id': user_id})
+            user, payments, progress = cursor.fetchone()
+            if user is None and not payments and progress is None:
+                return None
+            
+            # json отдает даты строками
+            for record, fields in ((user, ('registered_date',)),
+                                   (progress, ('last_message_date', 'completed_at'))):
+                for field in fields:
+                    if record and record.get(field):
+                        record[field] = datetime.fromisoformat(record[field])
+            for payment in payments:
+                if payment['created_at']:
+                    payment['created_at'] = datetime.fromisoformat(payment['created_at'])
+            return {'user': user, 'payments': payments, 'progress': progress}
+        finally:
+            conn.close()
+
+    @timed_db
+    def search_users(self, text, limit=10):
+        """Пользователи, у которых username или имя содержит text: [(user_id, username, first_name)]"""
+        pattern = '%' + text.lower().lstrip('@').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, username, first_name FROM users
+                WHERE lower(username) LIKE %(pattern)s OR lower(first_name) LIKE %(pattern)s
+                ORDER BY registered_date DESC
+                LIMIT %(limit)s
+            ''', {'pattern': pattern, 'limit': limit})
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    @timed_db
+    def set_user_blocked(self, user_id, blocked=True):
+        """Отмечает, что пользователь заблокировал бота (или снимает отметку)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """UPDATE users SET is_blocked = %s, blocked_at = CASE WHEN %s THEN NOW() END
+                   WHERE user_id = %s AND is_blocked <> %s""",
+                (blocked, blocked, user_id, blocked)
+            )
+            conn.commit()
+            if cursor.rowcount:
+                logger.info("🚫 User %s %s", user_id, "blocked the bot" if blocked else "is back")
+        finally:
+            conn.close()
+
+    @timed_db
+    def create_broadcast(self, audience, text, created_by):
+        """Создает рассылку и возвращает ее id"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO broadcasts (audience, text, created_by) VALUES (%s, %s, %s) RETURNING id",
+                (audience, text, created_by)
+            )
+            broadcast_id = cursor.fetchone()[0]
+            conn.commit()
+            return broadcast_id
+        finally:
+            conn.close()
+
+    @timed_db
+    def get_broadcasts(self, broadcast_id=None, status=None, limit=10):
+        """Рассылки (новые первыми) как словари; можно выбрать одну по id или по статусу"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """SELECT * FROM broadcasts
+                   WHERE (%(id)s IS NULL OR id = %(id)s) AND (%(status)s IS NULL OR status = %(status)s)
+                   ORDER BY id DESC LIMIT %(limit)s""",
+                {'id': broadcast_id, 'status': status, 'limit': limit}
+            )
+            columns = [column.name for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    @timed_db
+    def save_broadcast_progress(self, broadcast_id, last_user_id, delivered, blocked, failed, status=None):
+        """Сохраняет, до кого дошла рассылка, прибавляет счетчики и при необходимости меняет статус"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """UPDATE broadcasts
+                   SET last_user_id = GREATEST(last_user_id, %s),
+                       delivered = delivered + %s, blocked = blocked + %s, failed = failed + %s,
+                       status = COALESCE(%s, status),
+                       finished_at = CASE WHEN %s = 'done' THEN NOW() ELSE finished_at END
+                   WHERE id = %s""",
+                (last_user_id, delivered, blocked, failed, status, status, broadcast_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    @timed_db
+    def set_broadcast_status(self, broadcast_id, status, expected=None):
+        """Меняет статус рассылки (если задан expected - только из этого статуса). True - если изменен"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE broadcasts SET status = %s WHERE id = %s AND (%s IS NULL OR status = %s)",
+                (status, broadcast_id, expected, expected)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    @timed_db
+    def count_query(self, query, params=None):
+        """Число строк в результате запроса"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM ({query}) q", params)
+            return cursor.fetchone()[0]
+        finally:
+            conn.close()
+
+    @timed_db
+    def ping(self, timeout=5):
+        """Быстрая проверка доступности БД для /health/ready (без повторных попыток)"""
+        conn = psycopg2.connect(self.database_url, sslmode=DB_SSLMODE, connect_timeout=timeout,
+                                cursor_factory=TimedCursor)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()[0] == 1
+        finally:
+            conn.close()
+
+    @staticmethod
+    def message_delay(content, index):
+        """Пауза перед сообщением дня с номером index (секунды)"""
+        delays = content.get('message_delays') or []
+        if index < len(delays) and delays[index] is not None:
+            return float(delays[index])
+        return 0 if index == 0 else DEFAULT_MESSAGE_DELAY
+
+    @staticmethod
+    def markdown_to_html(text):
+        """Конвертирует Markdown в HTML для Telegram"""
+        if not text:
+            return text
+        
+        import re
+        
+        # **жирный** -> <b>жирный</b>
+        text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
+        # *курсив* -> <i>курсив</i>
+        text = re.sub(r'\*(.+?)\*', r'<i>\1</i>', text, flags=re.DOTALL)
+        # `код` -> <code>код</code>
+        text = re.sub(r'`(.+?)`', r'<code>\1</code>', text)
+        # [текст](ссылка) -> <a href="ссылка">текст</a>
+        text = re.sub(r'\[(.+?)\]\((.+?)\)', r'<a href="\2">\1</a>', text)
+        
+        return text
+
 db = DatabaseManager()
\ No newline at end of file
@@ -0,0 +1,405 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from config import SEND_WORKERS
+from database import db
+from metrics import TELEGRAM_SEND_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+# Классы ошибок доставки
+BLOCKED = 'blocked'                # пользователь заблокировал бота или удалил аккаунт
+CHAT_NOT_FOUND = 'chat_not_found'  # чата нет (неверный id или бот ни разу не писал)
+RATE_LIMITED = 'rate_limited'      # 429, повтор после паузы
+TRANSIENT = 'transient'            # сеть или таймаут, можно повторить позже
+INVALID = 'invalid'                # ошибка в самом сообщении (разметка, картинка)
+
+# После этих ошибок писать пользователю бесполезно, пока он сам не вернется в бота
+UNDELIVERABLE = (BLOCKED, CHAT_NOT_FOUND)
+# Временные сбои: сообщение остается в outbox и отправляется на следующем тике
+RETRYABLE = (RATE_LIMITED, TRANSIENT)
+
+
+def classify_error(error):
+    """Класс ошибки отправки в Telegram"""
+    if isinstance(error, RetryAfter):
+        return RATE_LIMITED
+    if isinstance(error, Forbidden):
+        return BLOCKED
+    if isinstance(error, BadRequest):
+        return CHAT_NOT_FOUND if 'chat not found' in str(error).lower() else INVALID
+    if isinstance(error, NetworkError):
+        return TRANSIENT
+    return INVALID
+
+
+class SendPipeline:
+    """Очередь исходящих сообщений с сохранением порядка внутри каждого чата.
+
+    Хендлер кладет в очередь всю последовательность сообщений и сразу
+    возвращается, а отправкой занимаются общие воркеры. В каждый момент
+    времени сообщения одного чата отправляет только один воркер, поэтому
+    порядок внутри чата сохраняется, а разные чаты обслуживаются параллельно.
+
+    Сообщение - это словарь с параметрами send_message (text, parse_mode,
+    reply_markup) либо send_photo (photo). Необязательный ключ fallback_text
+    отправляется без разметки, если основное сообщение не удалось отправить.
+    Ключ delay задает паузу (в секундах) после отправки предыдущего сообщения
+    этого чата: ожидающий чат хранится как запись в общей куче, а не как
+    спящая корутина.
+    """
+
+    def __init__(self, workers: int = SEND_WORKERS):
+        self.workers = workers
+        self._chats = {}       # chat_id -> deque[(bot, message, sequence, index)]
+        self._ready = None     # очередь чатов, у которых есть что отправить
+        self._delayed = []     # куча (ready_at, seq, chat_id) для отложенных сообщений
+        self._counter = itertools.count()
+        self._wakeup = None
+        self._tasks = []
+        self._pending = 0      # сообщений в очередях (читается и из других потоков)
+
+    def send_sequence(self, bot, chat_id, messages, on_complete=None, on_message=None):
+        """Ставит последовательность сообщений в очередь чата.
+
+        on_message(index, result) вызывается после каждой попытки отправки,
+        on_complete(results) - после отправки всей последовательности;
+        results - список отправленных Message или исключений в исходном порядке.
+        Колбэки могут быть обычными функциями или корутинами.
+        Возвращает future с тем же списком результатов.
+        """
+        self._ensure_started()
+
+        future = asyncio.get_running_loop().create_future()
+        sequence = {
+            'results': [None] * len(messages),
+            'remaining': len(messages),
+            'future': future,
+            'on_complete': on_complete,
+            'on_message': on_message,
+        }
+        if not messages:
+            self._finish(sequence)
+            return future
+
+        queue = self._chats.get(chat_id)
+        is_idle = queue is None
+        if is_idle:
+            queue = self._chats[chat_id] = deque()
+        for index, message in enumerate(messages):
+            queue.append((bot, message, sequence, index))
+        self._pending += len(messages)
+
+        # Чат уже обслуживается - воркер сам заберет новые сообщения
+        if is_idle:
+            self._schedule(chat_id, messages[0].get('delay', 0))
+        return future
+
+    @property
+    def depth(self):
+        """Количество сообщений, ожидающих отправки"""
+        return self._pending
+
+    def _ensure_started(self):
+        """Запускает воркеров и диспетчер отложенных сообщений при первом использовании"""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._ready = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(loop.create_task(self._dispatch_delayed()))
+
+    def _schedule(self, chat_id, delay):
+        """Передает чат воркерам сразу или кладет его в кучу отложенных"""
+        if not delay or delay <= 0:
+            self._ready.put_nowait(chat_id)
+            return
+        ready_at = time.monotonic() + delay
+        heapq.heappush(self._delayed, (ready_at, next(self._counter), chat_id))
+        if self._delayed[0][2] == chat_id:
+            # Новая запись стала ближайшей - будим диспетчер
+            self._wakeup.set()
+
+    async def _dispatch_delayed(self):
+        """Переносит чаты из кучи в очередь воркеров, когда подходит их время"""
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._delayed)
+                self._ready.put_nowait(chat_id)
+
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        """Отправляет по одному сообщению из готовых чатов"""
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._chats[chat_id]
+            bot, message, sequence, index = queue.popleft()
+            self._pending -= 1
+
+            result = await self._deliver(bot, chat_id, message)
+            self._record(sequence, index, result)
+
+            if isinstance(result, Exception) and classify_error(result) in UNDELIVERABLE:
+                self._drop_chat(chat_id, queue, result)
+
+            if queue:
+                # Возвращаем чат в конец очереди (или в кучу, если нужна пауза),
+                # чтобы не задерживать остальные чаты
+                self._schedule(chat_id, queue[0][1].get('delay', 0))
+            else:
+                del self._chats[chat_id]
+
+    async def _deliver(self, bot, chat_id, message):
+        """Отправляет одно сообщение, возвращает Message или исключение"""
+        for attempt in range(2):
+            try:
+                return await self._send(bot, chat_id, message)
+            except RetryAfter as e:
+                TELEGRAM_SEND_ERRORS.inc(kind=RATE_LIMITED)
+                if attempt:
+                    return e
+                logger.warning(f"⏳ Rate limited for chat {chat_id}, retry in {e.retry_after}s")
+                # Редкий случай: ждем внутри воркера, чтобы не нарушить порядок чата
+                await asyncio.sleep(_seconds(e.retry_after))
+            except Exception as e:
+                TELEGRAM_SEND_ERRORS.inc(kind=classify_error(e))
+                fallback_text = message.get('fallback_text')
+                if fallback_text is None or classify_error(e) in UNDELIVERABLE:
+                    logger.error(f"❌ Error sending message to {chat_id}: {e}")
+                    return e
+                # Пробуем отправить без разметки
+                try:
+                    return await bot.send_message(chat_id=chat_id, text=fallback_text, parse_mode=None)
+                except Exception as fallback_error:
+                    logger.error(f"❌ Error sending message to {chat_id}: {fallback_error}")
+                    return fallback_error
+
+    def _drop_chat(self, chat_id, queue, error):
+        """Пользователь недоступен: остальные сообщения чата не отправляем, а отмечаем той же ошибкой"""
+        dropped = 0
+        while queue:
+            _, _, sequence, index = queue.popleft()
+            self._pending -= 1
+            self._record(sequence, index, error)
+            dropped += 1
+        logger.warning(
+            "🚫 Chat %s is unreachable (%s), skipped %s queued messages", chat_id, classify_error(error), dropped
+        )
+        _run_callback(self._flag_unreachable, chat_id)
+
+    @staticmethod
+    async def _flag_unreachable(chat_id):
+        try:
+            await asyncio.to_thread(db.set_user_blocked, chat_id, True)
+        except Exception as e:
+            logger.error(f"❌ Error flagging user {chat_id} as blocked: {e}")
+
+    @staticmethod
+    async def _send(bot, chat_id, message):
+        if 'photo' in message:
+            return await bot.send_photo(chat_id=chat_id, photo=message['photo'])
+        return await bot.send_message(
+            chat_id=chat_id,
+            text=message['text'],
+            parse_mode=message.get('parse_mode'),
+            reply_markup=message.get('reply_markup')
+        )
+
+    def _record(self, sequence, index, result):
+        sequence['results'][index] = result
+        sequence['remaining'] -= 1
+        if sequence['on_message'] is not None:
+            _run_callback(sequence['on_message'], index, result)
+        if sequence['remaining'] == 0:
+            self._finish(sequence)
+
+    def _finish(self, sequence):
+        """Завершает последовательность и вызывает колбэк"""
+        results = sequence['results']
+        if not sequence['future'].done():
+            sequence['future'].set_result(results)
+
+        if sequence['on_complete'] is not None:
+            _run_callback(sequence['on_complete'], results)
+
+
+class CourseOutbox:
+    """Постоянная очередь сообщений курса (таблица course_outbox).
+
+    Когда день ставится в отправку, все его сообщения одной пачкой
+    записываются в БД, а каждое отправленное сообщение отмечается отдельно.
+    Прогресс пользователя обновляется в той же транзакции, что и очистка
+    строк дня, поэтому после перезапуска бот продолжает ровно с того
+    сообщения, на котором остановился, не повторяя уже отправленные.
+    """
+
+    def __init__(self, db, pipeline):
+        self.db = db
+        self.pipeline = pipeline
+        self._in_flight = set()  # пользователи, чей день сейчас отправляется
+
+    def is_in_flight(self, user_id):
+        return user_id in self._in_flight
+
+    @property
+    def depth(self):
+        """Количество пользователей, чей день сейчас отправляется"""
+        return len(self._in_flight)
+
+    async def enqueue_day(self, bot, user_id, day_number, messages, on_day_complete=None):
+        """Записывает день в outbox и ставит неотправленные сообщения в очередь.
+
+        on_day_complete(user_id, day_number, results) вызывается после того,
+        как день отправлен и прогресс обновлен. Возвращает False, если день
+        этого пользователя уже отправляется.
+        """
+        if user_id in self._in_flight:
+            return False
+        self._in_flight.add(user_id)
+
+        try:
+            rows = await asyncio.to_thread(self.db.create_outbox_day, user_id, day_number, messages)
+        except Exception as e:
+            self._in_flight.discard(user_id)
+            logger.error(f"❌ Error writing outbox for user {user_id}, day {day_number}: {e}")
+            return False
+
+        self._send_rows(bot, user_id, day_number, rows, on_day_complete)
+        return True
+
+    async def resume(self, bot, on_day_complete=None):
+        """Досылает дни, отправка которых прервалась (например, при перезапуске)"""
+        unfinished = await asyncio.to_thread(self.db.get_unfinished_outbox)
+
+        resumed = 0
+        for (user_id, day_number), rows in unfinished.items():
+            if user_id in self._in_flight:
+                continue
+            self._in_flight.add(user_id)
+            self._send_rows(bot, user_id, day_number, rows, on_day_complete)
+            resumed += 1
+
+        if resumed:
+            logger.info(f"🔄 Resumed {resumed} unfinished course days from outbox")
+        return resumed
+
+    def _send_rows(self, bot, user_id, day_number, rows, on_day_complete):
+        """rows - неотправленные строки дня: [(outbox_id, payload), ...]"""
+        if not rows:
+            # Все сообщения уже отправлены - осталось завершить день
+            _run_callback(self._complete_day, user_id, day_number, [], on_day_complete)
+            return
+
+        outbox_ids = [outbox_id for outbox_id, _ in rows]
+        self.pipeline.send_sequence(
+            bot,
+            user_id,
+            [payload for _, payload in rows],
+            on_message=lambda index, result: self._mark_sent(outbox_ids[index], result),
+            on_complete=lambda results: self._complete_day(user_id, day_number, results, on_day_complete)
+        )
+
+    async def _mark_sent(self, outbox_id, result):
+        if _is_retryable(result):
+            # Строка остается неотправленной - ее дошлет следующий тик или resume()
+            return
+        error = str(result)[:500] if isinstance(result, Exception) else None
+        try:
+            await asyncio.to_thread(self.db.mark_outbox_sent, outbox_id, error)
+        except Exception as e:
+            logger.error(f"❌ Error marking outbox row {outbox_id}: {e}")
+
+    async def _complete_day(self, user_id, day_number, results, on_day_complete):
+        # Заблокировавший бота пользователь остается на этом дне и получит его,
+        # когда снова напишет боту
+        unreachable = any(
+            isinstance(result, Exception) and classify_error(result) in UNDELIVERABLE for result in results
+        )
+        if not unreachable and any(_is_retryable(result) for result in results):
+            # День не завершаем: недоставленные сообщения остались в outbox,
+            # и планировщик дошлет их на следующем тике
+            self._in_flight.discard(user_id)
+            logger.warning(f"⏳ Day {day_number} for user {user_id} partially delivered, will retry")
+            return
+        try:
+            await asyncio.to_thread(self.db.complete_outbox_day, user_id, day_number, not unreachable)
+        except Exception as e:
+            logger.error(f"❌ Error completing day {day_number} for user {user_id}: {e}")
+            return
+        finally:
+            self._in_flight.discard(user_id)
+
+        if on_day_complete is not None and not unreachable:
+            _run_callback(on_day_complete, user_id, day_number, results)
+
+
+class RateLimiter:
+    """Общий ограничитель частоты отправки (корзина токенов).
+
+    acquire() ждет, пока не появится токен: rate токенов в секунду, не
+    больше burst подряд. Ожидающие обслуживаются по очереди.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _is_retryable(result):
+    return isinstance(result, Exception) and classify_error(result) in RETRYABLE
+
+
+_background_tasks = set()
+
+
+def _run_callback(callback, *args):
+    """Вызывает колбэк; корутины запускаются отдельной задачей"""
+    try:
+        outcome = callback(*args)
+        if asyncio.iscoroutine(outcome):
+            task = asyncio.get_running_loop().create_task(outcome)
+            # Храним ссылку, чтобы задачу не собрал сборщик мусора
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+    except Exception as e:
+        logger.error(f"❌ Error in send callback: {e}")
+
+
+def _seconds(value):
+    """retry_after может быть int или timedelta в зависимости от версии PTB"""
+    return value.total_seconds() if hasattr(value, 'total_seconds') else float(value)
+
+
+send_pipeline = SendPipeline()
+course_outbox = CourseOutbox(db, send_pipeline)
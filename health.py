@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Состояние бота для /health/live и /health/ready.
+
+    Компоненты отмечают события (тик планировщика, ответ getUpdates), а
+    проверки готовности регистрируются как функции. Отчет кэшируется на
+    несколько секунд, чтобы частые пробы не нагружали БД.
+    """
+
+    def __init__(self, cache_ttl: float = 5.0):
+        self.cache_ttl = cache_ttl
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._marks = {}    # событие -> время последнего успеха
+        self._checks = {}   # имя -> fn() -> (ok, details)
+        self._probes = {}   # имя -> fn() -> значение (информационно)
+        self._cached = None
+        self._cached_at = 0.0
+
+    def mark(self, event):
+        """Отмечает успешное событие"""
+        self._marks[event] = time.time()
+
+    def age(self, event):
+        """Сколько секунд прошло с последнего события (None - еще не было)"""
+        marked_at = self._marks.get(event)
+        return None if marked_at is None else round(time.time() - marked_at, 1)
+
+    def add_check(self, name, fn):
+        """Регистрирует проверку, от которой зависит готовность"""
+        self._checks[name] = fn
+
+    def add_probe(self, name, fn):
+        """Регистрирует значение, которое только показывается в отчете"""
+        self._probes[name] = fn
+
+    def check_age(self, event, max_age):
+        """Готовая проверка: событие было не позже max_age секунд назад"""
+        def check():
+            age = self.age(event)
+            return age is not None and age <= max_age, {"age": age, "max_age": max_age}
+        return check
+
+    def liveness(self):
+        return {
+            "status": "alive",
+            "uptime": round(time.time() - self.started_at, 1),
+        }
+
+    def readiness(self):
+        """Отчет о готовности (кэшируется на cache_ttl секунд)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._cached is not None and now - self._cached_at < self.cache_ttl:
+                return self._cached
+
+            report = {"ready": True, "checks": {}, "info": {}}
+            for name, fn in self._checks.items():
+                try:
+                    ok, details = fn()
+                except Exception as e:
+                    ok, details = False, {"error": str(e)}
+                report["checks"][name] = dict(details, ok=ok)
+                report["ready"] = report["ready"] and ok
+
+            for name, fn in self._probes.items():
+                try:
+                    report["info"][name] = fn()
+                except Exception as e:
+                    report["info"][name] = f"error: {e}"
+
+            self._cached = report
+            self._cached_at = now
+            return report
+
+
+class CachedCheck:
+    """Оборачивает дорогую проверку (например, запрос к БД), выполняя ее не чаще раза в ttl секунд"""
+
+    def __init__(self, fn, ttl: float):
+        self.fn = fn
+        self.ttl = ttl
+        self._result = None
+        self._checked_at = 0.0
+
+    def __call__(self):
+        now = time.monotonic()
+        if self._result is None or now - self._checked_at >= self.ttl:
+            try:
+                self._result = (bool(self.fn()), {})
+            except Exception as e:
+                logger.warning(f"⚠️ Health check failed: {e}")
+                self._result = (False, {"error": str(e)[:200]})
+            self._checked_at = now
+        ok, details = self._result
+        return ok, dict(details, checked_ago=round(now - self._checked_at, 1))
+
+
+health_monitor = HealthMonitor()
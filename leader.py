@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать корутину смены роли в event loop бота
+CALL_TIMEOUT = 60
+
+
+class LeaderElection:
+    """Выбор лидера среди экземпляров бота через advisory lock PostgreSQL.
+
+    Лидер держит сессионную блокировку pg_try_advisory_lock на отдельном
+    соединении. Если процесс лидера умирает, соединение закрывается и
+    PostgreSQL снимает блокировку сам - следующий экземпляр захватывает
+    ее при очередной попытке (раз в interval секунд). Лидер с той же
+    частотой проверяет свое соединение и при его потере сразу слагает
+    полномочия, потому что блокировку уже мог получить другой экземпляр.
+
+    on_elected/on_demoted - корутины, которые выполняются в event loop бота.
+    """
+
+    def __init__(self, db, lock_id: int, interval: float, on_elected, on_demoted):
+        self.db = db
+        self.lock_id = lock_id
+        self.interval = interval
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self._electing = False  # on_elected выполняется, но лидером еще не считаемся
+        self._conn = None
+        self._loop = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Запускает выборы в отдельном потоке; вызывать из event loop бота"""
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+        logger.info("✅ Leader election started (lock %s)", self.lock_id)
+
+    async def stop(self, step_down=None):
+        """Останавливает выборы и отпускает блокировку.
+
+        step_down - корутина, снимающая полномочия лидера. Она выполняется
+        до освобождения блокировки, чтобы следующий экземпляр не начал
+        работу лидера, пока этот еще не закончил свою.
+        """
+        self._stop.set()
+        if self._thread:
+            # Поток может ждать запуска работы лидера - даем ему закончить
+            await asyncio.to_thread(self._thread.join, CALL_TIMEOUT + self.interval + 15)
+        try:
+            # Если выборы еще идут, работа лидера могла уже запуститься
+            if (self.is_leader or self._electing) and step_down:
+                await step_down()
+        finally:
+            self.is_leader = False
+            self._close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                cursor = self._connection().cursor()
+                if self.is_leader:
+                    # Соединение живо - значит, блокировка все еще наша
+                    cursor.execute("SELECT 1")
+                else:
+                    cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.lock_id,))
+                    if cursor.fetchone()[0]:
+                        self._change_role(True)
+            except Exception as e:
+                logger.error("❌ Leader election error: %s", e)
+                self._close()
+                if self.is_leader:
+                    self._change_role(False)
+            self._stop.wait(self.interval)
+        if not self.is_leader:
+            self._close()
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self.db.get_connection()
+            self._conn.autocommit = True
+        return self._conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _change_role(self, is_leader):
+        if is_leader:
+            logger.info("👑 This instance is the leader now")
+            callback = self.on_elected
+        else:
+            logger.warning("⚠️ Leadership lost, stepping down")
+            self.is_leader = False
+            callback = self.on_demoted
+        if self._stop.is_set():
+            return
+        self._electing = is_leader
+        try:
+            # Ждем завершения, чтобы смены ролей не перекрывались
+            self._call(callback)
+        except Exception as e:
+            logger.error("❌ Error switching leader role: %s", e)
+            if is_leader:
+                self._abdicate()
+            return
+        else:
+            # Лидером считаемся только после того, как работа лидера запущена
+            self.is_leader = is_leader
+        finally:
+            self._electing = False
+
+    def _abdicate(self):
+        """Работа лидера не запустилась: останавливаем начатое и отпускаем блокировку.
+
+        Иначе экземпляр держал бы блокировку, ничего не делая, и другой не
+        смог бы ее получить. Следующая попытка - через interval секунд.
+        """
+        try:
+            self._call(self.on_demoted)
+        except Exception as e:
+            logger.error("❌ Error stopping leader duties: %s", e)
+        self._close()
+        logger.warning("⚠️ Leader duties failed to start, lock released")
+
+    def _call(self, callback, timeout=CALL_TIMEOUT):
+        future = asyncio.run_coroutine_threadsafe(callback(), self._loop)
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            # По таймауту корутина продолжила бы работать в loop
+            future.cancel()
+            raise
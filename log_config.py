@@ -0,0 +1,145 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE
+
+# Идентификаторы, которые прикрепляются ко всем записям лога в текущем контексте
+update_id_var = contextvars.ContextVar('update_id', default=None)
+payment_id_var = contextvars.ContextVar('payment_id', default=None)
+
+_CONTEXT_VARS = {'update_id': update_id_var, 'payment_id': payment_id_var}
+_listener = None
+
+
+@contextmanager
+def log_context(**ids):
+    """Задает идентификаторы для записей внутри блока.
+
+    Не переданные идентификаторы сбрасываются, чтобы они не перетекали
+    из предыдущего апдейта, обработанного в той же задаче.
+    """
+    tokens = [(var, var.set(ids.get(name))) for name, var in _CONTEXT_VARS.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def bind_log_context(**ids):
+    """Добавляет идентификаторы к текущему контексту (до выхода из log_context)"""
+    for name, value in ids.items():
+        _CONTEXT_VARS[name].set(value)
+
+
+class ContextFilter(logging.Filter):
+    """Копирует идентификаторы из contextvars в запись (в потоке, который пишет лог)"""
+
+    def filter(self, record):
+        for name, var in _CONTEXT_VARS.items():
+            setattr(record, name, var.get())
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только каждую N-ю запись одного события.
+
+    По умолчанию семплируются DEBUG-записи; для болтливых INFO-записей
+    частоту можно задать явно: logger.info(..., extra={'sample': 10}).
+    Событие определяется шаблоном сообщения, поэтому логировать нужно
+    с ленивым форматированием: logger.debug("User %s", user_id).
+    Счетчики сбрасываются раз в window секунд, чтобы не копить события.
+    """
+
+    def __init__(self, debug_rate=LOG_DEBUG_SAMPLE, window: float = 60.0):
+        super().__init__()
+        self.debug_rate = max(1, debug_rate)
+        self.window = window
+        self._counters = {}
+        self._window_started = time.monotonic()
+
+    def filter(self, record):
+        rate = getattr(record, 'sample', None)
+        if rate is None:
+            rate = self.debug_rate if record.levelno <= logging.DEBUG else 1
+        if rate <= 1:
+            return True
+        now = time.monotonic()
+        if now - self._window_started >= self.window:
+            self._counters = {}
+            self._window_started = now
+        key = (record.name, record.msg)
+        count = self._counters.get(key, 0)
+        self._counters[key] = count + 1
+        return count % rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for name in _CONTEXT_VARS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний текстовый формат с идентификаторами в конце строки"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        ids = ' '.join(
+            f"{name}={getattr(record, name)}" for name in _CONTEXT_VARS
+            if getattr(record, name, None) is not None
+        )
+        return f"{line} [{ids}]" if ids else line
+
+
+def setup_logging():
+    """Настраивает логирование: фильтры в вызывающем потоке, запись в stdout - в отдельном.
+
+    Хендлер корневого логгера только кладет запись в очередь, поэтому
+    медленный stdout не блокирует event loop и потоки Flask.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    # httpx пишет INFO на каждый запрос к Bot API
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import time
+
+from config import (
+    MAINTENANCE_INTERVAL, PROGRESS_ARCHIVE_AFTER_DAYS, PROGRESS_ARCHIVE_BATCH,
+    PAYMENT_PARTITIONS_AHEAD, PAYMENT_PENDING_RETENTION_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceRunner:
+    """Периодическое обслуживание БД на лидере.
+
+    Раз в interval секунд по очереди выполняет задачи из jobs в отдельном
+    потоке. Ошибка одной задачи не мешает остальным, а следующий проход
+    повторит ее.
+    """
+
+    def __init__(self, db, interval: int = MAINTENANCE_INTERVAL):
+        self.db = db
+        self.interval = interval
+        self.running = False
+        self._task = None
+        self.last_run_at = None
+        self.jobs = [
+            ('archive_course_progress',
+             lambda: db.archive_course_progress(PROGRESS_ARCHIVE_AFTER_DAYS, PROGRESS_ARCHIVE_BATCH)),
+            ('ensure_payment_partitions',
+             lambda: db.ensure_payment_partitions(PAYMENT_PARTITIONS_AHEAD)),
+            ('expire_pending_payments',
+             lambda: db.expire_pending_payments(PAYMENT_PENDING_RETENTION_DAYS)),
+        ]
+
+    def start(self):
+        """Запускает обслуживание в текущем event loop"""
+        self.running = True
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("✅ Database maintenance started")
+
+    async def stop(self):
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while self.running:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        """Один проход по всем задачам"""
+        for name, job in self.jobs:
+            started = time.monotonic()
+            try:
+                result = await asyncio.to_thread(job)
+                logger.info("🧹 %s: %s (%.1fs)", name, result, time.monotonic() - started)
+            except Exception as e:
+                logger.error("❌ Maintenance job %s failed: %s", name, e)
+        self.last_run_at = time.time()
@@ -0,0 +1,264 @@
+import functools
+import math
+import threading
+import time
+from contextlib import ContextDecorator
+
+from telegram.request import HTTPXRequest
+
+from health import health_monitor
+from log_config import log_context
+
+# Границы бакетов гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    """Базовый класс метрики с метками в формате Prometheus"""
+
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и уменьшаться"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Гистограмма длительностей с накопительными бакетами"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # key -> [bucket_counts, sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер / декоратор, замеряющий длительность блока"""
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        """Число наблюдений с заданными метками; без меток - по всем наборам меток"""
+        with self._lock:
+            if not labels:
+                return sum(state[2] for state in self._values.values())
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class _Timer(ContextDecorator):
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # Декорированная функция может выполняться в нескольких потоках сразу
+        return _Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self._start, **self.labels)
+        return False
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = []
+
+
+def render():
+    """Возвращает все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+UPDATE_DURATION = Histogram(
+    "bot_update_duration_seconds", "Time spent handling a Telegram update", ["handler"]
+)
+UPDATE_ERRORS = Counter(
+    "bot_update_errors_total", "Updates whose handler raised an exception", ["handler"]
+)
+TELEGRAM_API_DURATION = Histogram(
+    "telegram_api_duration_seconds", "Telegram Bot API call latency", ["method"]
+)
+TELEGRAM_API_REQUESTS = Counter(
+    "telegram_api_requests_total", "Telegram Bot API calls by HTTP status", ["method", "status"]
+)
+TELEGRAM_SEND_ERRORS = Counter(
+    "telegram_send_errors_total", "Failed message sends by error class", ["kind"]
+)
+TELEGRAM_API_RATE_LIMITED = Counter(
+    "telegram_api_rate_limited_total", "Telegram Bot API calls rejected with 429", ["method"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_method_duration_seconds", "DatabaseManager method latency", ["method"]
+)
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds", "SQL statement latency by fingerprint", ["statement"]
+)
+DB_STATEMENT_ROWS = Counter(
+    "db_statement_rows_total", "Rows returned or affected by SQL statements", ["statement"]
+)
+DB_SLOW_STATEMENTS = Counter(
+    "db_slow_statements_total", "SQL statements slower than SLOW_QUERY_MS", ["statement"]
+)
+SCHEDULER_TICK_DURATION = Histogram(
+    "scheduler_tick_duration_seconds", "Course scheduler tick duration"
+)
+SCHEDULER_DUE_USERS = Gauge(
+    "scheduler_due_users", "Users due for a course day in the last scheduler tick"
+)
+PAYMENT_PROVIDER_DURATION = Histogram(
+    "payment_provider_duration_seconds", "Payment provider API latency", ["provider", "operation"]
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Delay of the event loop heartbeat beyond its interval",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+EVENT_LOOP_STALLS = Counter(
+    "event_loop_stalls_total", "Event loop stalls longer than LOOP_STALL_THRESHOLD_MS"
+)
+STARTUP_STAGE_DURATION = Gauge(
+    "startup_stage_duration_seconds", "Duration of each startup stage", ["stage"]
+)
+WEBHOOK_DURATION = Histogram(
+    "webhook_duration_seconds", "Payment webhook processing time", ["provider"]
+)
+CIRCUIT_STATE = Gauge(
+    "circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ["name"]
+)
+CIRCUIT_REJECTED = Counter(
+    "circuit_rejected_total", "Calls rejected by an open circuit breaker", ["name"]
+)
+
+
+def timed_handler(name, callback):
+    """Оборачивает хендлер PTB, замеряя время обработки апдейта.
+
+    Все записи лога внутри хендлера получают update_id.
+    """
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        with log_context(update_id=getattr(update, 'update_id', None)):
+            try:
+                return await callback(update, context)
+            except Exception:
+                UPDATE_ERRORS.inc(handler=name)
+                raise
+            finally:
+                UPDATE_DURATION.observe(time.perf_counter() - start, handler=name)
+    return wrapper
+
+
+def timed_db(method):
+    """Декоратор для методов DatabaseManager"""
+    return DB_QUERY_DURATION.time(method=method.__name__)(method)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTP-клиент PTB, который замеряет вызовы Bot API и считает ответы 429"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        status = "error"
+        try:
+            status, payload = await super().do_request(url, method, *args, **kwargs)
+            if api_method == "getUpdates" and status == 200:
+                # Polling жив - для /health/ready
+                health_monitor.mark("telegram_poll")
+            return status, payload
+        finally:
+            TELEGRAM_API_DURATION.observe(time.perf_counter() - start, method=api_method)
+            TELEGRAM_API_REQUESTS.inc(method=api_method, status=status)
+            if status == 429:
+                TELEGRAM_API_RATE_LIMITED.inc(method=api_method)
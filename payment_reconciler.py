@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+
+from config import (
+    RECONCILE_INTERVAL,
+    RECONCILE_BATCH_SIZE,
+    RECONCILE_CONCURRENCY,
+    RECONCILE_MAX_AGE_HOURS,
+)
+from log_config import bind_log_context
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentReconciler:
+    """Фоновая сверка ожидающих платежей с ЮKassa и PayPal.
+
+    Периодически проходит по платежам со статусом pending порциями, опрашивает
+    платежные системы с ограниченной параллельностью и активирует курс для
+    оплаченных платежей. Для каждого платежа действует экспоненциальная
+    задержка между проверками, чтобы не опрашивать провайдеров впустую.
+    """
+
+    BASE_BACKOFF = 30       # первая повторная проверка через 30 секунд
+    MAX_BACKOFF = 30 * 60   # не реже чем раз в 30 минут
+
+    def __init__(self, application, db, payment_processor):
+        self.application = application
+        self.db = db
+        self.payment_processor = payment_processor
+        self.running = False
+        self._task = None
+        self._semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+        self._backoff = {}  # payment_id -> (attempts, next_check_at)
+        self.last_pass_at = None
+
+    def start(self):
+        """Запускает сверку в текущем event loop"""
+        self.running = True
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("✅ Payment reconciler started")
+
+    async def stop(self):
+        """Останавливает сверку"""
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        """Цикл сверки"""
+        while self.running:
+            try:
+                await self.reconcile_once()
+            except Exception as e:
+                logger.error(f"❌ Payment reconciler error: {e}")
+            await asyncio.sleep(RECONCILE_INTERVAL)
+
+    async def reconcile_once(self):
+        """Один проход по всем ожидающим платежам"""
+        seen = set()
+        after = None
+
+        while True:
+            batch = await asyncio.to_thread(
+                self.db.get_pending_payments, after, RECONCILE_BATCH_SIZE, RECONCILE_MAX_AGE_HOURS
+            )
+            if not batch:
+                break
+
+            now = time.monotonic()
+            due = []
+            for payment_id, user_id, payment_method, created_at in batch:
+                seen.add(payment_id)
+                if not self._is_provider_payment(payment_id, user_id):
+                    continue
+                _, next_check_at = self._backoff.get(payment_id, (0, 0))
+                if next_check_at <= now:
+                    due.append((payment_id, user_id, payment_method))
+
+            if due:
+                await asyncio.gather(*(self._check_payment(*payment) for payment in due))
+
+            last = batch[-1]
+            after = (last[3], last[0])
+            if len(batch) < RECONCILE_BATCH_SIZE:
+                break
+
+        # Забываем платежи, которые больше не ожидают оплаты
+        for payment_id in list(self._backoff):
+            if payment_id not in seen:
+                del self._backoff[payment_id]
+
+        self.last_pass_at = time.time()
+
+    @staticmethod
+    def _is_provider_payment(payment_id, user_id):
+        """Резервные платежи (ссылка вместо API) имеют наш ID вида <user_id>_<время>_<uuid>
+        и не известны платежной системе - опрашивать их бессмысленно"""
+        return not str(payment_id).startswith(f"{user_id}_")
+
+    async def _check_payment(self, payment_id, user_id, payment_method):
+        """Проверяет один платеж у платежной системы"""
+        # Каждая проверка - отдельная задача gather, контекст не перетекает
+        bind_log_context(payment_id=payment_id)
+        async with self._semaphore:
+            status = await asyncio.to_thread(
+                self.payment_processor.fetch_provider_status, payment_id, payment_method
+            )
+
+        if status in ("success", "failed", "canceled"):
+            self._backoff.pop(payment_id, None)
+            payer = await asyncio.to_thread(
+                self.payment_processor.complete_pending_payment, payment_id, status
+            )
+            if status == "success" and payer:
+                logger.info(f"✅ Reconciled payment {payment_id} for user {payer['user_id']}")
+                await self._activate(payer['user_id'], payment_id, payment_method)
+            return
+
+        # Платеж все еще ожидает оплаты (или провайдер не ответил) - откладываем
+        attempts, _ = self._backoff.get(payment_id, (0, 0))
+        delay = min(self.BASE_BACKOFF * (2 ** attempts), self.MAX_BACKOFF)
+        self._backoff[payment_id] = (attempts + 1, time.monotonic() + delay)
+
+    async def _activate(self, user_id, payment_id, payment_method):
+        """Активирует курс после подтвержденной оплаты"""
+        from handlers import activate_course_after_payment
+
+        try:
+            await activate_course_after_payment(user_id, payment_id, payment_method, self.application)
+        except Exception as e:
+            logger.error(f"❌ Error activating reconciled payment {payment_id}: {e}")
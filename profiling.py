@@ -0,0 +1,219 @@
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+from config import LOOP_WATCHDOG_INTERVAL, LOOP_STALL_THRESHOLD_MS
+from metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длительность профилирования по команде администратора
+MAX_PROFILE_SECONDS = 300
+
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер всех потоков процесса.
+
+    Фоновый поток раз в interval секунд снимает стеки всех остальных
+    потоков через sys._current_frames() и считает одинаковые стеки.
+    Результат - файл в формате "folded stacks" (стек через ';' и число
+    сэмплов), который понимают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._stacks = {}
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float, interval: float = 0.01):
+        """Запускает профилирование на duration секунд. False - если уже запущено"""
+        if self.running:
+            return False
+        self._stop.clear()
+        self._done.clear()
+        self._stacks = {}
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run, args=(min(duration, MAX_PROFILE_SECONDS), interval),
+            name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Останавливает профилирование досрочно"""
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        """Ждет окончания профилирования (вызывать не из event loop)"""
+        return self._done.wait(timeout)
+
+    def folded(self):
+        """Результат в формате folded stacks"""
+        lines = [f"{stack} {count}" for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1])]
+        return "\n".join(lines) + "\n"
+
+    def _run(self, duration, interval):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + duration
+        try:
+            while time.monotonic() < deadline and not self._stop.is_set():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = _fold(frame, names.get(ident, str(ident)))
+                    self._stacks[stack] = self._stacks.get(stack, 0) + 1
+                self.samples += 1
+                time.sleep(interval)
+        except Exception as e:
+            logger.error(f"❌ Profiler error: {e}")
+        finally:
+            self.duration = time.monotonic() - self.started_at
+            self._done.set()
+
+
+def _fold(frame, thread_name):
+    """Стек от корня к листу: thread;module:function:line;..."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        frames.append(f"{module}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    frames.append(thread_name.replace(" ", "_"))
+    return ";".join(reversed(frames))
+
+
+# Время создания задач: asyncio его не хранит, поэтому LoopWatchdog.start
+# ставит фабрику задач, которая его записывает
+_created_at = weakref.WeakKeyDictionary()
+# Для задач, созданных до установки фабрики, - когда задача впервые попала в дамп
+_first_seen = weakref.WeakKeyDictionary()
+
+
+def install_task_factory(loop):
+    """Ставит в loop фабрику задач, запоминающую время их создания"""
+    previous = loop.get_task_factory()
+
+    def factory(loop, coro, **kwargs):
+        if previous is not None:
+            task = previous(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        _created_at[task] = time.monotonic()
+        return task
+
+    loop.set_task_factory(factory)
+
+
+def task_dump(stack_limit: int = 8):
+    """Текстовый дамп задач asyncio, самые долгоживущие первыми (вызывать из event loop)"""
+    now = time.monotonic()
+    tasks = []
+    for task in asyncio.all_tasks():
+        created_at = _created_at.get(task)
+        if created_at is not None:
+            tasks.append((now - created_at, " ", task))
+        else:
+            tasks.append((now - _first_seen.setdefault(task, now), ">", task))
+    tasks.sort(key=lambda item: -item[0])
+
+    out = io.StringIO()
+    out.write(f"{len(tasks)} asyncio tasks at {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+    out.write("age = time since the task was created (>: created before the watchdog, age since first dump)\n\n")
+    for age, mark, task in tasks:
+        coro = task.get_coro()
+        out.write(f"[{mark}{age:8.1f}s] {task.get_name()}: {getattr(coro, '__qualname__', coro)}\n")
+        for frame in task.get_stack(limit=stack_limit):
+            code = frame.f_code
+            out.write(f"      {os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}\n")
+    return out.getvalue()
+
+
+class LoopWatchdog:
+    """Детектор блокировок event loop.
+
+    Корутина-heartbeat в loop раз в interval секунд отмечает время и
+    записывает в метрику, насколько позже положенного она проснулась.
+    Отдельный поток следит за heartbeat: если loop не отвечает дольше
+    порога, он снимает стек потока loop и пишет его в лог - это и есть
+    блокирующий вызов. О каждой блокировке сообщается один раз.
+    """
+
+    def __init__(self, interval: float = LOOP_WATCHDOG_INTERVAL,
+                 threshold_ms: int = LOOP_STALL_THRESHOLD_MS):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+        self.last_beat = None
+        self.max_lag = 0.0
+        self._loop_ident = None
+        self._task = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Запускает heartbeat в текущем event loop и поток наблюдения (и учет времени создания задач)"""
+        self._loop_ident = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._stop.clear()
+        loop = asyncio.get_running_loop()
+        install_task_factory(loop)
+        self._task = loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        logger.info("✅ Event loop watchdog started")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - before - self.interval)
+            self.last_beat = now
+            self.max_lag = max(self.max_lag, lag)
+            EVENT_LOOP_LAG.observe(lag)
+
+    def _watch(self):
+        stalled_since = None
+        while not self._stop.wait(self.interval):
+            silence = time.monotonic() - self.last_beat
+            if silence <= self.interval + self.threshold:
+                if stalled_since is not None:
+                    logger.warning("🐌 Event loop recovered after %.2fs stall", time.monotonic() - stalled_since)
+                    stalled_since = None
+                continue
+            if stalled_since is not None:
+                continue
+
+            stalled_since = self.last_beat + self.interval
+            EVENT_LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self._loop_ident)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+            logger.warning("🐌 Event loop blocked for %.2fs, loop thread stack:\n%s", silence - self.interval, stack)
+
+
+profiler = SamplingProfiler()
+loop_watchdog = LoopWatchdog()